@@ -0,0 +1,27 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Les modules du dossier RAG s'importent entre eux par leur nom court (ex: `from utils import ...`),
+# comme lorsqu'on lance `python RAG/main.py` : on ajoute donc ce dossier au sys.path.
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if RAG_DIR not in sys.path:
+    sys.path.insert(0, RAG_DIR)
+
+
+class FakeLLM:
+    """Client LLM factice : enregistre les prompts reçus et numérote ses réponses."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(text=f"réponse {len(self.prompts)}")
+
+
+@pytest.fixture
+def fake_llm():
+    return FakeLLM()
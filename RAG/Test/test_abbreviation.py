@@ -0,0 +1,24 @@
+from langchain_core.documents import Document
+
+from RAG.abbreviation import AbbreviationExpander
+from RAG.utils import enrich_chunks_with_abbreviations
+
+
+def test_expander_matches_whole_words_only_once_per_text():
+    expander = AbbreviationExpander({"CO": "monoxyde de carbone", "PAC": "politique agricole commune", "UE": None})
+    text, expanded = expander.expand("Le CO2 et le PACTE ; la PAC puis la PAC ; le CO.")
+    assert text == "Le CO2 et le PACTE ; la PAC (politique agricole commune) puis la PAC ; le CO (monoxyde de carbone)."
+    assert expanded == ["PAC", "CO"]
+
+
+def test_expander_prefers_longest_abbreviation_and_skips_known_definitions():
+    expander = AbbreviationExpander({"GES": "gaz à effet de serre", "GES-UE": "GES de l'Union"})
+    assert expander.expand("Les GES-UE baissent.")[0] == "Les GES-UE (GES de l'Union) baissent."
+    assert expander.expand("Les gaz à effet de serre (GES).")[1] == []
+
+
+def test_enrich_chunks_keeps_metadata():
+    chunks = [Document(page_content="La SNBC fixe le cap.", metadata={"page": 3})]
+    enriched = enrich_chunks_with_abbreviations(chunks, {"SNBC": "stratégie nationale bas-carbone"})
+    assert enriched[0].page_content == "La SNBC (stratégie nationale bas-carbone) fixe le cap."
+    assert enriched[0].metadata == {"page": 3}
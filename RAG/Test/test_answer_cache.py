@@ -0,0 +1,99 @@
+import os
+import re
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from RAG.answer_cache import AnswerCache
+from RAG.engine import RagEngine
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """Embeddings factices : sac de mots haché, deux reformulations proches ont un cosinus élevé."""
+
+    def _embed(self, text):
+        vector = np.zeros(64, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _build_index(path, embeddings, texts):
+    FAISS.from_documents([Document(page_content=t, metadata={"page": i}) for i, t in enumerate(texts)],
+                         embeddings).save_local(path)
+
+
+def test_engine_serves_close_questions_from_cache_until_index_changes(tmp_path, fake_llm):
+    path = str(tmp_path / "faiss_index")
+    embeddings = BagOfWordsEmbeddings()
+    _build_index(path, embeddings, ["la neutralité carbone en 2050", "le budget carbone national"])
+    llm = fake_llm
+    cache = AnswerCache(path=str(tmp_path / "answers"), threshold=0.9)
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm, answer_cache=cache)
+
+    first = engine.ask("Quel est l'objectif de neutralité carbone ?", k=1, mode="dense")
+    # Même question reformulée (ponctuation, casse) : servie par le cache
+    assert engine.ask("quel est l'objectif de neutralité carbone", k=1, mode="dense") == first
+    # Paramètres de recherche différents ou autre question : nouvel appel
+    engine.ask("Quel est l'objectif de neutralité carbone ?", k=2, mode="dense")
+    engine.ask("Que contient le budget carbone ?", k=1, mode="dense")
+    assert len(llm.prompts) == 3
+    assert cache.hits == 1 and cache.misses == 3
+    assert "1/4 hit(s)" in cache.stats()
+    entry = next(iter(cache.entries.values()))
+    assert entry["chunk_ids"] and entry["answer"] == first
+
+    # Une ingestion réécrit l'index : les réponses en cache sont périmées
+    time.sleep(0.01)
+    _build_index(path, embeddings, ["la neutralité carbone en 2050", "le budget carbone national", "les puits"])
+    engine.ask("Quel est l'objectif de neutralité carbone ?", k=1, mode="dense")
+    assert len(llm.prompts) == 4
+
+
+def test_answer_cache_lru_ttl_and_persistence(tmp_path):
+    now = [1000.0]
+    path = str(tmp_path / "answers")
+    cache = AnswerCache(path=path, threshold=0.99, max_entries=2, ttl=60, clock=lambda: now[0])
+    a, b, c = np.eye(3, dtype=np.float32)
+    cache.put("a", a, "p", ["x"], "A", 1.0, "v1")
+    now[0] += 1
+    cache.put("b", b, "p", ["y"], "B", 1.0, "v1")
+    now[0] += 1
+    assert cache.lookup(a, "p", "v1")["answer"] == "A"  # « a » devient le plus récemment utilisé
+    cache.put("c", c, "p", ["z"], "C", 1.0, "v1")  # évince « b »
+    assert cache.lookup(b, "p", "v1") is None
+    assert not os.path.exists(os.path.join(path, "entries.json"))  # rien d'écrit avant la fermeture
+    cache.close()
+
+    reloaded = AnswerCache(path=path, threshold=0.99, ttl=60, clock=lambda: now[0])
+    assert reloaded.lookup(c, "p", "v1")["answer"] == "C"
+    now[0] += 120  # expiration
+    assert reloaded.lookup(c, "p", "v1") is None
+    assert cache.lookup(a, "p", "v2") is None and not cache.entries  # autre version d'index
+
+
+def test_cache_de_reponses_construit_seulement_pour_des_questions(monkeypatch):
+    import engine
+    import main
+    built = []
+    monkeypatch.setattr(engine, "AnswerCache", lambda **kw: built.append(kw) or SimpleNamespace(**kw))
+    monkeypatch.setattr(engine, "_default_engine", None)
+    main.main()  # aucune action : ni moteur ni cache
+    assert built == [] and engine._default_engine is None
+
+    assert engine.get_engine(None).answer_cache is None  # --no-answer-cache : le cache n'est pas construit
+    assert built == []
+    monkeypatch.setattr(engine, "_default_engine", None)
+    assert engine.get_engine(0.8).answer_cache.threshold == 0.8
+    assert built == [{"threshold": 0.8}]
@@ -0,0 +1,43 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from RAG.engine import RagEngine
+
+TEXTS = {
+    "a:0": "La stratégie nationale bas-carbone fixe les budgets carbone.",
+    "a:1": "La SNBC prévoit une baisse de 74 % des émissions des transports.",
+    "a:2": "L'article L. 100-4 du code de l'énergie définit la neutralité carbone.",
+    "b:0": "Les émissions de l'agriculture restent stables.",
+}
+
+
+def test_index_incremental_et_persistant(tmp_path):
+    index = BM25Index()
+    index.add(list(TEXTS), TEXTS.values())
+    assert tokenize("Émissions : 74 % (SNBC)") == ["emissions", "74", "%", "snbc"]
+    assert index.search("SNBC", 2)[0][0] == "a:1"
+    assert index.search("74 %", 1)[0][0] == "a:1"
+
+    index.remove(["a:1"])
+    index.save(str(tmp_path))
+    reloaded = BM25Index.load(str(tmp_path))
+    assert reloaded.search("SNBC", 2) == [] and len(reloaded) == 3
+    assert reloaded.search("article 100-4", 1)[0][0] == "a:2"
+    assert reloaded.search("émissions", 3) == index.search("émissions", 3)
+
+
+def test_fusion_rrf_et_modes_du_moteur(tmp_path):
+    assert reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]], 2) == ["y", "x"]
+
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    db = FAISS.from_texts(list(TEXTS.values()), embeddings, ids=list(TEXTS))
+    db.save_local(path)  # index sans bm25.json : reconstruit depuis le docstore au chargement
+    engine = RagEngine(cache_path=path, embeddings=embeddings)
+
+    sparse = engine.search_many(["Que prévoit la SNBC ?"], k=1, mode="sparse")[0]
+    assert [d.page_content for d in sparse] == [TEXTS["a:1"]]
+    hybrid = engine.search_many(["Que prévoit la SNBC ?"], k=2, mode="hybrid")[0]
+    assert TEXTS["a:1"] in [d.page_content for d in hybrid]
+    assert len(engine.search_many(["SNBC"], k=3, mode="dense")[0]) == 3
@@ -0,0 +1,67 @@
+import os
+
+import fitz
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import RAG.utils as utils
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+from RAG.index_store import load_vectorstore
+from RAG.shards import ShardRegistry
+
+
+def _make_pdf(path, lines):
+    doc = fitz.open()
+    for line in lines:
+        doc.new_page().insert_text((72, 72), line)
+    doc.save(str(path))
+    doc.close()
+
+
+def test_ingestion_groupee_un_shard_par_document(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # les images de figures sont écrites sous ./RAG/Dataset
+    index_path = str(tmp_path / "faiss_index")
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), EmbeddingCache("fake", str(tmp_path / "emb")))
+    monkeypatch.setattr(utils, "FAISS_CACHE_PATH", index_path)
+    monkeypatch.setattr(utils, "pipeline_abreviations", lambda path, abrev_phrases=None: {"GES": "gaz à effet de serre"})
+    monkeypatch.setattr(utils, "analyze_saved_pages_with_gemini", lambda *a, **kw: [])
+    monkeypatch.setattr(utils, "load_figure_analyses", lambda *a, **kw: [])
+    monkeypatch.setattr(utils, "create_embeddings", lambda *a, **kw: embeddings)
+    io_calls = []
+    load, save = utils.load_vectorstore, utils.save_vectorstore
+    monkeypatch.setattr(utils, "load_vectorstore", lambda *a, **kw: io_calls.append("load") or load(*a, **kw))
+    monkeypatch.setattr(utils, "save_vectorstore", lambda *a, **kw: io_calls.append("save") or save(*a, **kw))
+
+    _make_pdf(tmp_path / "a.pdf", ["Les GES baissent.", "Page A2."])
+    _make_pdf(tmp_path / "b.pdf", ["Page B1."])
+    added = utils.pipeline_add_documents([str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf")], workers=2)
+
+    assert added == 3 and io_calls == ["save", "save"]  # une sauvegarde par shard, aucun chargement
+    registry = ShardRegistry(index_path)
+    assert {entry["embeddings"] for entry in registry.shards.values()} == {"fake"}  # cache_key du modèle
+    contents = []
+    for name in registry.shards:
+        db = load_vectorstore(registry.shard_path(name), embeddings)
+        contents += [db.docstore.search(i).page_content for i in db.index_to_docstore_id.values()]
+    assert sorted(contents) == ["Les GES (gaz à effet de serre) baissent.", "Page A2.", "Page B1."]
+
+    # Un document inchangé est ignoré, un nouveau est ajouté dans son shard sans relire les autres
+    io_calls.clear()
+    _make_pdf(tmp_path / "c.pdf", ["Page C1."])
+    assert utils.pipeline_add_documents([str(tmp_path / "a.pdf"), str(tmp_path / "c.pdf")], workers=2) == 1
+    assert io_calls == ["save"]
+    registry = ShardRegistry(index_path)
+    assert len(registry.shards) == 3
+    assert all(registry.shards[registry.shard_of(k)]["documents"][k]["complete"] for k in ("a.pdf", "b.pdf", "c.pdf"))
+
+
+def test_fichiers_de_meme_nom_refuses_avant_extraction(monkeypatch, tmp_path):
+    monkeypatch.setattr(utils, "FAISS_CACHE_PATH", str(tmp_path / "faiss_index"))
+    monkeypatch.setattr(utils, "_prepare_for_bulk", lambda *a: pytest.fail("extraction lancée"))
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        _make_pdf(tmp_path / folder / "rapport.pdf", [f"Page {folder}."])
+
+    with pytest.raises(ValueError, match="rapport.pdf"):
+        utils.pipeline_add_documents([str(tmp_path / "a" / "rapport.pdf"), str(tmp_path / "b" / "rapport.pdf")])
+    assert not os.path.exists(tmp_path / "faiss_index")
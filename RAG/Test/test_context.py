@@ -0,0 +1,42 @@
+import logging
+
+from langchain_core.documents import Document
+
+from RAG.context import pack_context
+from RAG.llm_client import estimate_tokens
+from RAG.utils import split_docs
+
+PAGE = " ".join(f"Phrase {i} sur les émissions du secteur {i % 7} et la trajectoire de la SNBC." for i in range(40))
+
+
+def test_chunks_voisins_recolles_et_doublons_ecartes(caplog):
+    chunks = split_docs([Document(page_content=PAGE, metadata={"document": "a.pdf", "page": 4})])
+    assert len(chunks) > 3
+    figure = Document(page_content="Titre: Émissions par secteur", metadata={"source": "figure_analysis", "source_page": 2})
+    duplicate = Document(page_content=chunks[1].page_content, metadata={"document": "b.pdf", "page": 9})
+    retrieved = [chunks[2], duplicate, chunks[0], figure, chunks[1], chunks[3]]
+
+    with caplog.at_level(logging.INFO):
+        packed = pack_context(retrieved, token_budget=None)
+
+    texts = [d.page_content for d in packed]
+    # chunks 0 à 3 recollés en un seul passage, sans répéter le recouvrement ; doublon de b.pdf écarté
+    merged = [t for t in texts if t.startswith("Phrase 0 ")]
+    assert len(merged) == 1 and merged[0].count("Phrase 5 ") == 1
+    assert all(c.page_content in merged[0] for c in chunks[:4])
+    assert not any(d.metadata.get("document") == "b.pdf" for d in packed)
+    assert "Contexte :" in caplog.text
+    assert estimate_tokens("\n".join(texts)) < estimate_tokens("\n".join(d.page_content for d in retrieved))
+
+
+def test_budget_par_pertinence_puis_ordre_des_sources():
+    docs = [Document(page_content=f"Passage {name} " + "contenu distinct numéro %s " % name * 20,
+                     metadata={"document": doc, "page": page})
+            for name, doc, page in [("c", "b.pdf", 1), ("a", "a.pdf", 7), ("b", "a.pdf", 2), ("d", "a.pdf", 1)]]
+    budget = 2 * estimate_tokens(docs[0].page_content) + 5
+    packed = pack_context(docs, token_budget=budget)
+    # Les deux plus pertinents tiennent dans le budget, présentés dans l'ordre (document, page)
+    assert [d.page_content.split()[1] for d in packed] == ["a", "c"]
+
+    tiny = pack_context(docs, token_budget=10)
+    assert len(tiny) == 1 and len(tiny[0].page_content) <= 40
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from RAG.embedding_backends import EmbeddingOptions, EncoderBackend, cosine_deviation, create_backend, embed_queries
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class RecordingBackend(EncoderBackend):
+    name = "fake"
+
+    def __init__(self, model_name, options=None):
+        super().__init__(model_name, options)
+        self.encoded = []
+
+    def _encode(self, texts):
+        self.encoded.extend(texts)
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_e5_prefixes_for_passages_and_queries(tmp_path):
+    backend = RecordingBackend("intfloat/multilingual-e5-base")
+    cached = CachedEmbeddings(backend, EmbeddingCache(backend.cache_key, str(tmp_path)))
+    cached.embed_documents(["chunk"])
+    embed_queries(cached, ["question ?"])
+    cached.embed_query("autre ?")
+    assert backend.encoded == ["passage: chunk", "query: question ?", "query: autre ?"]
+    assert backend.cache_key == "intfloat/multilingual-e5-base@fake+e5"
+
+    plain = RecordingBackend("sentence-transformers/all-MiniLM-L6-v2")
+    legacy = RecordingBackend("intfloat/multilingual-e5-base", EmbeddingOptions(e5_prefixes=False))
+    for b in (plain, legacy):
+        b.embed_documents(["chunk"])
+        b.embed_query("question ?")
+        assert b.encoded == ["chunk", "question ?"]
+
+
+def test_cosine_deviation_and_unknown_backend():
+    reference = np.array([[1.0, 0.0], [0.0, 2.0]])
+    report = cosine_deviation(reference, np.array([[2.0, 0.0], [1.0, 1.0]]))
+    assert report["min_cosine"] == pytest.approx(np.sqrt(0.5))
+    assert report["max_deviation"] == pytest.approx(1 - np.sqrt(0.5))
+    assert report["mean_deviation"] == pytest.approx((1 - np.sqrt(0.5)) / 2)
+    with pytest.raises(ValueError):
+        create_backend("modele", EmbeddingOptions(backend="gpu"))
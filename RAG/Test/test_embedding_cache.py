@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    encoded: list = []
+
+    def embed_documents(self, texts):
+        self.encoded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def test_only_misses_are_encoded_and_cache_persists(tmp_path):
+    model = CountingEmbeddings(size=8, encoded=[])
+    cached = CachedEmbeddings(model, EmbeddingCache("fake-model", str(tmp_path)))
+
+    first = cached.embed_documents(["chunk A", "chunk B", "chunk A"])
+    assert model.encoded == ["chunk A", "chunk B"]
+    assert cached.cache.misses == 3 and cached.cache.hits == 0
+    cached.cache.save()
+
+    # Nouvelle instance (nouveau processus) : seul le texte modifié est ré-encodé,
+    # les différences d'espaces ne comptent pas
+    model.encoded.clear()
+    reopened = CachedEmbeddings(model, EmbeddingCache("fake-model", str(tmp_path)))
+    second = reopened.embed_documents(["chunk  A", "chunk B", "chunk C"])
+    assert model.encoded == ["chunk C"]
+    assert reopened.cache.hits == 2 and reopened.cache.misses == 1
+    np.testing.assert_allclose(second[0], first[0], rtol=1e-6)
+    np.testing.assert_allclose(second[1], first[1], rtol=1e-6)
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    EmbeddingCache("model-a", str(tmp_path)).put_many(["texte"], [[1.0, 2.0]])
+    assert EmbeddingCache("model-b", str(tmp_path)).get_many(["texte"]) == [None]
+
+
+def test_size_bound_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache("fake-model", str(tmp_path), max_entries=3)
+    cache.put_many(["a", "b", "c"], np.eye(3))
+    cache.get_many(["a"])  # "a" devient le plus récent
+    cache.put_many(["d"], [[0.0, 0.0, 5.0]])
+
+    assert len(cache.entries) == 3 and cache.evictions == 1
+    a, b, d = cache.get_many(["a", "b", "d"])
+    assert b is None
+    np.testing.assert_array_equal(a, [1.0, 0.0, 0.0])
+    np.testing.assert_array_equal(d, [0.0, 0.0, 5.0])
+    cache.save()
+    assert os.path.getsize(cache.vectors_path) == 3 * 3 * 4
@@ -0,0 +1,133 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def _build_index(path, embeddings, texts):
+    db = FAISS.from_documents([Document(page_content=t, metadata={"page": i}) for i, t in enumerate(texts)], embeddings)
+    db.save_local(path)
+
+
+def test_engine_loads_index_once_and_reloads_on_change(tmp_path, monkeypatch, fake_llm):
+    path = str(tmp_path / "faiss_index")
+    embeddings = CountingEmbeddings(size=16)
+    _build_index(path, embeddings, ["émissions de GES", "neutralité carbone"])
+
+    loads = []
+    original = FAISS.load_local
+    monkeypatch.setattr(FAISS, "load_local", lambda *a, **kw: loads.append(1) or original(*a, **kw))
+
+    llm = fake_llm
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+    assert engine.ask("Question 1 ?", k=1) == "réponse 1"
+    assert engine.ask("Question 2 ?", k=1) == "réponse 2"
+    assert len(loads) == 1
+
+    # Une réécriture de l'index sur disque déclenche un seul rechargement
+    time.sleep(0.01)
+    _build_index(path, embeddings, ["émissions de GES", "neutralité carbone", "budget carbone"])
+    engine.ask("Question 3 ?", k=3)
+    engine.ask("Question 4 ?", k=3)
+    assert len(loads) == 2
+    assert "budget carbone" in llm.prompts[-1]
+
+
+def test_engine_without_index_raises(tmp_path, fake_llm):
+    engine = RagEngine(cache_path=str(tmp_path / "absent"), embeddings=DeterministicFakeEmbedding(size=8), llm=fake_llm)
+    with pytest.raises(ValueError, match="n'existe pas"):
+        engine.ask("Question ?")
+
+
+class SlowConcurrentLLM:
+    """Client LLM factice thread-safe qui mesure le nombre d'appels simultanés."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        question = prompt.split("Question: ", 1)[1].split("\n", 1)[0]
+        return SimpleNamespace(text=f"réponse à {question}")
+
+
+class BatchCountingEmbeddings(DeterministicFakeEmbedding):
+    batches: list = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def test_ask_many_batches_retrieval_and_keeps_order(tmp_path):
+    path = str(tmp_path / "faiss_index")
+    embeddings = BatchCountingEmbeddings(size=16, batches=[])
+    texts = [f"chunk numéro {i}" for i in range(10)]
+    _build_index(path, embeddings, texts)
+    embeddings.batches.clear()
+
+    llm = SlowConcurrentLLM()
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+    questions = [f"Q{i} ?" for i in range(8)]
+    answers = engine.ask_many(questions, k=3, max_concurrency=3)
+
+    assert answers == [f"réponse à {q}" for q in questions]
+    assert embeddings.batches == [len(questions)]  # un seul passage d'encodage
+    assert 1 < llm.max_active <= 3
+
+
+def test_search_many_matches_single_question_retriever(tmp_path, fake_llm):
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    _build_index(path, embeddings, [f"chunk numéro {i}" for i in range(10)])
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=fake_llm)
+
+    questions = ["chunk numéro 3", "autre question", "chunk numéro 7"]
+    batched = engine.search_many(questions, k=4, mode="dense")
+    for q, docs in zip(questions, batched):
+        expected = engine.retriever(4).invoke(q)
+        assert [d.page_content for d in docs] == [d.page_content for d in expected]
+
+
+def test_ask_stream_yields_chunks_and_measures_ttft(tmp_path):
+    from RAG.llm_client import FakeBackend, LLMClient
+
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    _build_index(path, embeddings, ["émissions de GES", "neutralité carbone"])
+    backend = FakeBackend(lambda prompt: "une réponse produite en flux", latency=0.02, token_latency=0.02)
+    llm = LLMClient(backend, requests_per_minute=None, tokens_per_minute=None)
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+
+    timing = {}
+    stream = engine.ask_stream("Question ?", k=1, mode="dense", timing=timing)
+    first = next(stream)
+    assert first == "une " and timing["ttft_s"] is not None and timing["total_s"] is None
+    rest = list(stream)
+    assert first + "".join(rest) == "une réponse produite en flux"
+    assert timing["chunks"] == 5
+    assert timing["ttft_s"] < timing["total_s"]
+    assert timing["total_s"] - timing["ttft_s"] >= 4 * 0.02 * 0.9
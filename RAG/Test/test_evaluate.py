@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+from RAG.evaluate import (EVAL_FILE, EvalItem, evaluate_generation, evaluate_retrieval, load_eval_set,
+                          parse_target, retrieval_metrics)
+
+
+def test_parse_targets_of_the_eval_csv():
+    assert parse_target("39") == ("page", 39)
+    assert parse_target("Figure 1.2b") == ("figure", "1.2b")
+    assert parse_target("") is None
+    items = load_eval_set(EVAL_FILE)
+    assert len(items) == 8 and all(item.target is not None for item in items)
+
+
+def test_retrieval_metrics():
+    metrics = retrieval_metrics([1, 3, None, 2], ks=(1, 3))
+    assert metrics["recall@1"] == 0.25 and metrics["recall@3"] == 0.75
+    assert metrics["mrr"] == pytest.approx((1 + 1 / 3 + 1 / 2) / 4)
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return SimpleNamespace(text="réponse")
+
+
+def test_evaluate_retrieval_in_one_batch_without_llm(tmp_path):
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    docs = [
+        Document(page_content="Les émissions de méthane baissent.", metadata={"page": 4}),
+        Document(page_content="Le budget carbone est dépassé.", metadata={"page": 9}),
+        Document(page_content="Titre: Figure 1.2b émissions par secteur", metadata={"source": "figure_analysis",
+                                                                                    "source_page": 30}),
+    ]
+    FAISS.from_documents(docs, embeddings).save_local(path)
+    llm = CountingLLM()
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+    items = [
+        EvalItem("méthane émissions", "", ("page", 5)),
+        EvalItem("budget carbone", "", ("page", 10)),
+        EvalItem("secteur figure", "", ("figure", "1.2b")),
+        EvalItem("vélo", "", ("page", 99)),
+    ]
+
+    result = evaluate_retrieval(engine, items, ks=(1, 3), mode="sparse")
+    assert [row["first_relevant_rank"] for row in result["per_question"]] == [1, 1, 1, None]
+    assert result["metrics"]["recall@1"] == 0.75 and result["metrics"]["mrr"] == 0.75
+    assert llm.calls == 0
+
+    generation = evaluate_generation(engine, [EvalItem("budget carbone", "réponse", ("page", 10))], k=1,
+                                     mode="sparse")
+    assert llm.calls == 1
+    assert generation["per_question"][0]["similarity"] == pytest.approx(1.0)
@@ -0,0 +1,90 @@
+import json
+
+import fitz
+import pytest
+
+import figures
+from figures import RenderOptions, save_identified_pages
+from llm_client import FakeBackend, LLMClient
+from pdf_pages import PARALLEL_MIN_PAGES, iter_pdf_pages
+
+
+def _make_pdf(path, n_pages):
+    """PDF synthétique : une page sur 5 a un graphique (25 segments) légendé « Figure », une sur 5 des tracés sans légende."""
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        if i % 5 == 0:
+            page.insert_text((72, 72), f"Figure {i} : évolution des émissions")
+        else:
+            page.insert_text((72, 72), f"Texte de la page {i}")
+        if i % 5 in (0, 1):
+            for j in range(25):
+                page.draw_line((200, 300 + 4 * j), (300, 300 + 4 * j))
+    doc.save(str(path))
+    doc.close()
+
+
+def test_detection_parallele_identique_et_filtre_mot_cle_en_premier(tmp_path):
+    pdf = tmp_path / "rapport.pdf"
+    _make_pdf(pdf, PARALLEL_MIN_PAGES + 8)
+
+    serial = list(iter_pdf_pages(str(pdf), 15, workers=1))
+    parallel = list(iter_pdf_pages(str(pdf), 15, workers=2))
+
+    assert [p.number for p in parallel] == [p.number for p in serial]
+    assert [p.is_figure_candidate for p in parallel] == [p.is_figure_candidate for p in serial]
+    assert [p.number for p in serial if p.is_figure_candidate] == list(range(1, len(serial) + 1, 5))
+    # Les tracés ne sont comptés que sur les pages qui contiennent le mot-clé
+    assert serial[1].drawing_count is None and serial[0].drawing_count == 25
+    assert all(p.handle is None for p in parallel)
+
+
+def test_rendu_decoupe_plafonne_et_rapport(tmp_path):
+    pdf = tmp_path / "rapport.pdf"
+    _make_pdf(pdf, 6)
+
+    full = save_identified_pages(str(pdf), str(tmp_path / "full"), 15, workers=1)
+    clipped = save_identified_pages(
+        str(pdf), str(tmp_path / "clip"), 15, workers=1,
+        render_options=RenderOptions(clip_to_drawings=True, max_pixels=40_000, image_format="jpeg"),
+    )
+
+    assert full.saved_pages == clipped.saved_pages == [1, 6]
+    assert full.pages == 6 and full.bytes_written > clipped.bytes_written > 0
+    image = fitz.Pixmap(str(tmp_path / "clip" / "page_1.jpg"))
+    assert image.width * image.height <= 40_000
+    assert not list((tmp_path / "clip").glob("*.png"))
+    assert "pages/s" in clipped.summary()
+
+    with pytest.raises(ValueError):
+        RenderOptions(image_format="tiff")
+
+
+def test_analyses_de_figures_en_cache_par_contenu(tmp_path, monkeypatch):
+    backend = FakeBackend(lambda contents: '[{"titre": "Émissions", "resume": "En baisse"}]')
+    monkeypatch.setattr(figures, "get_gemini_client",
+                        lambda model: LLMClient(backend, requests_per_minute=None, tokens_per_minute=None))
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    cache_path = str(tmp_path / "cache.json")
+
+    doc_a = tmp_path / "a.pdf"
+    doc_a.mkdir()
+    (doc_a / "page_3.png").write_bytes(b"image-1")
+    (doc_a / "page_7.jpg").write_bytes(b"image-2")
+    first = figures.analyze_saved_pages_with_gemini(str(doc_a), cache=figures.FigureAnalysisCache(cache_path))
+    assert backend.calls == 2 and [r["source_page"] for r in first] == [3, 7]
+
+    # Même document ré-ingéré, puis un autre document qui partage une page : aucun appel
+    cache = figures.FigureAnalysisCache(cache_path)
+    assert figures.analyze_saved_pages_with_gemini(str(doc_a), cache=cache) == first
+    doc_b = tmp_path / "b.pdf"
+    doc_b.mkdir()
+    (doc_b / "page_1.png").write_bytes(b"image-1")
+    second = figures.analyze_saved_pages_with_gemini(str(doc_b), cache=cache)
+    assert backend.calls == 2 and cache.hits == 3 and cache.misses == 0
+
+    # Un résumé par document
+    summary_b = json.loads((doc_b / figures.FIGURE_SUMMARY_FILENAME).read_text(encoding="utf-8"))
+    assert summary_b == second and [r["source_page"] for r in summary_b] == [1]
+    assert len(figures.load_figure_analyses(str(doc_a / figures.FIGURE_SUMMARY_FILENAME))) == 2
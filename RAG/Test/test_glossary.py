@@ -0,0 +1,45 @@
+import RAG.abbreviation as abbreviation
+from RAG.glossary import GlossaryStore, extraire_definition_locale
+
+
+def test_local_extractor_resolves_regular_long_forms():
+    assert extraire_definition_locale("GES", "Les émissions de gaz à effet de serre (GES) baissent.") == "gaz à effet de serre"
+    assert extraire_definition_locale("UE", "Dans l’Union européenne (UE) en 2024.") == "Union européenne"
+    assert extraire_definition_locale("SNBC", "La stratégie nationale bas-carbone (SNBC).") == "stratégie nationale bas-carbone"
+    # Les lettres ne correspondent pas : laissé au LLM
+    assert extraire_definition_locale("CO2", "Le dioxyde de carbone (CO2) domine.") is None
+
+
+def test_store_reuses_definition_found_in_another_document(tmp_path):
+    store = GlossaryStore(str(tmp_path / "glossary.sqlite"))
+    store.save("CO2", "Le dioxyde de carbone (CO2) domine.", "dioxyde de carbone", "llm")
+    assert store.lookup("CO2", "Le dioxyde de carbone (CO2) domine.") == (True, "dioxyde de carbone")
+    assert store.lookup("CO2", "Autre rapport : du Dioxyde de Carbone (CO2).") == (True, "dioxyde de carbone")
+    assert store.lookup("CO2", "Les émissions de CO2 (CO2) hors UTCATF.") == (False, None)
+    store.close()
+
+
+def test_pipeline_only_sends_unresolved_items_to_the_llm(tmp_path, monkeypatch):
+    sent = []
+
+    def fake_batches(abrev_phrases, model, **kwargs):
+        sent.extend(abbr for abbr, _ in abrev_phrases)
+        return {abbr: "dioxyde de carbone" if abbr == "CO2" else None for abbr, _ in abrev_phrases}
+
+    monkeypatch.setattr(abbreviation, "traiter_en_lots_json", fake_batches)
+    monkeypatch.setattr(abbreviation, "sauvegarder_definitions", lambda *a, **kw: None)
+    glossary = str(tmp_path / "glossary.sqlite")
+    phrases = [
+        ("GES", "Les gaz à effet de serre (GES) baissent."),
+        ("CO2", "Le dioxyde de carbone (CO2) domine."),
+        ("XYZ", "Un sigle (XYZ) opaque."),
+    ]
+
+    first = abbreviation.pipeline_abreviations("doc.pdf", phrases, glossary_path=glossary)
+    assert first == {"GES": "gaz à effet de serre", "CO2": "dioxyde de carbone", "XYZ": None}
+    assert sent == ["CO2", "XYZ"]
+
+    # Second document : CO2 vient du glossaire, seul le sigle non résolu repart au modèle
+    sent.clear()
+    abbreviation.pipeline_abreviations("autre.pdf", phrases, glossary_path=glossary)
+    assert sent == ["XYZ"]
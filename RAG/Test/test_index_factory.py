@@ -0,0 +1,44 @@
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from RAG.index_factory import build_faiss_index, build_vectorstore, resolve_index_spec, set_search_params
+from RAG.utils import delete_vectors
+
+
+def test_aliases_resolve_to_factory_strings():
+    assert resolve_index_spec("flat", 1000, 768) == "Flat"
+    assert resolve_index_spec("ivf", 10_000, 768) == "IVF256,Flat"
+    assert resolve_index_spec("opq", 10_000, 768) == "OPQ48,IVF256,PQ48"
+    assert resolve_index_spec("IVF64,PQ16", 10_000, 768) == "IVF64,PQ16"
+    assert resolve_index_spec("ivfpq", 100, 768) == resolve_index_spec("opq", 9_000, 768) == "Flat"
+
+
+def test_ivf_index_with_full_nprobe_matches_exact_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 32)).astype(np.float32)
+    exact = build_faiss_index(vectors, "flat")
+    ivf = build_faiss_index(vectors, "ivf")
+    set_search_params(ivf, nprobe=faiss.extract_index_ivf(ivf).nlist)
+    queries = vectors[:10]
+    assert (ivf.search(queries, 5)[1] == exact.search(queries, 5)[1]).all()
+
+
+def test_vectorstore_from_spec_is_searchable_and_hnsw_refuses_deletion():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    docs = [Document(page_content=f"chunk {i}") for i in range(50)]
+    db = build_vectorstore(docs, embeddings, ids=[f"id{i}" for i in range(50)], spec="hnsw")
+    assert db.similarity_search("chunk 7", k=1)[0].page_content == "chunk 7"
+    with pytest.raises(ValueError, match="force-reindex"):
+        delete_vectors(db, ["id1"])
+
+
+def test_small_shard_with_pq_spec_falls_back_to_exact_index():
+    # Shard d'un petit document (100 chunks) : les codebooks PQ48x8 ne pourraient pas être entraînés
+    embeddings = DeterministicFakeEmbedding(size=768)
+    docs = [Document(page_content=f"chunk {i}", metadata={"document": "a.pdf"}) for i in range(100)]
+    db = build_vectorstore(docs, embeddings, ids=[f"a.pdf:{i}" for i in range(100)], spec="ivfpq")
+    assert isinstance(faiss.downcast_index(db.index), faiss.IndexFlat) and db.index.ntotal == 100
+    assert db.similarity_search("chunk 42", k=1)[0].page_content == "chunk 42"
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+from RAG.index_store import ReadOnlyIndexError, SqliteDocstore, load_vectorstore, open_vectorstore, save_vectorstore
+from RAG.index_store import main as convert_index
+
+
+def _docs(n):
+    return [Document(page_content=f"chunk {i} émissions", metadata={"page": i, "document": "a.pdf"}) for i in range(n)]
+
+
+def test_open_reads_only_search_results(tmp_path, monkeypatch):
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    db = FAISS.from_documents(_docs(50), embeddings)
+    save_vectorstore(db, path)
+    assert sorted(os.listdir(path)) == ["docstore.sqlite", "index.faiss"]
+
+    opened = open_vectorstore(path, embeddings)
+    assert isinstance(opened.docstore, SqliteDocstore)
+    assert opened.index.ntotal == 50 and len(opened.index_to_docstore_id) == 50
+    expected = db.similarity_search("chunk 7 émissions", k=3)
+    assert [d.page_content for d in opened.similarity_search("chunk 7 émissions", k=3)] == \
+        [d.page_content for d in expected]
+    first = db.index_to_docstore_id[0]
+    assert opened.docstore.mget([first, "absent"]) == [db.docstore.search(first), None]
+
+    assert opened.index_to_docstore_id.mget([1, 0, 99]) == {0: first, 1: db.index_to_docstore_id[1]}
+
+    # Le moteur ne lit que les k chunks retrouvés dans SQLite : une requête pour les positions
+    # de tous les résultats, une pour les documents, quel que soit le nombre de questions
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=object())
+    store = type(engine.get_db().docstore)
+    queries = []
+    query = store._query
+    monkeypatch.setattr(store, "_query", lambda self, sql, params=(): queries.append(sql) or query(self, sql, params))
+    assert len(engine.search_many(["chunk 1", "chunk 2", "chunk 3"], k=3, mode="dense")[0]) == 3
+    assert len(queries) == 2
+    docs = engine.search_many(["chunk 7 émissions"], k=3, mode="dense")[0]
+    assert [d.page_content for d in docs] == [d.page_content for d in expected]
+    assert docs[0].metadata == {"page": expected[0].metadata["page"], "document": "a.pdf"}
+
+    # Relu en mémoire pour l'ingestion : mêmes chunks, mêmes positions
+    loaded = load_vectorstore(path, embeddings)
+    assert loaded.index_to_docstore_id == db.index_to_docstore_id
+    assert loaded.docstore.search(first) == db.docstore.search(first)
+
+
+def test_legacy_pickle_index_is_converted(tmp_path, monkeypatch):
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    FAISS.from_documents(_docs(5), embeddings).save_local(path)
+    assert open_vectorstore(path, embeddings).index.ntotal == 5  # ancien format encore lisible
+
+    monkeypatch.setattr("sys.argv", ["index_store.py", path])
+    convert_index()
+    assert sorted(os.listdir(path)) == ["docstore.sqlite", "index.faiss"]
+    opened = open_vectorstore(path, embeddings)
+    assert sorted(d.page_content for d in opened.docstore.mget(opened.index_to_docstore_id.values())) == \
+        sorted(d.page_content for d in _docs(5))
+
+
+def test_writes_on_mmap_store_fail_with_explicit_error(tmp_path):
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    save_vectorstore(FAISS.from_documents(_docs(5), embeddings), path)
+    opened = open_vectorstore(path, embeddings)
+    first = opened.index_to_docstore_id[0]
+
+    for write in (lambda: opened.add_documents(_docs(1)), lambda: opened.delete([first]),
+                  lambda: opened.docstore.add({"x": _docs(1)[0]}), lambda: opened.docstore.delete([first])):
+        with pytest.raises(ReadOnlyIndexError, match="load_vectorstore"):
+            write()
+    assert opened.index.ntotal == 5 and opened.similarity_search("chunk 1", k=1)
@@ -0,0 +1,102 @@
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import RAG.utils as utils
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+from RAG.index_store import load_vectorstore
+from RAG.ingest import PageSpool, PreparedDocument, StreamingIndexWriter, iter_batches
+from RAG.manifest import IndexManifest
+from RAG.shards import ShardRegistry
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Faux modèle qui compte les textes encodés et peut échouer après `fail_after` textes."""
+    encoded: int = 0
+    fail_after: int = -1
+
+    def embed_documents(self, texts):
+        if 0 <= self.fail_after <= self.encoded:
+            raise RuntimeError("interruption simulée")
+        self.encoded += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_flux_identique_au_decoupage_en_memoire(tmp_path):
+    pages = [Document(page_content=f"La SNBC vise la neutralité. Phrase {i}. " * 30, metadata={"page": i}) for i in range(5)]
+    abbr = {"SNBC": "stratégie nationale bas-carbone"}
+    with PageSpool(str(tmp_path)) as spool:
+        for page in pages:
+            spool.append(page)
+        streamed = list(utils.iter_chunks(spool, abbr))
+    expected = utils.enrich_chunks_with_abbreviations(utils.split_docs(pages), abbr)
+    assert [(d.page_content, d.metadata) for d in streamed] == [(d.page_content, d.metadata) for d in expected]
+    assert [len(b) for b in iter_batches(expected, batch_size=4)][:2] == [4, 4]
+
+
+def test_index_ivf_entraine_sur_le_tampon_puis_alimente_par_lots():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    docs = [Document(page_content=f"chunk {i}") for i in range(300)]
+    writer = StreamingIndexWriter(embeddings, spec="ivf", train_size=100)
+    for start in range(0, 300, 50):
+        batch = docs[start:start + 50]
+        writer.add(batch, embeddings.embed_documents([d.page_content for d in batch]), [f"id{start + i}" for i in range(50)])
+        if start < 50:
+            assert writer.db is None  # échantillon d'entraînement encore incomplet
+    writer.flush()
+    assert writer.added == writer.db.index.ntotal == 300
+    assert writer.db.docstore.search(writer.db.index_to_docstore_id[299]).page_content == "chunk 299"
+
+
+def test_reprise_apres_interruption_sans_re_encoder(monkeypatch, tmp_path):
+    index_path = str(tmp_path / "faiss_index")
+    model = CountingEmbedding(size=8)
+    embeddings = CachedEmbeddings(model, EmbeddingCache("fake", str(tmp_path / "emb")))
+    doc = tmp_path / "a.pdf"
+    doc.write_text("\n".join(f"page {i}" for i in range(40)), encoding="utf-8")
+
+    def fake_extract_pdf(path, figures_path, documents=None, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            for i, line in enumerate(f.read().splitlines()):
+                documents.append(Document(page_content=line, metadata={"page": i}))
+        return documents, []
+
+    monkeypatch.setattr(utils, "FAISS_CACHE_PATH", index_path)
+    monkeypatch.setattr(utils, "extract_pdf", fake_extract_pdf)
+    monkeypatch.setattr(utils, "pipeline_abreviations", lambda path, abrev_phrases=None: {})
+    monkeypatch.setattr(utils, "analyze_saved_pages_with_gemini", lambda *a, **kw: [])
+    monkeypatch.setattr(utils, "load_figure_analyses", lambda *a, **kw: [])
+    current = {"embeddings": embeddings}
+    monkeypatch.setattr(utils, "create_embeddings", lambda *a, **kw: current["embeddings"])
+
+    model.fail_after = 25
+    try:
+        utils.pipeline_add_new_document(str(doc), batch_size=5, checkpoint_every=10)
+    except RuntimeError:
+        pass
+    shard_path = ShardRegistry(index_path).shard_path(ShardRegistry.new_shard_name("a.pdf"))
+    assert ShardRegistry(index_path).shard_of("a.pdf") is None  # shard incomplet : pas encore enregistré
+    entry = IndexManifest(shard_path).get("a.pdf")
+    assert entry["complete"] is False and len(entry["ids"]) == 20
+
+    # Nouveau processus : le cache d'embeddings est relu depuis le disque
+    model.fail_after = -1
+    current["embeddings"] = CachedEmbeddings(model, EmbeddingCache("fake", str(tmp_path / "emb")))
+    utils.pipeline_add_new_document(str(doc), batch_size=5, checkpoint_every=10)
+    assert model.encoded == 25 + 20  # les 20 chunks du point de reprise viennent du cache
+    db = load_vectorstore(shard_path, embeddings)
+    assert db.index.ntotal == 40
+    assert IndexManifest(shard_path).is_unchanged("a.pdf", entry["sha256"])
+    assert ShardRegistry(index_path).is_unchanged("a.pdf", entry["sha256"])
+    assert np.isfinite(db.index.reconstruct(0)).all()
+
+
+def test_points_de_reprise_avec_embeddings_sans_cache(tmp_path):
+    index_path = str(tmp_path / "faiss_index")
+    chunks = [Document(page_content=f"chunk {i}", metadata={"page": i}) for i in range(12)]
+    prepared = PreparedDocument("a.pdf", "a.pdf", "sha", chunks)
+    added, _ = utils.index_documents([prepared], IndexManifest(index_path), index_exists=False, batch_size=4,
+                                     checkpoint_every=4, embeddings=DeterministicFakeEmbedding(size=8),
+                                     cache_path=index_path)
+    assert added == 12
+    assert load_vectorstore(index_path, DeterministicFakeEmbedding(size=8)).index.ntotal == 12
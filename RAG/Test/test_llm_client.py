@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from RAG.llm_client import FakeBackend, FakeClock, LLMClient, LLMError, TokenBucket
+
+
+def _client(backend, clock, **kwargs):
+    kwargs.setdefault("tokens_per_minute", None)
+    return LLMClient(backend, clock=clock, seed=0, **kwargs)
+
+
+def test_throughput_runs_at_the_request_quota_ceiling():
+    clock = FakeClock()
+    backend = FakeBackend(lambda prompt: prompt.upper(), latency=2.0, clock=clock)
+    client = _client(backend, clock, requests_per_minute=30, max_concurrency=8)
+
+    prompts = [f"q{i}" for i in range(60)]
+    answers = asyncio.run(client.agenerate_many(prompts))
+
+    assert answers == [p.upper() for p in prompts]
+    # 5 requêtes d'avance (10 s de budget) puis une toutes les 2 s : ~110 s + la dernière génération
+    assert 105 <= clock.now <= 115
+    starts = backend.started_at
+    assert max(sum(1 for t in starts if w <= t < w + 60) for w in starts) <= 30 + 5
+    assert 1 < backend.max_active <= 8
+
+
+def test_token_quota_limits_large_prompts():
+    clock = FakeClock()
+    backend = FakeBackend(clock=clock)
+    client = _client(backend, clock, requests_per_minute=None, tokens_per_minute=600)
+
+    asyncio.run(client.agenerate_many(["x" * 400] * 12))  # ~101 jetons chacun
+    assert clock.now == pytest.approx((12 * 101 - 100) / 10, rel=0.01)
+
+
+def test_retries_transient_errors_with_backoff():
+    clock = FakeClock()
+    backend = FakeBackend(lambda prompt: "ok", clock=clock, failures=[429, 503])
+    client = _client(backend, clock, requests_per_minute=None, base_delay=1.0)
+
+    assert asyncio.run(client.agenerate("prompt")) == "ok"
+    assert backend.calls == 3
+    assert client.stats["retries"] == 2
+    assert 1.5 <= clock.now <= 3.0  # backoff 1 s puis 2 s, avec gigue entre 50 et 100 %
+
+
+def test_non_retryable_error_is_raised_immediately():
+    clock = FakeClock()
+    backend = FakeBackend(clock=clock, failures=[400])
+    client = _client(backend, clock, requests_per_minute=None)
+
+    with pytest.raises(LLMError):
+        asyncio.run(client.agenerate("prompt"))
+    assert backend.calls == 1 and client.stats["failures"] == 1
+
+
+def test_timeout_is_measured_on_the_client_clock():
+    clock = FakeClock()
+    backend = FakeBackend(clock=clock, latency=10.0)
+    client = _client(backend, clock, requests_per_minute=None, timeout=3.0, max_retries=1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.agenerate("prompt"))
+    assert backend.calls == 2
+
+
+def test_sync_api_keeps_input_order_and_genai_shape():
+    client = LLMClient(FakeBackend(lambda prompt: f"réponse {prompt}"), requests_per_minute=None,
+                       tokens_per_minute=None)
+    assert client.generate_many(["a", "b", lambda: "c"]) == ["réponse a", "réponse b", "réponse c"]
+    assert client.generate_content("d").text == "réponse d"
+
+
+def test_token_bucket_reserves_in_arrival_order():
+    clock = FakeClock()
+    bucket = TokenBucket(60, capacity=1, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, pytest.approx(1.0), pytest.approx(2.0)]
+
+
+def test_stream_yields_chunks_as_they_arrive():
+    clock = FakeClock()
+    backend = FakeBackend(lambda prompt: "la neutralité carbone en 2050", latency=1.0, token_latency=0.5,
+                          clock=clock, failures=[503])
+    client = _client(backend, clock, requests_per_minute=None, base_delay=1.0)
+
+    arrivals = []
+    chunks = []
+    for chunk in client.stream_content("prompt"):
+        arrivals.append(clock.now)
+        chunks.append(chunk)
+
+    assert "".join(chunks) == "la neutralité carbone en 2050"
+    assert len(chunks) == 5 and client.stats["retries"] == 1
+    # Premier morceau après la reprise et la latence initiale, puis un morceau toutes les 0,5 s
+    ttft = arrivals[0]
+    assert 2.5 <= ttft <= 3.0
+    assert arrivals[-1] == pytest.approx(ttft + 4 * 0.5)
+
+
+class LoopBoundBackend(FakeBackend):
+    """Comme le client gRPC-aio du SDK Gemini : lié à la boucle de son premier appel."""
+
+    def __init__(self):
+        super().__init__(lambda prompt: "ok")
+        self.loop = None
+
+    async def generate(self, contents) -> str:
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif self.loop is not loop:
+            raise RuntimeError("Event loop is closed")
+        return await super().generate(contents)
+
+
+def test_sync_calls_reuse_one_event_loop():
+    backend = LoopBoundBackend()
+    client = LLMClient(backend, requests_per_minute=None, tokens_per_minute=None)
+
+    assert client.generate_content("a").text == "ok"
+    assert client.generate_content("b").text == "ok"
+    assert client.generate_many(["c", "d"]) == ["ok", "ok"]
+    assert "".join(client.stream_content("e")) == "ok"
+    assert backend.calls == 5 and client.stats["failures"] == 0
@@ -0,0 +1,85 @@
+import os
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import RAG.utils as utils
+from RAG.embedding_cache import CachedEmbeddings, EmbeddingCache
+from RAG.bm25 import BM25Index
+from RAG.index_store import load_vectorstore
+from RAG.manifest import IndexManifest
+from RAG.shards import ShardRegistry
+
+
+def _fake_ingestion(monkeypatch, tmp_path):
+    """Remplace l'extraction PDF, les appels Gemini et le modèle d'embeddings par des faux hors-ligne."""
+    index_path = str(tmp_path / "faiss_index")
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=8), EmbeddingCache("fake", str(tmp_path / "emb")))
+    loads = []
+
+    def fake_extract_pdf(path, figures_path, **kwargs):
+        loads.append(path)
+        with open(path, encoding="utf-8") as f:
+            pages = [Document(page_content=line, metadata={"page": i}) for i, line in enumerate(f.read().splitlines())]
+        return pages, []
+
+    monkeypatch.setattr(utils, "FAISS_CACHE_PATH", index_path)
+    monkeypatch.setattr(utils, "extract_pdf", fake_extract_pdf)
+    monkeypatch.setattr(utils, "pipeline_abreviations", lambda path, abrev_phrases=None: {})
+    monkeypatch.setattr(utils, "analyze_saved_pages_with_gemini", lambda *a, **kw: [])
+    monkeypatch.setattr(utils, "load_figure_analyses", lambda *a, **kw: [])
+    monkeypatch.setattr(utils, "create_embeddings", lambda *a, **kw: embeddings)
+    return index_path, embeddings, loads
+
+
+def _index_contents(index_path, embeddings):
+    registry = ShardRegistry(index_path)
+    contents = []
+    for name in registry.shards:
+        db = load_vectorstore(registry.shard_path(name), embeddings)
+        contents += [db.docstore.search(i).page_content for i in db.index_to_docstore_id.values()]
+    return sorted(contents)
+
+
+def _shard_path(index_path, key):
+    registry = ShardRegistry(index_path)
+    return registry.shard_path(registry.shard_of(key))
+
+
+def test_reingest_unchanged_is_noop_and_changed_replaces(monkeypatch, tmp_path):
+    index_path, embeddings, loads = _fake_ingestion(monkeypatch, tmp_path)
+    doc_a = tmp_path / "a.pdf"
+    doc_b = tmp_path / "b.pdf"
+    doc_a.write_text("page A1\npage A2", encoding="utf-8")
+    doc_b.write_text("page B1", encoding="utf-8")
+
+    utils.pipeline_add_new_document(str(doc_a))
+    utils.pipeline_add_new_document(str(doc_b))
+    utils.pipeline_add_new_document(str(doc_a))  # inchangé : pas de nouvelle extraction
+    assert loads == [str(doc_a), str(doc_b)]
+    assert _index_contents(index_path, embeddings) == ["page A1", "page A2", "page B1"]
+
+    # Fichier modifié : seul son shard est reconstruit
+    shard_b = os.path.join(_shard_path(index_path, "b.pdf"), "index.faiss")
+    mtime_b = os.stat(shard_b).st_mtime_ns
+    doc_a.write_text("page A1 bis", encoding="utf-8")
+    utils.pipeline_add_new_document(str(doc_a))
+    assert _index_contents(index_path, embeddings) == ["page A1 bis", "page B1"]
+    assert len(IndexManifest(_shard_path(index_path, "a.pdf")).get("a.pdf")["ids"]) == 1
+    assert os.stat(shard_b).st_mtime_ns == mtime_b
+
+
+def test_remove_document_deletes_only_its_vectors(monkeypatch, tmp_path):
+    index_path, embeddings, _ = _fake_ingestion(monkeypatch, tmp_path)
+    for name, text in (("a.pdf", "page A1\npage A2"), ("b.pdf", "page B1")):
+        (tmp_path / name).write_text(text, encoding="utf-8")
+        utils.pipeline_add_new_document(str(tmp_path / name))
+
+    shard_a = _shard_path(index_path, "a.pdf")
+    assert utils.pipeline_remove_document("a.pdf") == 2
+    assert _index_contents(index_path, embeddings) == ["page B1"]
+    shard_b = _shard_path(index_path, "b.pdf")
+    assert BM25Index.load(shard_b).search("page A1", 5)[0][0].startswith(IndexManifest(shard_b).get("b.pdf")["ids"][0])
+    assert len(BM25Index.load(shard_b)) == 1
+    assert ShardRegistry(index_path).shard_of("a.pdf") is None and not os.path.exists(shard_a)
+    assert utils.pipeline_remove_document("a.pdf") == 0
@@ -0,0 +1,74 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+from RAG.llm_client import FakeBackend, LLMClient
+from RAG.server import RagService
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """Compte les passages du modèle (un par lot de questions)."""
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        return super().embed_documents(texts)
+
+
+def _service(tmp_path, **options):
+    path = str(tmp_path / "faiss_index")
+    embeddings = CountingEmbedding(size=16, calls=[])
+    FAISS.from_documents([Document(page_content=t, metadata={"page": i, "document": "a.pdf"})
+                          for i, t in enumerate(["émissions de GES", "neutralité carbone", "budget carbone"])],
+                         embeddings).save_local(path)
+    llm = LLMClient(FakeBackend(lambda prompt: "réponse", latency=0.05), requests_per_minute=None,
+                    tokens_per_minute=None)
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+    return RagService(engine, **options), embeddings
+
+
+async def _run(service, scenario):
+    client = TestClient(TestServer(service.create_app()))
+    await client.start_server()
+    try:
+        return await scenario(client)
+    finally:
+        await client.close()
+
+
+def test_concurrent_questions_share_one_embedding_pass(tmp_path):
+    service, embeddings = _service(tmp_path, window_ms=50)
+
+    async def scenario(client):
+        embeddings.calls.clear()  # préchargement au démarrage
+        responses = await asyncio.gather(*(client.post("/ask", json={"question": f"carbone {i} ?", "k": 2})
+                                           for i in range(8)))
+        bodies = [await r.json() for r in responses]
+        metrics = await (await client.get("/metrics")).json()
+        return [r.status for r in responses], bodies, metrics
+
+    statuses, bodies, metrics = asyncio.run(_run(service, scenario))
+    assert statuses == [200] * 8
+    assert all(b["answer"] == "réponse" and len(b["sources"]) == 2 for b in bodies)
+    assert embeddings.calls == [8]  # un seul encodage pour les 8 questions
+    assert metrics["counters"]["batches"] == 1 and metrics["batch_size_histogram"]["le_8"] == 1
+    assert metrics["queue_depth"] == 0 and metrics["latency"]["total"]["count"] == 8
+
+
+def test_full_queue_is_rejected_with_503(tmp_path):
+    service, _ = _service(tmp_path, window_ms=200, max_batch_size=1, max_queue_size=1)
+
+    async def scenario(client):
+        responses = await asyncio.gather(*(client.post("/ask", json={"question": f"q{i} ?"}) for i in range(4)))
+        invalid = await client.post("/ask", json={"question": "q ?", "mode": "inconnu"})
+        return [r.status for r in responses], responses, invalid.status
+
+    statuses, responses, invalid = asyncio.run(_run(service, scenario))
+    assert 200 in statuses and 503 in statuses
+    assert all(r.headers.get("Retry-After") == "1" for r in responses if r.status == 503)
+    assert service.metrics.counters["rejected"] == statuses.count(503)
+    assert invalid == 400
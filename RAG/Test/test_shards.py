@@ -0,0 +1,137 @@
+import logging
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+from RAG.index_store import save_vectorstore
+from RAG.manifest import IndexManifest
+from RAG.shards import ShardFilter, ShardRegistry, document_year
+
+DOCUMENTS = {
+    "rapport-2023.pdf": ["émissions de GES du transport", "budget carbone 2023", "sobriété énergétique"],
+    "rapport-2024.pdf": ["neutralité carbone en 2050", "émissions de méthane agricoles", "rénovation des bâtiments"],
+    "avis-JOP-2024.pdf": ["jeux olympiques et émissions", "transport des spectateurs", "sites temporaires"],
+}
+
+
+def _docs(key, texts):
+    return [Document(page_content=t, metadata={"page": i, "document": key}) for i, t in enumerate(texts)]
+
+
+def _write_index(path, documents, embeddings):
+    """Écrit un index (FAISS, SQLite, manifeste) contenant les documents donnés."""
+    manifest = IndexManifest(path)
+    docs, ids = [], []
+    for key, texts in documents.items():
+        doc_ids = [f"{key}:{i}" for i in range(len(texts))]
+        manifest.record(key, key, f"sha-{key}", doc_ids)
+        docs += _docs(key, texts)
+        ids += doc_ids
+    save_vectorstore(FAISS.from_documents(docs, embeddings, ids=ids), path)
+    manifest.save()
+    return manifest
+
+
+def test_fan_out_matches_single_index_and_filters_shards(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    root = str(tmp_path / "faiss_index")
+    registry = ShardRegistry(root)
+    for key, texts in DOCUMENTS.items():
+        name = registry.new_shard_name(key)
+        registry.record(name, _write_index(registry.shard_path(name), {key: texts}, embeddings))
+    registry.save()
+    assert document_year("20240929-rapport-JOP-2024_0.pdf") == 2024
+    assert {e["documents"][k]["year"] for e in registry.shards.values() for k in e["documents"]} == {2023, 2024}
+
+    # Même top-k qu'une recherche exacte sur un index unique contenant tout le corpus
+    single = FAISS.from_documents([d for key, texts in DOCUMENTS.items() for d in _docs(key, texts)], embeddings)
+    engine = RagEngine(cache_path=root, embeddings=embeddings, llm=object())
+    for question in ("émissions du transport", "neutralité carbone"):
+        expected = [d.page_content for d in single.similarity_search(question, k=4)]
+        assert [d.page_content for d in engine.search_many([question], k=4, mode="dense")[0]] == expected
+    assert len(engine.search_many(["émissions"], k=9, mode="sparse")[0]) == 3  # trois chunks contiennent le terme
+
+    by_year = engine.search_many(["émissions"], k=9, mode="hybrid", filters=ShardFilter.create(years=[2024]))[0]
+    assert {d.metadata["document"] for d in by_year} == {"rapport-2024.pdf", "avis-JOP-2024.pdf"}
+    by_doc = engine.search_many(["émissions"], k=9, mode="dense",
+                                filters=ShardFilter.create(documents=["./x/rapport-2023.pdf"]))[0]
+    assert {d.metadata["document"] for d in by_doc} == {"rapport-2023.pdf"} and len(by_doc) == 3
+    assert engine.search_many(["émissions"], filters=ShardFilter.create(years=[1999])) == [[]]
+
+
+def test_legacy_index_is_one_shard_filtered_by_document(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    root = str(tmp_path / "faiss_index")
+    _write_index(root, DOCUMENTS, embeddings)  # index d'avant le découpage : tout à la racine
+
+    registry = ShardRegistry(root)
+    assert list(registry.shards) == ["main"] and registry.is_shared("main")
+    engine = RagEngine(cache_path=root, embeddings=embeddings, llm=object())
+    assert len(engine.search_many(["carbone"], k=20, mode="dense")[0]) == 9
+    kept = engine.search_many(["carbone"], k=2, mode="hybrid", filters=ShardFilter.create(["rapport-2024.pdf"]))[0]
+    assert len(kept) == 2 and {d.metadata["document"] for d in kept} == {"rapport-2024.pdf"}
+
+
+class KeyedEmbedding(DeterministicFakeEmbedding):
+    cache_key: str = "e5-base@torch+e5"
+
+
+def test_query_prefix_mode_must_match_the_one_recorded_at_build(tmp_path, caplog):
+    root = str(tmp_path / "faiss_index")
+    registry = ShardRegistry(root)
+    for key, texts in DOCUMENTS.items():
+        name = registry.new_shard_name(key)
+        embeddings = KeyedEmbedding(size=16, cache_key="e5-base@torch")  # index construit sans préfixes
+        registry.record(name, _write_index(registry.shard_path(name), {key: texts}, embeddings), embeddings.cache_key)
+    registry.save()
+
+    engine = RagEngine(cache_path=root, embeddings=KeyedEmbedding(size=16), llm=object())
+    with pytest.raises(ValueError, match="préfixes e5 différents"):
+        engine.search_many(["carbone"], k=2)
+
+    # Même mode de préfixes, autre backend : recherche possible, avec un avertissement
+    engine = RagEngine(cache_path=root, embeddings=KeyedEmbedding(size=16, cache_key="e5-base@int8"), llm=object())
+    with caplog.at_level(logging.WARNING):
+        assert len(engine.search_many(["carbone"], k=2)[0]) == 2
+    assert "e5-base@int8" in caplog.text
+
+
+def test_reingest_while_asking_keeps_searched_shards_open(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    root = str(tmp_path / "faiss_index")
+    registry = ShardRegistry(root)
+    for key, texts in DOCUMENTS.items():
+        name = registry.new_shard_name(key)
+        registry.record(name, _write_index(registry.shard_path(name), {key: texts}, embeddings))
+    registry.save()
+    engine = RagEngine(cache_path=root, embeddings=embeddings, llm=object())
+    stop, errors, sizes = threading.Event(), [], []
+
+    def ask():
+        try:
+            while not stop.is_set():
+                sizes.append(len(engine.search_many(["émissions", "carbone"], k=4, mode="hybrid")[1]))
+        except Exception as e:  # ex: sqlite3.ProgrammingError sur un shard fermé en cours de recherche
+            errors.append(e)
+
+    threads = [threading.Thread(target=ask) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        # Ré-ingestion du même document : son shard est réécrit et rouvert par le prochain appel
+        key = "rapport-2023.pdf"
+        for i in range(30):
+            registry = ShardRegistry(root)
+            name = registry.shard_of(key)
+            texts = [f"{t} (version {i})" for t in DOCUMENTS[key]]
+            registry.record(name, _write_index(registry.shard_path(name), {key: texts}, embeddings))
+            registry.save()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert not errors and sizes and set(sizes) == {4}
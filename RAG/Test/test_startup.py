@@ -0,0 +1,16 @@
+import json
+import os
+import subprocess
+import sys
+
+from RAG.main import HEAVY_MODULES
+
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_cli_startup_does_not_import_heavy_dependencies():
+    # Sous-processus neuf : les autres tests ont déjà importé ces modules dans ce processus
+    code = ("import json, sys, main; "
+            f"print(json.dumps([m for m in {list(HEAVY_MODULES)!r} if m in sys.modules]))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=RAG_DIR, capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,58 @@
+import json
+import tracemalloc
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+
+from RAG.engine import RagEngine
+from RAG.tracing import Tracer
+import tracing  # nom court, tel qu'importé par engine.py et utils.py
+
+
+def test_spans_nest_count_and_export_jsonl(tmp_path):
+    out = tmp_path / "metrics.jsonl"
+    tracer = Tracer()
+    tracer.configure(output=str(out), trace_memory=True)
+    try:
+        with tracer.span("ingest", document="a.pdf"):
+            with tracer.span("embed"):
+                tracer.count("chunks", 3)
+                tracer.count("chunks", 2)
+                blob = bytearray(5_000_000)
+                del blob
+            tracer.count("vectors", 5)
+    finally:
+        tracemalloc.stop()
+
+    records = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [r["name"] for r in records] == ["embed", "ingest"]
+    embed, ingest = records
+    assert embed["parent"] == "ingest" and embed["counts"] == {"chunks": 5}
+    assert ingest["counts"] == {"vectors": 5} and ingest["attrs"] == {"document": "a.pdf"}
+    assert ingest["duration_s"] >= embed["duration_s"]
+    # Le pic d'allocations de l'enfant remonte au parent
+    assert embed["peak_traced_mb"] >= 5 and ingest["peak_traced_mb"] >= embed["peak_traced_mb"]
+    # ru_maxrss : pic du processus, et hausse de ce pic pendant l'étape (incluse dans celle du parent)
+    assert 0 <= embed["rss_peak_growth_mb"] <= ingest["rss_peak_growth_mb"] <= ingest["process_peak_rss_mb"]
+    assert tracer.totals == {"chunks": 5, "vectors": 5}
+    assert tracer.summary()[0].startswith("ingest")
+
+
+def test_query_path_records_each_stage(tmp_path, monkeypatch, fake_llm):
+    tracer = Tracer()
+    monkeypatch.setattr(tracing, "TRACER", tracer)
+    path = str(tmp_path / "faiss_index")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    FAISS.from_documents([Document(page_content=t, metadata={"page": i})
+                          for i, t in enumerate(["émissions de GES", "neutralité carbone"])], embeddings).save_local(path)
+
+    engine = RagEngine(cache_path=path, embeddings=embeddings, llm=fake_llm)
+    with tracing.span("question"):
+        engine.ask("Question ?", k=2, mode="hybrid")
+
+    stages = {s.name: s for s in tracer.spans}
+    assert {"load_index", "embed_query", "search", "build_prompt", "llm", "question"} <= set(stages)
+    assert stages["search"].parent == "question" and stages["search"].attrs["mode"] == "hybrid"
+    assert stages["load_index"].counts["vectors"] == 2
+    assert stages["build_prompt"].counts["context_tokens"] > 0
@@ -1,45 +1,66 @@
 import re
-import time
 import json
-import PyPDF2
-import google.generativeai as genai
+import logging
 import os
-from tqdm import tqdm
+from pdf_pages import iter_pdf_pages
+from llm_client import get_gemini_client
+from glossary import GLOSSARY_PATH, GlossaryStore, extraire_definition_locale
+from tracing import count, span
+
+logger = logging.getLogger(__name__)
 
 # ----------- 1. Extraction depuis le PDF -----------
 
-def extraire_premiere_phrase_abreviations(pdf_path):
-    texte = ""
-    with open(pdf_path, "rb") as f:
-        lecteur = PyPDF2.PdfReader(f)
-        for page in lecteur.pages:
-            texte += page.extract_text() + " "
+_ABBR_PATTERN = re.compile(r"([A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}(?:\s+[A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}){0,9})\s*\(([A-Z][A-Z0-9\.]{1,10})\)")
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r"\s+")
 
-    texte = re.sub(r"\s+", " ", texte)
-    phrases = re.split(r'(?<=[.!?])\s+', texte)
 
-    pattern = r"([A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}(?:\s+[A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}){0,9})\s*\(([A-Z][A-Z0-9\.]{1,10})\)"
+class AbbreviationCollector:
+    """
+    Collecte, page par page, la première phrase où apparaît chaque abréviation « Forme longue (ABBR) ».
+    La dernière phrase (éventuellement coupée) d'une page est reportée sur la suivante,
+    ce qui évite de concaténer tout le document en mémoire.
+    """
 
-    premieres_occurrences = {}
+    def __init__(self):
+        self.premieres_occurrences = {}
+        self._reste = ""
 
-    for phrase in phrases:
-        correspondances = re.findall(pattern, phrase)
-        for _, abbr in correspondances:
+    def _traiter_phrase(self, phrase):
+        for _, abbr in _ABBR_PATTERN.findall(phrase):
             abbr = abbr.strip()
             if abbr.isdigit() or len(abbr) < 2 or len(abbr) > 10:
                 continue
-            if abbr not in premieres_occurrences:
-                premieres_occurrences[abbr] = phrase.strip()
+            if abbr not in self.premieres_occurrences:
+                self.premieres_occurrences[abbr] = phrase.strip()
+
+    def feed(self, texte_page):
+        texte = _WHITESPACE.sub(" ", f"{self._reste} {texte_page}")
+        phrases = _SENTENCE_SPLIT.split(texte)
+        for phrase in phrases[:-1]:
+            self._traiter_phrase(phrase)
+        self._reste = phrases[-1]
 
-    return [(abbr, phrase) for abbr, phrase in premieres_occurrences.items()]
+    def results(self):
+        """Termine la collecte et retourne la liste [(abréviation, phrase)]."""
+        if self._reste.strip():
+            self._traiter_phrase(self._reste)
+            self._reste = ""
+        return [(abbr, phrase) for abbr, phrase in self.premieres_occurrences.items()]
+
+
+def extraire_premiere_phrase_abreviations(pdf_path):
+    collector = AbbreviationCollector()
+    for page in iter_pdf_pages(pdf_path):
+        collector.feed(page.text)
+    return collector.results()
 
 
 # ----------- 2. Appel groupé à Gemini -----------
 
-def demander_definitions_groupe(abrev_phrases, model):
-    """
-    Envoie un lot de 10 abréviations + phrases à Gemini et récupère les définitions en JSON.
-    """
+def construire_prompt_definitions(abrev_phrases):
+    """Prompt demandant les définitions d'un lot d'abréviations (avec leurs phrases) au format JSON."""
     prompt = (
         "Voici une liste d'abréviations et leurs phrases. "
         "Pour chacune, retourne un objet JSON au format : "
@@ -53,71 +74,173 @@ def demander_definitions_groupe(abrev_phrases, model):
 
     prompt += "\nRéponds uniquement avec un JSON contenant une liste, par exemple :\n" \
               '[{"abréviation": "FMI", "définition": "Fonds monétaire international"}, ...]'
+    return prompt
 
-    try:
-        response = model.generate_content(prompt)
-        texte = response.text.strip()
 
-        # Nettoyer les caractères parasites autour du JSON
-        json_str = re.search(r'\[.*\]', texte, re.S)
-        if json_str:
+def lire_definitions(texte, abrev_phrases):
+    """Extrait la liste JSON de la réponse du modèle (nulls si elle est mal formée)."""
+    # Nettoyer les caractères parasites autour du JSON
+    json_str = re.search(r'\[.*\]', texte.strip(), re.S)
+    if json_str:
+        try:
             return json.loads(json_str.group(0))
-        else:
-            # Si Gemini n’a pas bien formaté le JSON, on retourne nulls
-            return [{"abréviation": abbr, "définition": None} for abbr, _ in abrev_phrases]
-
-    except Exception as e:
-        print(f"⚠️ Erreur Gemini : {e}")
-        return [{"abréviation": abbr, "définition": None} for abbr, _ in abrev_phrases]
+        except json.JSONDecodeError:
+            pass
+    # Si Gemini n’a pas bien formaté le JSON, on retourne nulls
+    return [{"abréviation": abbr, "définition": None} for abbr, _ in abrev_phrases]
 
 
 # ----------- 3. Traitement en lots et sauvegarde JSON -----------
 
-def traiter_en_lots_json(abrev_phrases, model, taille_lot=10, delai=4, sortie_json="log/definitions.json"):
-    os.makedirs(os.path.dirname(sortie_json), exist_ok=True)
+def traiter_en_lots_json(abrev_phrases, client, taille_lot=10, sortie_json="log/definitions.json"):
+    """
+    Envoie les lots d'abréviations en parallèle via le client LLM partagé (llm_client.LLMClient) :
+    le débit est réglé par son limiteur de quota (requêtes/min, jetons/min) au lieu d'une pause fixe.
+    """
+    lots = [abrev_phrases[i:i + taille_lot] for i in range(0, len(abrev_phrases), taille_lot)]
+    logger.info(f"Traitement de {len(lots)} lot(s) d'abréviations...")
+    with span("llm", lots=len(lots)):
+        reponses = client.generate_many([construire_prompt_definitions(lot) for lot in lots], return_exceptions=True)
 
     resultat_dict = {}
+    for lot, reponse in zip(lots, reponses):
+        if isinstance(reponse, Exception):
+            logger.warning(f"⚠️ Erreur Gemini : {reponse}")
+            definitions = []
+        else:
+            definitions = lire_definitions(reponse, lot)
+        for j, (abbr, phrase) in enumerate(lot):
+            definition = None
+            if j < len(definitions) and isinstance(definitions[j], dict):
+                definition = definitions[j].get("définition", None)
+            resultat_dict[abbr] = definition
 
-    # Nombre total de lots
-    total_lots = (len(abrev_phrases) + taille_lot - 1) // taille_lot
-    
-    # Barre de progression pour les lots
-    with tqdm(total=total_lots, desc="Traitement des lots", unit="lot") as pbar:
-        for i in range(0, len(abrev_phrases), taille_lot):
-            lot = abrev_phrases[i:i+taille_lot]
-            lot_index = i // taille_lot + 1
-
-            # Appel du modèle pour ce lot
-            reponses = demander_definitions_groupe(lot, model)
-
-            for j, (abbr, phrase) in enumerate(tqdm(lot, desc=f"Lot {lot_index}", leave=False)):
-                definition = None
-                if j < len(reponses):
-                    definition = reponses[j].get("définition", None)
-                resultat_dict[abbr] = definition
-
-            # pause entre lots pour respecter le rate limit
-            time.sleep(delai)
-            pbar.update(1)
     # Sauvegarder le JSON
+    if sortie_json:
+        sauvegarder_definitions(resultat_dict, sortie_json)
+    return resultat_dict
+
+
+def sauvegarder_definitions(resultat_dict, sortie_json):
+    os.makedirs(os.path.dirname(sortie_json), exist_ok=True)
     with open(sortie_json, "w", encoding="utf-8") as f:
         json.dump(resultat_dict, f, ensure_ascii=False, indent=2)
 
-    print(f"\n✅ Résultats enregistrés dans {sortie_json}")
-    return resultat_dict
+    logger.info(f"✅ Résultats enregistrés dans {sortie_json}")
 
 
-# ----------- 4. Pipeline abréviations -----------
+# ----------- 3 bis. Résolution locale avant tout appel au LLM -----------
+
+def resoudre_localement(abrev_phrases, store):
+    """
+    Résout sans LLM ce qui peut l'être :
+      1. glossaire persistant (même phrase déjà vue, ou définition connue présente dans la phrase),
+      2. extraction déterministe « Forme longue (ABBR) ».
+    Retourne (définitions résolues, abréviations restant à envoyer au modèle, compteurs par source).
+    """
+    resolues = {}
+    restantes = []
+    compteurs = {"glossaire": 0, "regex": 0}
+    for abbr, phrase in abrev_phrases:
+        trouve, definition = store.lookup(abbr, phrase)
+        if trouve:
+            resolues[abbr] = definition
+            compteurs["glossaire"] += 1
+            continue
+        definition = extraire_definition_locale(abbr, phrase)
+        if definition:
+            resolues[abbr] = definition
+            store.save(abbr, phrase, definition, "regex")
+            compteurs["regex"] += 1
+            continue
+        restantes.append((abbr, phrase))
+    store.commit()
+    return resolues, restantes, compteurs
 
-def pipeline_abreviations(pdf_path):    
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    model = genai.GenerativeModel("gemini-2.5-flash-lite")
 
-    chemin_pdf = pdf_path
-    abrev_phrases = extraire_premiere_phrase_abreviations(chemin_pdf)
-    print("-------Gestion des abréviations-------")
-    print(f"Nombre total d’abréviations trouvées : {len(abrev_phrases)}")
+# ----------- 4. Pipeline abréviations -----------
 
-    resultat_dict=traiter_en_lots_json(abrev_phrases, model, taille_lot=10, delai=4, sortie_json="./RAG/log/definitions.json")
+def pipeline_abreviations(pdf_path, abrev_phrases=None, glossary_path=GLOSSARY_PATH):
+    """
+    Extrait les abréviations d'un PDF et retrouve leurs définitions.
+    Le glossaire persistant et l'extraction locale sont consultés d'abord ; seules les abréviations
+    non résolues sont envoyées à Gemini, et leurs réponses enrichissent le glossaire.
+    `abrev_phrases` permet de fournir des abréviations déjà collectées (ex: pendant le passage
+    unique sur les pages du PDF) pour ne pas relire le fichier.
+    """
+    if abrev_phrases is None:
+        abrev_phrases = extraire_premiere_phrase_abreviations(pdf_path)
+    logger.info(f"Nombre total d’abréviations trouvées : {len(abrev_phrases)}")
+    count("abbreviations", len(abrev_phrases))
 
+    taille_lot = 10
+    store = GlossaryStore(glossary_path)
+    try:
+        with span("glossary"):
+            resultat_dict, restantes, compteurs = resoudre_localement(abrev_phrases, store)
+        count("abbreviations_llm", len(restantes))
+
+        if restantes:
+            client = get_gemini_client("gemini-2.5-flash-lite")
+            reponses = traiter_en_lots_json(restantes, client, taille_lot=taille_lot, sortie_json=None)
+            logger.info(client.stats_line())
+            for abbr, phrase in restantes:
+                definition = reponses.get(abbr)
+                resultat_dict[abbr] = definition
+                # Une définition absente peut venir d'une erreur d'appel : on ne la mémorise pas
+                if definition:
+                    store.save(abbr, phrase, definition, "llm")
+            store.commit()
+    finally:
+        store.close()
+
+    appels_sans_glossaire = -(-len(abrev_phrases) // taille_lot)
+    appels = -(-len(restantes) // taille_lot)
+    logger.info(f"Définitions : {compteurs['glossaire']} depuis le glossaire, {compteurs['regex']} extraites localement, "
+                f"{len(restantes)} envoyées au LLM ({appels} appel(s), {appels_sans_glossaire - appels} appel(s) économisé(s)).")
+
+    # Conserver l'ordre d'apparition dans le document
+    resultat_dict = {abbr: resultat_dict.get(abbr) for abbr, _ in abrev_phrases}
+    sauvegarder_definitions(resultat_dict, "./RAG/log/definitions.json")
     return resultat_dict
+
+
+# ----------- 5. Enrichissement des textes -----------
+
+class AbbreviationExpander:
+    """
+    Dictionnaire {abréviation: définition} compilé une seule fois en une expression régulière
+    (alternance des abréviations, les plus longues d'abord, bornée par des limites de mot).
+
+    `expand` réécrit un texte en un seul parcours : la première occurrence de chaque abréviation
+    devient « ABBR (définition) », sauf si la définition figure déjà dans le texte.
+    Les limites de mot évitent les faux positifs (« CO » dans « CO2 », « PAC » dans « PACTE »).
+    """
+
+    def __init__(self, abbr_dict):
+        self.definitions = {abbr: definition for abbr, definition in abbr_dict.items() if abbr and definition}
+        if self.definitions:
+            alternatives = "|".join(re.escape(a) for a in sorted(self.definitions, key=len, reverse=True))
+            self.pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+        else:
+            self.pattern = None
+
+    def expand(self, text):
+        """Retourne (texte enrichi, liste des abréviations développées)."""
+        if self.pattern is None:
+            return text, []
+        expanded = []
+        seen = set()
+
+        def _replace(match):
+            abbr = match.group(0)
+            if abbr in seen:
+                return abbr
+            seen.add(abbr)
+            definition = self.definitions[abbr]
+            if definition in text:
+                return abbr
+            expanded.append(abbr)
+            return f"{abbr} ({definition})"
+
+        return self.pattern.sub(_replace, text), expanded
@@ -0,0 +1,206 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from tracing import count
+
+# -------------------------------
+# Configuration
+# -------------------------------
+ANSWER_CACHE_PATH = "./RAG/cache/answers"
+ANSWER_SIMILARITY_THRESHOLD = 0.95  # similarité cosinus minimale entre deux formulations d'une même question
+MAX_ANSWER_ENTRIES = 1_000
+ANSWER_TTL_SECONDS = 7 * 24 * 3600
+ANSWER_SAVE_EVERY = 50  # réponses ajoutées entre deux sauvegardes (et à la fermeture / fin du processus)
+
+logger = logging.getLogger(__name__)
+
+
+def index_version(index_path: str) -> Optional[str]:
+    """
+    Version de l'index FAISS sur disque : empreinte des (nom, taille, mtime) de ses fichiers.
+    Toute ingestion ou suppression réécrit l'index et change donc la version.
+    """
+    if not os.path.isdir(index_path):
+        return None
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(index_path)):
+        st = os.stat(os.path.join(index_path, name))
+        h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Cache sémantique des réponses : (embedding de la question, ids des chunks retrouvés, réponse).
+    Une question dont l'embedding est à moins de `threshold` (cosinus) d'une question déjà posée,
+    avec les mêmes paramètres de recherche, reçoit la réponse en cache sans recherche ni appel à Gemini.
+
+    - petit index FAISS exact (produit scalaire sur vecteurs normalisés) des questions passées,
+    - éviction LRU au-delà de `max_entries` et expiration après `ttl` secondes,
+    - les réponses sont liées à une version de l'index (voir `index_version`) : après une ingestion,
+      le cache est vidé au premier accès.
+    Persistance dans `path` (`entries.json` + `vectors.npy`), réécrits en entier : toutes les
+    `save_every` réponses ajoutées et à `close()` (appelé aussi en fin de processus), pas à chaque `put`.
+    """
+
+    def __init__(self, path: Optional[str] = ANSWER_CACHE_PATH, threshold: float = ANSWER_SIMILARITY_THRESHOLD,
+                 max_entries: int = MAX_ANSWER_ENTRIES, ttl: Optional[float] = ANSWER_TTL_SECONDS, clock=time.time,
+                 save_every: int = ANSWER_SAVE_EVERY):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.save_every = max(1, save_every)
+        self.version: Optional[str] = None
+        self.entries: Dict[int, Dict] = {}  # id -> {question, params, chunk_ids, answer, latency, created, used}
+        self.vectors: Dict[int, np.ndarray] = {}
+        self.index = None
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._dirty = False  # modifications non encore écrites sur disque
+        self._unsaved = 0  # réponses ajoutées depuis la dernière sauvegarde
+        self._load()
+        if self.path:
+            atexit.register(self.close)
+
+    # ---------- Persistance ----------
+    def _load(self):
+        if not self.path or not os.path.exists(os.path.join(self.path, "entries.json")):
+            return
+        with open(os.path.join(self.path, "entries.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        vectors = np.load(os.path.join(self.path, "vectors.npy"))
+        self.version = data["version"]
+        self._next_id = data["next_id"]
+        for row, entry in enumerate(data["entries"]):
+            entry_id = entry.pop("id")
+            self.entries[entry_id] = entry
+            self.vectors[entry_id] = vectors[row]
+        self._rebuild_index()
+
+    def save(self):
+        self._dirty, self._unsaved = False, 0
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        ids = list(self.entries)
+        dim = self.index.d if self.index is not None else 0
+        vectors = np.stack([self.vectors[i] for i in ids]) if ids else np.zeros((0, dim), dtype=np.float32)
+        np.save(os.path.join(self.path, "vectors.npy.tmp.npy"), vectors)
+        os.replace(os.path.join(self.path, "vectors.npy.tmp.npy"), os.path.join(self.path, "vectors.npy"))
+        tmp = os.path.join(self.path, "entries.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "next_id": self._next_id,
+                       "entries": [dict(self.entries[i], id=i) for i in ids]}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, "entries.json"))
+
+    def close(self):
+        """Écrit les modifications en attente (idempotent)."""
+        if self._dirty:
+            self.save()
+
+    def _rebuild_index(self):
+        import faiss
+
+        self.index = None
+        if self.vectors:
+            dim = len(next(iter(self.vectors.values())))
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+            ids = np.array(list(self.vectors), dtype=np.int64)
+            self.index.add_with_ids(np.stack([self.vectors[i] for i in ids]).astype(np.float32), ids)
+
+    # ---------- Gestion des entrées ----------
+    def clear(self):
+        self.entries, self.vectors, self.index = {}, {}, None
+        self._dirty = True
+
+    def _remove(self, ids: Sequence[int]):
+        for i in ids:
+            self.entries.pop(i, None)
+            self.vectors.pop(i, None)
+        if self.index is not None and ids:
+            self.index.remove_ids(np.array(list(ids), dtype=np.int64))
+
+    def _check_version(self, version: Optional[str]):
+        """Vide le cache si l'index a changé depuis que les réponses ont été produites."""
+        if version != self.version:
+            if self.entries:
+                logger.info("Index modifié depuis la mise en cache : cache de réponses vidé.")
+            self.clear()
+            self.version = version
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        now = self.clock()
+        self._remove([i for i, e in self.entries.items() if now - e["created"] > self.ttl])
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    # ---------- API ----------
+    def lookup(self, vector, params: str, version: Optional[str]) -> Optional[Dict]:
+        """Retourne l'entrée la plus proche (mêmes paramètres, cosinus ≥ seuil, non expirée) ou None."""
+        start = time.perf_counter()
+        self._check_version(version)
+        self._expire()
+        query = self._normalize(vector)
+        if self.index is not None and self.index.ntotal and self.index.d == query.shape[1]:
+            scores, ids = self.index.search(query, min(8, self.index.ntotal))
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self.entries.get(int(entry_id))
+                if entry is None or score < self.threshold:
+                    continue
+                if entry["params"] == params:
+                    entry["used"] = self.clock()
+                    self._dirty = True
+                    self.hits += 1
+                    count("answer_cache_hits")
+                    self.saved_seconds += max(0.0, entry["latency"] - (time.perf_counter() - start))
+                    return dict(entry, similarity=float(score))
+        self.misses += 1
+        count("answer_cache_misses")
+        return None
+
+    def put(self, question: str, vector, params: str, chunk_ids: List[str], answer: str, latency: float,
+            version: Optional[str]):
+        self._check_version(version)
+        query = self._normalize(vector)
+        if self.index is not None and self.index.d != query.shape[1]:
+            self.clear()  # modèle d'embeddings changé
+        if len(self.entries) >= self.max_entries:
+            lru = sorted(self.entries, key=lambda i: self.entries[i]["used"])
+            self._remove(lru[:len(self.entries) - self.max_entries + 1])
+        entry_id = self._next_id
+        self._next_id += 1
+        now = self.clock()
+        self.entries[entry_id] = {"question": question, "params": params, "chunk_ids": list(chunk_ids),
+                                  "answer": answer, "latency": latency, "created": now, "used": now}
+        self.vectors[entry_id] = query[0]
+        if self.index is None:
+            import faiss
+
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(query.shape[1]))
+        self.index.add_with_ids(query, np.array([entry_id], dtype=np.int64))
+        self._dirty = True
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0.0
+        return (f"Cache de réponses : {self.hits}/{total} hit(s) ({rate:.0f} %), "
+                f"{self.saved_seconds:.1f} s économisées, {len(self.entries)} entrées")
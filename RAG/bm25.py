@@ -0,0 +1,131 @@
+import heapq
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# -------------------------------
+# Configuration
+# -------------------------------
+BM25_FILENAME = "bm25.json"  # à côté de index.faiss, sauvegardé et rechargé avec lui
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # constante de la fusion par rangs réciproques (Cormack et al.)
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+_TOKEN = re.compile(r"\w+|%")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minuscules sans accents ; garde les nombres, les sigles (« SNBC » -> « snbc ») et « % »."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+class BM25Index:
+    """
+    Index inversé BM25 persistant (`bm25.json` dans le dossier de l'index FAISS), tenu à jour
+    avec les mêmes ids de vecteurs que FAISS : ajout et suppression incrémentaux, sans reconstruction.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}  # terme -> {id: fréquence}
+        self.doc_len: Dict[str, int] = {}
+        self.total_len = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    # ---------- Mise à jour ----------
+    def add(self, ids: Sequence[str], texts: Iterable[str]):
+        for doc_id, text in zip(ids, texts):
+            if doc_id in self.doc_len:
+                self.remove([doc_id])
+            tokens = tokenize(text)
+            self.doc_len[doc_id] = len(tokens)
+            self.total_len += len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, ids: Iterable[str]) -> int:
+        ids = {i for i in ids if i in self.doc_len}
+        if not ids:
+            return 0
+        for doc_id in ids:
+            self.total_len -= self.doc_len.pop(doc_id)
+        for term in list(self.postings):
+            entries = self.postings[term]
+            for doc_id in ids.intersection(entries):
+                del entries[doc_id]
+            if not entries:
+                del self.postings[term]
+        return len(ids)
+
+    # ---------- Recherche ----------
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Les `k` meilleurs (id, score BM25) pour la requête."""
+        n = len(self.doc_len)
+        if not n:
+            return []
+        avg_len = self.total_len / n or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            for doc_id, tf in entries.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    # ---------- Persistance ----------
+    @classmethod
+    def load(cls, index_path: str) -> "BM25Index":
+        """Charge l'index du dossier `index_path` (index vide s'il n'existe pas)."""
+        index = cls()
+        path = os.path.join(index_path, BM25_FILENAME)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            index.k1, index.b = data["k1"], data["b"]
+            index.doc_len = data["doc_len"]
+            index.postings = data["postings"]
+            index.total_len = sum(index.doc_len.values())
+        return index
+
+    @classmethod
+    def exists(cls, index_path: str) -> bool:
+        return os.path.exists(os.path.join(index_path, BM25_FILENAME))
+
+    @classmethod
+    def from_vectorstore(cls, db) -> "BM25Index":
+        """Construit l'index à partir du docstore d'un index FAISS (index créé avant l'ajout de BM25)."""
+        index = cls()
+        ids = list(db.index_to_docstore_id.values())
+        index.add(ids, (db.docstore.search(i).page_content for i in ids))
+        return index
+
+    def save(self, index_path: str):
+        os.makedirs(index_path, exist_ok=True)
+        path = os.path.join(index_path, BM25_FILENAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_len": self.doc_len, "postings": self.postings}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int, rrf_k: int = RRF_K) -> List[str]:
+    """Fusionne des listes d'ids classées : score(id) = Σ 1 / (rrf_k + rang)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return [doc_id for doc_id, _ in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
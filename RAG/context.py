@@ -0,0 +1,149 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from llm_client import estimate_tokens
+
+# -------------------------------
+# Configuration
+# -------------------------------
+CONTEXT_TOKEN_BUDGET = 3_000  # jetons de contexte envoyés au LLM (estimation ≈ 4 caractères par jeton)
+DUPLICATE_THRESHOLD = 0.8  # part de shingles communs au-delà de laquelle un chunk est un quasi-doublon
+SHINGLE_SIZE = 3  # shingles de 3 mots
+MIN_OVERLAP_CHARS = 20  # recouvrement minimal pour recoller deux chunks consécutifs
+MAX_OVERLAP_CHARS = 300  # recouvrement maximal recherché (le découpage en met 100)
+
+logger = logging.getLogger(__name__)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def containment(a: Set, b: Set) -> float:
+    """Part des shingles du plus petit ensemble présents dans l'autre (1.0 : l'un est inclus dans l'autre)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _overlap(left: str, right: str) -> int:
+    """Longueur du plus long suffixe de `left` qui est un préfixe de `right` (0 si < MIN_OVERLAP_CHARS)."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+@dataclass
+class Passage:
+    """Un ou plusieurs chunks d'une même page recollés ; `rank` est le meilleur rang de recherche."""
+    text: str
+    rank: int
+    metadata: dict
+    shingles: Set[Tuple[str, ...]] = field(default_factory=set)
+
+    @property
+    def source_key(self) -> Tuple:
+        meta = self.metadata
+        page = meta.get("page", meta.get("source_page"))
+        return (str(meta.get("document") or meta.get("source") or ""), page if page is not None else -1,
+                meta.get("source") == "figure_analysis")
+
+
+def _page_key(doc: Document) -> Optional[Tuple]:
+    """Clé de page pour les chunks texte ; les analyses de figures ne sont jamais recollées."""
+    meta = doc.metadata
+    if meta.get("source") == "figure_analysis" or meta.get("page") is None:
+        return None
+    return (meta.get("document") or meta.get("source"), meta.get("page"))
+
+
+_SEPARATORS = ". ?!\n"  # séparateurs du découpage, conservés en tête du chunk suivant
+
+
+def _join(left: str, right: str) -> Optional[str]:
+    """Recolle `right` après `left` s'ils se recouvrent (chunks consécutifs), sinon None."""
+    stripped = right.lstrip(_SEPARATORS)
+    size = _overlap(left, stripped)
+    return left + stripped[size:] if size else None
+
+
+def _merge_group(texts: List[str]) -> List[str]:
+    """Recolle entre eux, tant que possible, les textes d'une même page qui se recouvrent."""
+    merged = list(texts)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(len(merged)):
+                if i == j:
+                    continue
+                joined = _join(merged[i], merged[j])
+                if joined is not None:
+                    merged[i] = joined
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+def pack_context(docs: List[Document], token_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = DUPLICATE_THRESHOLD) -> List[Document]:
+    """
+    Assemble le contexte à partir des documents retrouvés (dans l'ordre de pertinence) :
+      1. les chunks consécutifs d'une même page sont recollés (le recouvrement du découpage n'apparaît qu'une fois),
+      2. les quasi-doublons (shingles de 3 mots communs à plus de `duplicate_threshold`) sont écartés,
+      3. les passages sont retenus par pertinence jusqu'à `token_budget` jetons (None : pas de limite),
+      4. puis ordonnés par source (document, page) pour un contexte lisible.
+    Les jetons avant / après sont journalisés.
+    """
+    if not docs:
+        return []
+    # Regroupement par page (les analyses de figures restent seules)
+    groups = {}
+    for rank, doc in enumerate(docs):
+        key = _page_key(doc)
+        group_key = key if key is not None else ("_", rank)
+        if group_key not in groups:
+            groups[group_key] = (rank, dict(doc.metadata), [])
+        groups[group_key][2].append(doc.page_content)
+
+    passages: List[Passage] = []
+    for rank, metadata, texts in groups.values():
+        for text in _merge_group(texts):
+            passages.append(Passage(text, rank, metadata, shingles(text)))
+
+    # Quasi-doublons : on garde le passage le plus pertinent (le plus long à rang égal)
+    kept: List[Passage] = []
+    for passage in sorted(passages, key=lambda p: (p.rank, -len(p.text))):
+        if not any(containment(passage.shingles, k.shingles) >= duplicate_threshold for k in kept):
+            kept.append(passage)
+
+    selected, used = [], 0
+    for passage in kept:
+        cost = estimate_tokens(passage.text)
+        if token_budget is not None and used + cost > token_budget:
+            if not selected:  # le passage le plus pertinent est tronqué plutôt qu'écarté
+                passage.text = passage.text[:token_budget * 4]
+                selected.append(passage)
+                used = estimate_tokens(passage.text)
+            continue
+        selected.append(passage)
+        used += cost
+    selected.sort(key=lambda p: p.source_key)
+
+    before = estimate_tokens("\n".join(d.page_content for d in docs))
+    after = estimate_tokens("\n".join(p.text for p in selected))
+    logger.info(f"Contexte : {len(docs)} chunks -> {len(selected)} passages, "
+                f"{before} -> {after} jetons ({100 * (1 - after / before):.0f} % économisés)")
+    return [Document(page_content=p.text, metadata=p.metadata) for p in selected]
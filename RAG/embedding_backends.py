@@ -0,0 +1,207 @@
+"""
+Backends d'encodage du modèle d'embeddings sur CPU, derrière une même interface LangChain :
+  - torch : PyTorch fp32 (référence, équivalent de l'ancien HuggingFaceEmbeddings),
+  - int8  : même modèle, couches linéaires quantifiées dynamiquement en int8 (torch.ao.quantization),
+  - onnx  : ONNX Runtime (export automatique par sentence-transformers, nécessite optimum[onnxruntime]).
+
+Les modèles e5 attendent les préfixes « query: » (questions) et « passage: » (chunks) : ils sont
+ajoutés ici, une seule fois, selon la méthode appelée (`embed_documents`, `embed_query`, `embed_queries`).
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from tracing import count, span
+
+# -------------------------------
+# Configuration
+# -------------------------------
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_THREADS = None  # None : valeur par défaut de la bibliothèque (tous les cœurs)
+QUERY_PREFIX = "query: "
+PASSAGE_PREFIX = "passage: "
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class EmbeddingOptions:
+    backend: str = EMBEDDING_BACKEND
+    batch_size: int = EMBEDDING_BATCH_SIZE
+    threads: Optional[int] = EMBEDDING_THREADS
+    e5_prefixes: bool = True  # False : index construits avant l'ajout des préfixes
+
+
+_options = EmbeddingOptions()
+
+
+def configure_embeddings(**changes) -> EmbeddingOptions:
+    """Change les options d'encodage par défaut du processus (CLI) : `configure_embeddings(backend="int8")`."""
+    global _options
+    if "backend" in changes and changes["backend"] not in BACKENDS:
+        raise ValueError(f"Backend d'embeddings inconnu : {changes['backend']} (attendu : {', '.join(BACKENDS)})")
+    _options = replace(_options, **changes)
+    return _options
+
+
+def default_options() -> EmbeddingOptions:
+    return _options
+
+
+def is_e5_model(model_name: str) -> bool:
+    return "e5" in model_name.lower().replace("/", "-").split("-")
+
+
+def embed_queries(embeddings: Embeddings, texts: Sequence[str]) -> List[List[float]]:
+    """
+    Encode des questions en un seul lot. Les embedders sans méthode dédiée (symétriques, ex. les
+    doublures de test) sont encodés par `embed_documents`, comme avant.
+    """
+    method = getattr(embeddings, "embed_queries", None) or embeddings.embed_documents
+    return method(list(texts))
+
+
+class EncoderBackend(Embeddings):
+    """
+    Interface commune : une sous-classe ne fournit que `_load` (modèle prêt à encoder) et `_encode`
+    (lot de textes déjà préfixés -> matrice float32). Le modèle n'est chargé qu'au premier encodage.
+    """
+
+    name = "base"
+
+    def __init__(self, model_name: str, options: Optional[EmbeddingOptions] = None):
+        self.model_name = model_name
+        self.options = options or default_options()
+        self.prefixes = self.options.e5_prefixes and is_e5_model(model_name)
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        """Identifiant des vecteurs produits (cache d'embeddings) : un autre backend donne d'autres vecteurs."""
+        return f"{self.model_name}@{self.name}" + ("+e5" if self.prefixes else "")
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                start = time.perf_counter()
+                with span("load_embeddings", model=self.model_name, backend=self.name):
+                    self._model = self._load()
+                logger.info(f"Modèle d'embeddings {self.model_name} ({self.name}) chargé en "
+                            f"{time.perf_counter() - start:.1f} s")
+            return self._model
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode(self, texts: Sequence[str], prefix: str = "") -> np.ndarray:
+        texts = [prefix + t for t in texts] if self.prefixes else list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        count("encoded_texts", len(texts))
+        return np.asarray(self._encode(texts), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts, PASSAGE_PREFIX).tolist()
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts, QUERY_PREFIX).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+
+class TorchBackend(EncoderBackend):
+    """sentence-transformers sur PyTorch fp32, `threads` fixant torch.set_num_threads."""
+
+    name = "torch"
+
+    def _sentence_transformer(self, **kwargs):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.options.threads:
+            torch.set_num_threads(self.options.threads)
+        return SentenceTransformer(self.model_name, device="cpu", **kwargs)
+
+    def _load(self):
+        return self._sentence_transformer()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=self.options.batch_size, convert_to_numpy=True,
+                                 show_progress_bar=False)
+
+
+class Int8Backend(TorchBackend):
+    """Quantification dynamique int8 des couches linéaires (poids int8, activations quantifiées à la volée)."""
+
+    name = "int8"
+
+    def _load(self):
+        import torch
+
+        model = self._sentence_transformer()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(TorchBackend):
+    """ONNX Runtime (CPUExecutionProvider) ; le modèle est exporté en ONNX au premier chargement s'il ne l'est pas."""
+
+    name = "onnx"
+
+    def _load(self):
+        try:
+            import onnxruntime
+            import optimum  # noqa: F401
+        except ImportError as e:
+            raise ImportError("le backend onnx nécessite `pip install sentence-transformers[onnx]`") from e
+
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if self.options.threads:
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.options.threads
+            model_kwargs["session_options"] = session_options
+        return self._sentence_transformer(backend="onnx", model_kwargs=model_kwargs)
+
+
+BACKENDS: Dict[str, type] = {"torch": TorchBackend, "int8": Int8Backend, "onnx": OnnxBackend}
+
+
+def create_backend(model_name: str, options: Optional[EmbeddingOptions] = None) -> EncoderBackend:
+    options = options or default_options()
+    if options.backend not in BACKENDS:
+        raise ValueError(f"Backend d'embeddings inconnu : {options.backend} (attendu : {', '.join(BACKENDS)})")
+    return BACKENDS[options.backend](model_name, options)
+
+
+# -------------------------------
+# Parité et débit
+# -------------------------------
+def cosine_deviation(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Écart de chaque vecteur à sa référence fp32 : 1 - cosinus (moyenne, p95, max) et cosinus minimal."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    cosines = np.sum(reference * candidate, axis=1) / np.maximum(norms, 1e-12)
+    deviation = 1.0 - cosines
+    return {"mean_deviation": float(np.mean(deviation)), "p95_deviation": float(np.percentile(deviation, 95)),
+            "max_deviation": float(np.max(deviation)), "min_cosine": float(np.min(cosines))}
+
+
+def throughput(backend: Embeddings, texts: Sequence[str], warmup: int = 8) -> Dict[str, float]:
+    """Chunks encodés par seconde (après un petit lot de chauffe qui charge le modèle)."""
+    backend.embed_documents(list(texts[:warmup]))
+    start = time.perf_counter()
+    backend.embed_documents(list(texts))
+    seconds = time.perf_counter() - start
+    return {"chunks": len(texts), "seconds": seconds, "chunks_per_s": len(texts) / seconds if seconds else 0.0}
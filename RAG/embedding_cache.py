@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_backends import embed_queries
+
+# -------------------------------
+# Configuration
+# -------------------------------
+EMBEDDING_CACHE_DIR = "./RAG/cache/embeddings"
+MAX_CACHE_ENTRIES = 200_000  # ~600 Mo pour des vecteurs 768-d en float32
+_INITIAL_CAPACITY = 1024
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalise un chunk avant hachage (Unicode NFC, espaces compactés) pour que les variantes triviales partagent une entrée."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(model_name: str, text: str) -> str:
+    """Clé de cache : hash SHA-256 du couple (nom du modèle, texte normalisé)."""
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache persistant d'embeddings adressé par contenu, un dossier par modèle :
+      - `vectors.f32` : matrice float32 (capacité × dimension) ouverte en mémoire mappée,
+      - `index.json`  : table hash -> [ligne, dernier accès] + métadonnées.
+
+    La taille est bornée par `max_entries` : une fois plein, les entrées les moins
+    récemment utilisées sont évincées et leurs lignes réutilisées.
+    Le cache suppose un seul écrivain à la fois (un processus d'indexation).
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR, max_entries: int = MAX_CACHE_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, slug)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.index_path = os.path.join(self.dir, "index.json")
+
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self.entries: Dict[str, List[int]] = {}  # hash -> [ligne, tick du dernier accès]
+        self._tick = 0
+        self._vectors: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    # ---------- Persistance ----------
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name or not os.path.exists(self.vectors_path):
+            return
+        self.dim = meta["dim"]
+        self.capacity = meta["capacity"]
+        self.entries = meta["entries"]
+        self._tick = meta.get("tick", 0)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def save(self):
+        """Écrit les vecteurs sur disque et remplace atomiquement l'index des hash."""
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        meta = {
+            "model_name": self.model_name,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "tick": self._tick,
+            "entries": self.entries,
+        }
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.index_path)
+
+    def _ensure_capacity(self, needed: int):
+        """Agrandit la matrice mappée (par doublement, dans la limite de `max_entries`)."""
+        if needed <= self.capacity:
+            return
+        new_capacity = min(self.max_entries, max(needed, self.capacity * 2, _INITIAL_CAPACITY))
+        os.makedirs(self.dir, exist_ok=True)
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _free_rows(self, count: int) -> List[int]:
+        """Réserve `count` lignes : d'abord les lignes jamais utilisées, puis par éviction LRU."""
+        used = len(self.entries)
+        self._ensure_capacity(min(self.max_entries, used + count))
+        rows = list(range(used, min(self.capacity, used + count)))
+        missing = count - len(rows)
+        if missing > 0:
+            victims = sorted(self.entries.items(), key=lambda item: item[1][1])[:missing]
+            for key, (row, _) in victims:
+                del self.entries[key]
+                rows.append(row)
+            self.evictions += len(victims)
+        return rows
+
+    # ---------- Accès ----------
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Retourne le vecteur en cache de chaque texte (None si absent) et met à jour les compteurs."""
+        out: List[Optional[np.ndarray]] = []
+        for text in texts:
+            entry = self.entries.get(text_key(self.model_name, text))
+            if entry is None or self._vectors is None:
+                self.misses += 1
+                out.append(None)
+                continue
+            self._tick += 1
+            entry[1] = self._tick
+            self.hits += 1
+            out.append(np.array(self._vectors[entry[0]]))
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """Ajoute des vecteurs au cache (les doublons de texte ne sont stockés qu'une fois)."""
+        pending: Dict[str, np.ndarray] = {}
+        for text, vector in zip(texts, vectors):
+            key = text_key(self.model_name, text)
+            if key not in self.entries:
+                pending[key] = np.asarray(vector, dtype=np.float32)
+        if not pending:
+            return
+        if self.dim is None:
+            self.dim = len(next(iter(pending.values())))
+        # Au-delà de la capacité maximale, seuls les derniers vecteurs sont conservés
+        items = list(pending.items())[-self.max_entries:]
+        rows = self._free_rows(len(items))
+        for (key, vector), row in zip(items, rows):
+            self._vectors[row] = vector
+            self._tick += 1
+            self.entries[key] = [row, self._tick]
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return (f"Cache d'embeddings : {self.hits} hits / {self.misses} misses ({rate:.1f} %), "
+                f"{len(self.entries)} entrées, {self.evictions} évictions")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Enveloppe d'un modèle d'embeddings LangChain : `embed_documents` consulte le cache
+    et n'encode (en un seul lot) que les textes absents. Les requêtes ne sont pas mises en cache.
+    Le nom de modèle du cache doit identifier les vecteurs produits (backend et préfixes compris).
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    @property
+    def cache_key(self) -> str:
+        """Identifiant des vecteurs produits (celui du modèle enveloppé, qui nomme aussi le cache)."""
+        return getattr(self.embeddings, "cache_key", self.cache.model_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached = self.cache.get_many(texts)
+        miss_idx = [i for i, vec in enumerate(cached) if vec is None]
+        if miss_idx:
+            # Dédoublonnage des textes manquants avant l'encodage
+            unique = list(dict.fromkeys(texts[i] for i in miss_idx))
+            computed = dict(zip(unique, self.embeddings.embed_documents(unique)))
+            self.cache.put_many(unique, [computed[t] for t in unique])
+            for i in miss_idx:
+                cached[i] = computed[texts[i]]
+        return [np.asarray(vec, dtype=np.float32).tolist() for vec in cached]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return embed_queries(self.embeddings, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
@@ -0,0 +1,339 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from answer_cache import ANSWER_SIMILARITY_THRESHOLD, AnswerCache, index_version
+from bm25 import RETRIEVAL_MODES, reciprocal_rank_fusion
+from context import CONTEXT_TOKEN_BUDGET
+from index_factory import set_search_params
+from shards import ShardFilter, ShardSet, ShardView
+from tracing import count, span
+from utils import (
+    FAISS_CACHE_PATH,
+    MAX_LLM_CONCURRENCY,
+    RETRIEVAL_MODE,
+    create_embeddings,
+    get_llm,
+    generate_answer,
+    generate_answer_stream,
+    build_prompt,
+    timed_chunks,
+)
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Moteur RAG résident
+# -------------------------------
+class RagEngine:
+    """
+    Moteur de questions-réponses qui garde en mémoire, pour toute la durée du processus :
+      - le modèle d'embeddings (chargé au premier encodage),
+      - les shards de l'index (FAISS et BM25, voir shards.py), rouverts seulement si leur copie sur disque change,
+      - le client LLM Gemini (configuré une seule fois),
+      - le cache sémantique des réponses (`answer_cache`, désactivé s'il vaut None).
+
+    Les dépendances peuvent être injectées (embeddings, llm) pour les tests hors-ligne.
+    """
+
+    def __init__(self, cache_path: str = FAISS_CACHE_PATH, embeddings=None, llm=None,
+                 answer_cache: Optional[AnswerCache] = None):
+        self.cache_path = cache_path
+        self._embeddings = embeddings
+        self._llm = llm
+        self.answer_cache = answer_cache
+        self._index: Optional[ShardSet] = None
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                logger.info("Chargement du modèle d'embeddings...")
+                self._embeddings = create_embeddings()
+            return self._embeddings
+
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                logger.info("Initialisation du LLM Gemini...")
+                self._llm = get_llm()
+            return self._llm
+
+    def get_index(self) -> ShardSet:
+        """Retourne les shards ouverts, en rouvrant ceux qui ont été modifiés sur disque depuis."""
+        with self._lock:
+            if self._index is None:
+                self._index = ShardSet(self.cache_path, self.embeddings)
+            self._index.refresh()
+            return self._index
+
+    @contextmanager
+    def shard_view(self, view: Optional[ShardView] = None) -> Iterator[ShardView]:
+        """
+        Shards de l'index figés pour une recherche et la lecture de ses documents (voir ShardSet.view) :
+        une ingestion concurrente ne ferme pas un shard encore utilisé. `view` : vue déjà ouverte, réutilisée.
+        """
+        if view is not None:
+            yield view
+            return
+        with self.get_index().view() as view:
+            yield view
+
+    def get_db(self) -> "FAISS":
+        """Index FAISS d'un index à un seul shard (retriever LangChain, mesures) ; erreur s'il y en a plusieurs."""
+        db = self.get_index().single
+        if db is None:
+            raise ValueError("Index découpé en plusieurs shards : utilisez search_many / ask.")
+        return db
+
+    def invalidate(self):
+        """Force le rechargement de l'index au prochain appel."""
+        with self._lock:
+            if self._index is not None:
+                self._index.close()
+            self._index = None
+
+    def close(self):
+        """Ferme les shards et écrit le cache de réponses en attente."""
+        self.invalidate()
+        if self.answer_cache is not None:
+            self.answer_cache.close()
+
+    def get_searchable_db(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> "FAISS":
+        """Index chargé, avec les paramètres de recherche des index approchés (nprobe / efSearch) appliqués."""
+        db = self.get_db()
+        set_search_params(db.index, nprobe=nprobe, ef_search=ef_search)
+        return db
+
+    def retriever(self, k: int = 20, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        return self.get_searchable_db(nprobe, ef_search).as_retriever(search_kwargs={"k": k})
+
+    def ask(self, question: str, k: int = 20, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+            mode: str = RETRIEVAL_MODE, context_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+            filters: Optional[ShardFilter] = None) -> str:
+        """
+        Pose une question sur le moteur chaud : seule la recherche et la génération sont payées.
+        `context_budget` : jetons de contexte après assemblage (context.pack_context), None pour le contexte brut.
+        Avec un cache de réponses, une question proche d'une question déjà posée ne coûte qu'un encodage.
+        """
+        return self.ask_many([question], k=k, max_concurrency=1, nprobe=nprobe, ef_search=ef_search,
+                             mode=mode, context_budget=context_budget, filters=filters)[0]
+
+    def ask_stream(self, question: str, k: int = 20, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                   mode: str = RETRIEVAL_MODE, context_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                   timing: Optional[dict] = None, filters: Optional[ShardFilter] = None) -> Iterator[str]:
+        """
+        Comme `ask`, mais générateur des morceaux de la réponse au fil de la génération.
+        `timing` (dict) reçoit `ttft_s` (recherche comprise) et `total_s` ; une réponse en cache
+        est produite en un seul morceau, et une réponse générée n'est mise en cache qu'une fois complète.
+        """
+        start = time.perf_counter()
+        cache = self.answer_cache
+        params = self._cache_params(k, mode, nprobe, ef_search, context_budget, filters)
+        vector = version = None
+        if cache is not None:
+            with self._lock:
+                version = index_version(self.cache_path)
+                vector = self._embed_questions([question])
+                entry = cache.lookup(vector[0], params, version)
+            if entry:
+                yield from timed_chunks([entry["answer"]], timing, start)
+                return
+        with self.shard_view() as view:
+            ids = self.search_ids([question], k=k, nprobe=nprobe, ef_search=ef_search, mode=mode, vectors=vector,
+                                  filters=filters, view=view)[0]
+            docs = view.documents([ids])[0]
+        pieces = []
+        for chunk in timed_chunks(generate_answer_stream(self.llm, docs, question, context_budget), timing, start):
+            pieces.append(chunk)
+            yield chunk
+        if cache is not None:
+            with self._lock:
+                cache.put(question, vector[0], params, ids, "".join(pieces), time.perf_counter() - start, version)
+
+    @staticmethod
+    def _cache_params(k, mode, nprobe, ef_search, context_budget, filters=None) -> str:
+        """Paramètres qui changent la réponse : une réponse en cache n'est resservie qu'à l'identique."""
+        params = f"k={k};mode={mode};nprobe={nprobe};ef_search={ef_search};budget={context_budget}"
+        return f"{params};{filters.cache_key()}" if filters else params
+
+    def _embed_questions(self, questions: List[str]) -> np.ndarray:
+        from embedding_backends import embed_queries
+
+        embeddings = self.embeddings
+        with span("embed_query"):
+            count("questions", len(questions))
+            return np.asarray(embed_queries(embeddings, questions), dtype=np.float32)
+
+    def search_ids(self, questions: List[str], k: int = 20, nprobe: Optional[int] = None,
+                   ef_search: Optional[int] = None, mode: str = RETRIEVAL_MODE,
+                   vectors: Optional[np.ndarray] = None, filters: Optional[ShardFilter] = None,
+                   view: Optional[ShardView] = None) -> List[List[str]]:
+        """
+        Ids des chunks retrouvés pour chaque question (voir `search_many`), qualifiés par leur shard.
+        `vectors` : embeddings des questions déjà calculés (ex: pour le cache de réponses).
+        `view` : shards dans lesquels lire ensuite les documents (`view.documents`), voir `shard_view`.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {mode} (attendu : {', '.join(RETRIEVAL_MODES)})")
+        if not questions:
+            return []
+        with self.shard_view(view) as view:
+            index = view.index
+            selected = view.select(filters)
+            if not selected:
+                logger.info("Aucun shard ne correspond aux filtres.")
+                return [[] for _ in questions]
+            if mode != "sparse" and vectors is None:
+                vectors = self._embed_questions(questions)
+            with span("search", mode=mode, k=k, shards=len(selected)):
+                if mode == "dense":
+                    return index.search_dense(vectors, k, selected, nprobe, ef_search)
+                # En hybride, chaque retriever propose plus de candidats que k avant la fusion
+                depth = k if mode == "sparse" else 2 * k
+                sparse = index.search_sparse(questions, depth, selected)
+                if mode == "sparse":
+                    return sparse
+                dense = index.search_dense(vectors, depth, selected, nprobe, ef_search)
+                return [reciprocal_rank_fusion([d, s], k) for d, s in zip(dense, sparse)]
+
+    def search_many(self, questions: List[str], k: int = 20, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None, mode: str = RETRIEVAL_MODE,
+                    filters: Optional[ShardFilter] = None) -> List[List[Document]]:
+        """
+        Recherche en lot :
+          - dense : toutes les questions sont encodées en un seul passage du modèle,
+            puis une recherche FAISS sur la matrice des requêtes par shard (en parallèle), fusionnées par tas,
+          - sparse : BM25 sur l'index inversé (sigles, nombres, numéros d'articles exacts),
+          - hybrid : fusion par rangs réciproques (RRF) des deux listes.
+        `filters` (shards.ShardFilter) limite la recherche à certains documents ou années.
+        """
+        with self.shard_view() as view:
+            return view.documents(self.search_ids(questions, k=k, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                                  filters=filters, view=view))
+
+    def _generate(self, questions: List[str], docs_per_question: List[List[Document]], max_concurrency: int,
+                  context_budget: Optional[int]) -> List[str]:
+        llm = self.llm
+        if hasattr(llm, "generate_many"):
+            # Client partagé (llm_client.LLMClient) : appels asynchrones sous quota et concurrence bornée
+            prompts = [build_prompt(docs, q, context_budget) for q, docs in zip(questions, docs_per_question)]
+            with span("llm"):
+                return llm.generate_many(prompts, max_concurrency=max_concurrency)
+        workers = max(1, min(max_concurrency, len(questions)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda item: generate_answer(llm, item[1], item[0], context_budget),
+                                 zip(questions, docs_per_question)))
+
+    def retrieve_many(self, questions: List[str], k: int = 20, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None, mode: str = RETRIEVAL_MODE,
+                      context_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                      filters: Optional[ShardFilter] = None) -> "Retrieval":
+        """
+        Partie recherche de `ask_many` : un seul encodage de toutes les questions, consultation du cache
+        de réponses, puis une seule recherche en lot pour les questions restantes. Les appelants qui
+        génèrent eux-mêmes les réponses (ex: le service HTTP, server.py) les enregistrent avec `remember`.
+        """
+        questions = list(questions)
+        retrieval = Retrieval(questions, [None] * len(questions), [[] for _ in questions], [[] for _ in questions],
+                              self._cache_params(k, mode, nprobe, ef_search, context_budget, filters))
+        if not questions:
+            return retrieval
+        cache = self.answer_cache
+        vectors = None
+        if cache is not None:
+            with self._lock:
+                retrieval.version = index_version(self.cache_path)
+                vectors = retrieval.vectors = self._embed_questions(questions)
+                for i, vector in enumerate(vectors):
+                    entry = cache.lookup(vector, retrieval.params, retrieval.version)
+                    retrieval.answers[i] = entry["answer"] if entry else None
+        misses = retrieval.misses()
+        if misses:
+            with self.shard_view() as view:
+                rankings = self.search_ids([questions[i] for i in misses], k=k, nprobe=nprobe, ef_search=ef_search,
+                                           mode=mode, vectors=None if vectors is None else vectors[misses],
+                                           filters=filters, view=view)
+                docs = view.documents(rankings)
+            for i, ids, doc_list in zip(misses, rankings, docs):
+                retrieval.rankings[i], retrieval.docs[i] = ids, doc_list
+        return retrieval
+
+    def remember(self, retrieval: "Retrieval", indices: List[int], answers: List[str]):
+        """Enregistre les réponses générées pour `indices` (et dans le cache de réponses s'il est actif)."""
+        cache = self.answer_cache
+        latency = (time.perf_counter() - retrieval.start) / max(len(indices), 1)
+        with self._lock:
+            for i, answer in zip(indices, answers):
+                retrieval.answers[i] = answer
+                if cache is not None:
+                    cache.put(retrieval.questions[i], retrieval.vectors[i], retrieval.params, retrieval.rankings[i],
+                              answer, latency, retrieval.version)
+
+    def ask_many(self, questions: List[str], k: int = 20, max_concurrency: int = MAX_LLM_CONCURRENCY,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                 mode: str = RETRIEVAL_MODE, context_budget: Optional[int] = CONTEXT_TOKEN_BUDGET,
+                 filters: Optional[ShardFilter] = None) -> List[str]:
+        """
+        Répond à plusieurs questions : recherche en lot puis génération concurrente,
+        limitée à `max_concurrency` appels simultanés. L'ordre des réponses suit celui des questions.
+        Les questions trouvées dans le cache de réponses ne sont ni recherchées ni envoyées au LLM.
+        """
+        questions = list(questions)
+        if not questions:
+            return []
+        retrieval = self.retrieve_many(questions, k=k, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                       context_budget=context_budget, filters=filters)
+        misses = retrieval.misses()
+        if misses:
+            generated = self._generate([questions[i] for i in misses], [retrieval.docs[i] for i in misses],
+                                       max_concurrency, context_budget)
+            self.remember(retrieval, misses, generated)
+        return retrieval.answers
+
+
+@dataclass
+class Retrieval:
+    """Résultat de `RagEngine.retrieve_many` : réponses déjà en cache, sinon chunks retrouvés à envoyer au LLM."""
+    questions: List[str]
+    answers: List[Optional[str]]
+    rankings: List[List[str]]
+    docs: List[List[Document]]
+    params: str
+    vectors: Optional[np.ndarray] = None
+    version: Optional[str] = None
+    start: float = field(default_factory=time.perf_counter)
+
+    def misses(self) -> List[int]:
+        return [i for i, answer in enumerate(self.answers) if answer is None]
+
+
+_default_engine: Optional[RagEngine] = None
+_default_engine_lock = threading.Lock()
+
+
+def get_engine(answer_cache_threshold: Optional[float] = ANSWER_SIMILARITY_THRESHOLD) -> RagEngine:
+    """
+    Retourne le moteur partagé du processus (créé au premier appel).
+    `answer_cache_threshold` : similarité minimale du cache de réponses (None : moteur sans cache,
+    qui n'est alors ni lu ni reconstruit) ; pris en compte uniquement à la création du moteur.
+    """
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            answer_cache = None if answer_cache_threshold is None else AnswerCache(threshold=answer_cache_threshold)
+            _default_engine = RagEngine(answer_cache=answer_cache)
+        return _default_engine
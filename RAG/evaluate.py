@@ -0,0 +1,191 @@
+"""
+Évaluation rapide du RAG sur `Test/test_rag.csv` (question ; réponse attendue ; page/figure).
+
+Phase 1 (par défaut, sans LLM) : le moteur est chargé une fois, toutes les questions sont recherchées
+en un seul lot et le rappel@k / MRR sont calculés par rapport à la page (ou la figure) attendue.
+Phase 2 (`--generate`) : réponses générées en parallèle, puis similarité cosinus avec la réponse
+attendue, toutes les réponses étant encodées en un seul lot.
+
+    python RAG/evaluate.py
+    python RAG/evaluate.py --ks 1 5 10 20 --mode dense --output RAG/log/eval.json
+    python RAG/evaluate.py --generate --max-concurrency 4
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils import MAX_LLM_CONCURRENCY, RETRIEVAL_MODE
+
+# -------------------------------
+# Configuration
+# -------------------------------
+EVAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Test", "test_rag.csv")
+EVAL_KS = (1, 5, 10, 20)
+
+logger = logging.getLogger(__name__)
+_FIGURE = re.compile(r"figure\s*(\d+(?:\.\d+)*)\s*([a-z]?)", re.IGNORECASE)
+
+
+@dataclass
+class EvalItem:
+    question: str
+    expected_answer: str
+    target: Tuple[str, object]  # ("page", 39) ou ("figure", "1.2b")
+
+
+def parse_target(value: str) -> Optional[Tuple[str, object]]:
+    """« 39 » -> ("page", 39) ; « Figure 1.2b » -> ("figure", "1.2b") ; vide -> None."""
+    value = (value or "").strip()
+    if value.isdigit():
+        return ("page", int(value))
+    match = _FIGURE.search(value)
+    if match:
+        return ("figure", (match.group(1) + match.group(2)).lower())
+    return None
+
+
+def load_eval_set(path: str = EVAL_FILE, encoding: str = "latin-1") -> List[EvalItem]:
+    """Lit le CSV d'évaluation (séparateur « ; », colonnes question, expected_answer, page/figure)."""
+    items = []
+    with open(path, "r", encoding=encoding, newline="") as f:
+        for row in csv.DictReader(f, delimiter=";"):
+            question = (row.get("question") or "").strip()
+            if question:
+                items.append(EvalItem(question, row.get("expected_answer") or "", parse_target(row.get("page/figure"))))
+    return items
+
+
+def _doc_pages(doc) -> List[int]:
+    """Pages (numérotées à partir de 1) couvertes par un document retrouvé."""
+    meta = doc.metadata
+    if meta.get("source") == "figure_analysis":
+        return [meta["source_page"]] if meta.get("source_page") is not None else []
+    return [meta["page"] + 1] if meta.get("page") is not None else []
+
+
+def is_relevant(doc, target: Tuple[str, object], page_tolerance: int = 0) -> bool:
+    """Un document est pertinent s'il vient de la page attendue (± tolérance) ou cite la figure attendue."""
+    kind, value = target
+    if kind == "page":
+        return any(abs(page - value) <= page_tolerance for page in _doc_pages(doc))
+    return any((m.group(1) + m.group(2)).lower() == value for m in _FIGURE.finditer(doc.page_content))
+
+
+def first_relevant_rank(docs, target, page_tolerance: int = 0) -> Optional[int]:
+    for rank, doc in enumerate(docs, start=1):
+        if is_relevant(doc, target, page_tolerance):
+            return rank
+    return None
+
+
+def retrieval_metrics(ranks: Sequence[Optional[int]], ks: Sequence[int] = EVAL_KS) -> Dict[str, float]:
+    """Rappel@k (au moins un document pertinent dans les k premiers) et MRR, à partir des rangs du premier pertinent."""
+    n = len(ranks) or 1
+    metrics = {f"recall@{k}": sum(1 for r in ranks if r is not None and r <= k) / n for k in ks}
+    metrics["mrr"] = sum(1.0 / r for r in ranks if r is not None) / n
+    return metrics
+
+
+def evaluate_retrieval(engine, items: List[EvalItem], ks: Sequence[int] = EVAL_KS, mode: str = RETRIEVAL_MODE,
+                       page_tolerance: int = 0, **search_params) -> Dict:
+    """Phase 1 : une seule recherche en lot pour toutes les questions, aucun appel au LLM."""
+    items = [item for item in items if item.target is not None]
+    start = time.perf_counter()
+    docs_per_question = engine.search_many([item.question for item in items], k=max(ks), mode=mode,
+                                           **search_params)
+    seconds = time.perf_counter() - start
+    ranks = [first_relevant_rank(docs, item.target, page_tolerance) for item, docs in zip(items, docs_per_question)]
+    return {
+        "questions": len(items),
+        "mode": mode,
+        "seconds": seconds,
+        "metrics": retrieval_metrics(ranks, ks),
+        "per_question": [{"question": item.question, "target": list(item.target), "first_relevant_rank": rank}
+                         for item, rank in zip(items, ranks)],
+    }
+
+
+def evaluate_generation(engine, items: List[EvalItem], k: int = 20, mode: str = RETRIEVAL_MODE,
+                        max_concurrency: int = MAX_LLM_CONCURRENCY, **search_params) -> Dict:
+    """
+    Phase 2 : réponses générées en parallèle (`max_concurrency` appels simultanés), puis similarité
+    cosinus avec les réponses attendues, toutes encodées en un seul appel au modèle d'embeddings.
+    """
+    start = time.perf_counter()
+    answers = engine.ask_many([item.question for item in items], k=k, max_concurrency=max_concurrency, mode=mode,
+                              **search_params)
+    generation_seconds = time.perf_counter() - start
+    expected = [item.expected_answer for item in items]
+    vectors = np.asarray(engine.embeddings.embed_documents(list(answers) + expected), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarities = np.sum(vectors[:len(items)] * vectors[len(items):], axis=1)
+    # Pas de réponse attendue : pas de score
+    scores = [float(s) if e.strip() and a.strip() else None for s, a, e in zip(similarities, answers, expected)]
+    valid = [s for s in scores if s is not None]
+    return {
+        "questions": len(items),
+        "generation_seconds": generation_seconds,
+        "mean_similarity": float(np.mean(valid)) if valid else None,
+        "per_question": [{"question": item.question, "generated_answer": answer, "similarity": score}
+                         for item, answer, score in zip(items, answers, scores)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=EVAL_FILE, help="Fichier d'évaluation (question;expected_answer;page/figure)")
+    parser.add_argument("--ks", nargs="+", type=int, default=list(EVAL_KS))
+    parser.add_argument("--mode", default=RETRIEVAL_MODE, choices=["dense", "sparse", "hybrid"])
+    parser.add_argument("--page-tolerance", type=int, default=0,
+                        help="Pages d'écart acceptées autour de la page attendue")
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument("--generate", action="store_true",
+                        help="Phase 2 : générer les réponses (Gemini) et mesurer leur similarité aux réponses attendues")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_LLM_CONCURRENCY)
+    parser.add_argument("--output", default=None, help="Fichier JSON des résultats détaillés")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger("context").setLevel(logging.WARNING)
+    from engine import RagEngine
+
+    engine = RagEngine()  # sans cache de réponses : chaque réponse évaluée est réellement générée
+    items = load_eval_set(args.csv)
+    search_params = {"nprobe": args.nprobe, "ef_search": args.ef_search}
+    engine.get_index()
+
+    results = {"retrieval": evaluate_retrieval(engine, items, args.ks, args.mode, args.page_tolerance,
+                                               **search_params)}
+    retrieval = results["retrieval"]
+    logger.info(f"Recherche : {retrieval['questions']} questions en {retrieval['seconds']:.2f} s ({args.mode})")
+    for name, value in retrieval["metrics"].items():
+        logger.info(f"  {name:<10} {value:.3f}")
+    for row in retrieval["per_question"]:
+        if row["first_relevant_rank"] is None:
+            logger.info(f"  non trouvé dans le top {max(args.ks)} : {row['question'][:80]} ({row['target']})")
+
+    if args.generate:
+        generation = evaluate_generation(engine, items, k=max(args.ks), mode=args.mode,
+                                         max_concurrency=args.max_concurrency, **search_params)
+        results["generation"] = generation
+        logger.info(f"Génération : {generation['questions']} réponses en {generation['generation_seconds']:.1f} s, "
+                    f"similarité moyenne {generation['mean_similarity'] or 0:.3f}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        logger.info(f"Résultats détaillés écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,28 @@
-import fitz  # PyMuPDF
+import hashlib
+import io
+import logging
+import math
 import os
 import json
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
 import re
-import google.generativeai as genai
 from langchain_core.documents import Document
-import time
-from tqdm import tqdm
+from llm_client import get_gemini_client
+from pdf_pages import DEFAULT_SCAN_WORKERS, MIN_DRAWING_ELEMENTS, PdfPage, iter_pdf_pages
+from tracing import count, span
 # -------------------------------
 # Configuration
 # -------------------------------
 PDF_PATH = "./RAG/Dataset/HCC_RA_2025-18.07_web.pdf"
 OUTPUT_DIR = "./RAG/Dataset/rag_figures/images" # Dossier pour sauvegarder les images de pages
-MIN_DRAWING_ELEMENTS = 15
 ZOOM_FACTOR = 3 # Haute résolution
+FIGURE_SUMMARY_FILENAME = "_summary.json" # Résumé des analyses, un par document (dans son dossier d'images)
+FIGURE_CACHE_PATH = "./RAG/cache/figure_analyses.json" # Analyses déjà obtenues, par (modèle, hash de l'image)
+
+logger = logging.getLogger(__name__)
 
 # -------------------------------
 # Fonctions utilitaires
@@ -29,71 +37,250 @@ def _extract_page_num_from_filename(stem: str) -> Optional[int]:
     return int(m.group(1)) if m else None
 
 # -------------------------------
-# Fonction principale
+# Rendu des pages de figures
 # -------------------------------
-def save_identified_pages(pdf_path: str, out_dir: str, min_elements: int):
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+IMAGE_MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+@dataclass
+class RenderOptions:
     """
-    Parcourt un PDF, identifie les pages avec des figures potentielles,
-    et sauvegarde chaque page identifiée comme une image PNG.
+    Paramètres de rendu des pages de figures :
+      - dpi : résolution (72 dpi = zoom 1 ; la valeur par défaut reproduit ZOOM_FACTOR),
+      - max_pixels : plafond du nombre de pixels de l'image (la résolution est réduite au besoin),
+      - clip_to_drawings : ne rendre que la zone englobant les tracés (+ `clip_margin` points
+        pour garder titres et légendes) au lieu de la page entière,
+      - image_format : "png", "jpeg" ou "webp" (WebP nécessite Pillow), `quality` pour JPEG/WebP.
     """
-    print(f"--- Lancement de la sauvegarde des pages pour : {os.path.basename(pdf_path)} ---")
-    ensure_dir(out_dir)
-    
+    dpi: float = 72.0 * ZOOM_FACTOR
+    max_pixels: Optional[int] = None
+    clip_to_drawings: bool = False
+    clip_margin: float = 36.0
+    image_format: str = "png"
+    quality: int = 85
+
+    def __post_init__(self):
+        self.image_format = self.image_format.lower().replace("jpg", "jpeg")
+        if self.image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Format d'image inconnu : {self.image_format} (attendu : {', '.join(IMAGE_FORMATS)})")
+
+
+@dataclass
+class RenderedPage:
+    path: str
+    bytes_written: int
+    seconds: float
+
+
+def _encode_pixmap(pix, image_format: str, quality: int) -> bytes:
+    if image_format == "png":
+        return pix.tobytes("png")
+    if image_format == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=quality)
     try:
-        doc = fitz.open(pdf_path)
-    except Exception as e:
-        print(f"Erreur : Impossible d'ouvrir le fichier PDF '{pdf_path}'. Détails : {e}")
-        return
+        from PIL import Image
+    except ImportError as e:
+        raise RuntimeError("Le format WebP nécessite Pillow (pip install pillow)") from e
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (pix.width, pix.height), pix.samples).save(buffer, "WEBP", quality=quality)
+    return buffer.getvalue()
 
-    print(f"Le document contient {len(doc)} pages.")
-    
-    saved_pages_count = 0
 
-    # Parcourir chaque page du document
-    for i, page in enumerate(doc):
-        page_num = i + 1
-        
-        # 1. Filtre par complexité
-        drawings = page.get_drawings()
-        if len(drawings) < min_elements:
-            continue
+class PageRenderer:
+    """
+    Rend une page candidate en image dans `out_dir` (appelé par pdf_pages.iter_pdf_pages pendant que
+    la page est ouverte). Objet de module, donc sérialisable vers les processus de détection.
+    """
 
-        # 2. Filtre par mot-clé
-        page_text = page.get_text("text", sort=True).lower()
-        if "figure" not in page_text:
-            continue
+    def __init__(self, out_dir: str, options: Optional[RenderOptions] = None):
+        self.out_dir = out_dir
+        self.options = options or RenderOptions()
+
+    def __call__(self, page, record: PdfPage) -> RenderedPage:
+        import fitz  # PyMuPDF (déjà chargé : la page vient d'un document ouvert)
+
+        start = time.perf_counter()
+        opts = self.options
+        clip = page.rect
+        if opts.clip_to_drawings and record.drawings_bbox:
+            m = opts.clip_margin
+            clip = (fitz.Rect(record.drawings_bbox) + (-m, -m, m, m)) & page.rect
+        zoom = opts.dpi / 72.0
+        if opts.max_pixels:
+            pixels = clip.width * clip.height * zoom * zoom
+            if pixels > opts.max_pixels:
+                zoom *= math.sqrt(opts.max_pixels / pixels)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+        data = _encode_pixmap(pix, opts.image_format, opts.quality)
+        output_path = os.path.join(self.out_dir, f"page_{record.number}{IMAGE_FORMATS[opts.image_format]}")
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return RenderedPage(output_path, len(data), time.perf_counter() - start)
+
+
+@dataclass
+class FigureScanReport:
+    """Bilan d'une détection / sauvegarde des pages de figures."""
+    saved_pages: List[int] = field(default_factory=list)
+    pages: int = 0
+    seconds: float = 0.0
+    render_seconds: float = 0.0  # cumulé sur tous les processus
+    bytes_written: int = 0
+
+    def summary(self) -> str:
+        rate = self.pages / self.seconds if self.seconds else 0.0
+        return (f"{self.pages} pages en {self.seconds:.1f} s ({rate:.1f} pages/s), "
+                f"{len(self.saved_pages)} page(s) de figures rendue(s) en {self.render_seconds:.1f} s, "
+                f"{self.bytes_written / 1e6:.2f} Mo écrits")
+
+
+def _clear_page_images(out_dir: str):
+    """Supprime les images d'une extraction précédente (format ou pages détectées ont pu changer)."""
+    for suffix in IMAGE_MIME_TYPES:
+        for old in Path(out_dir).glob(f"page_*{suffix}"):
+            old.unlink()
 
-        #print(f"✅ Page {page_num}: Figure potentielle détectée. Sauvegarde de la page entière...")
 
-        # 3. Extraire la page entière en tant qu'image et la sauvegarder
+# -------------------------------
+# Fonction principale
+# -------------------------------
+def save_identified_pages(pdf_path: str, out_dir: str, min_elements: int = MIN_DRAWING_ELEMENTS,
+                          pages: Optional[Iterable[PdfPage]] = None, render_options: Optional[RenderOptions] = None,
+                          workers: int = DEFAULT_SCAN_WORKERS) -> FigureScanReport:
+    """
+    Parcourt un PDF, identifie les pages avec des figures potentielles (mot-clé « figure » puis
+    nombre de tracés vectoriels) et sauvegarde chaque page identifiée comme une image
+    (voir RenderOptions). La détection est répartie sur `workers` processus par plages de pages.
+
+    `pages` permet de consommer un flux de pages déjà ouvert (voir pdf_pages.iter_pdf_pages,
+    idéalement avec `on_figure_page=PageRenderer(...)`) au lieu de rouvrir le fichier.
+    Retourne un FigureScanReport (pages sauvegardées, pages/s, octets écrits, temps de rendu).
+    """
+    logger.info(f"--- Lancement de la sauvegarde des pages pour : {os.path.basename(pdf_path)} ---")
+    ensure_dir(out_dir)
+    _clear_page_images(out_dir)
+    renderer = PageRenderer(out_dir, render_options)
+    report = FigureScanReport()
+    start = time.perf_counter()
+
+    if pages is None:
         try:
-            mat = fitz.Matrix(ZOOM_FACTOR, ZOOM_FACTOR)
-            pix = page.get_pixmap(matrix=mat) # Pas de 'clip' pour avoir la page entière
-            
-            output_filename = f"page_{page_num}.png"
-            output_path = os.path.join(out_dir, output_filename)
-            
-            pix.save(output_path)
-            #print(f"  -> Page sauvegardée : {output_path}")
-            saved_pages_count += 1
+            pages = iter_pdf_pages(pdf_path, min_elements, workers=workers, on_figure_page=renderer)
+        except Exception as e:
+            logger.error(f"Erreur : Impossible d'ouvrir le fichier PDF '{pdf_path}'. Détails : {e}")
+            return report
 
+    # Parcourir chaque page du document
+    for page in pages:
+        report.pages += 1
+        if not page.is_figure_candidate:
+            continue
+
+        # Le rendu est normalement fait par le flux (page encore ouverte) ; sinon on le fait ici
+        try:
+            rendered = page.rendered or renderer(page.handle, page)
+            report.saved_pages.append(page.number)
+            report.bytes_written += rendered.bytes_written
+            report.render_seconds += rendered.seconds
         except Exception as e:
-            print(f"  -> Erreur lors de la sauvegarde de la page {page_num}: {e}")
+            logger.error(f"  -> Erreur lors de la sauvegarde de la page {page.number}: {e}")
+
+    report.seconds = time.perf_counter() - start
+    count("figure_pages", len(report.saved_pages))
+    count("figure_bytes", report.bytes_written)
+    logger.info(f"{len(report.saved_pages)} pages ont été sauvegardées dans le dossier '{out_dir}'.")
+    logger.info(report.summary())
+    return report
+
+# Imposer un retour sous forme de tableau JSON de figures
+FIGURE_PROMPT = (
+    "Tu es un analyste de données. Analyse en français la/les figure(s) présente(s) dans l'image.\n"
+    "RETOURNE STRICTEMENT un TABLEAU JSON de figures (même s'il n'y en a qu'une).\n"
+    "Chaque élément du tableau doit avoir exactement la structure suivante:\n"
+    "{\n"
+    "  \"titre\": string | null,\n"
+    "  \"type_graphique\": string | null,\n"
+    "  \"axes\": {\n"
+    "    \"x\": { \"label\": string | null, \"unite\": string | null },\n"
+    "    \"y\": { \"label\": string | null, \"unite\": string | null }\n"
+    "  },\n"
+    "  \"series\": [ { \"label\": string | null, \"tendance\": string | null } ],\n"
+    "  \"valeurs_cles\": [string],\n"
+    "  \"resume\": string\n"
+    "}\n"
+    "Si une information est absente, mets null. NE RENVOIE QUE LE TABLEAU JSON, sans texte additionnel."
+)
+
+def parse_figure_response(raw: str) -> List[Dict]:
+    """Normalise la réponse JSON du modèle en une liste de figures."""
+    clean = (raw or "").strip().replace("```json", "").replace("```", "").strip()
+    parsed = json.loads(clean)
+    # Normalisation des différentes formes possibles
+    if isinstance(parsed, dict) and "figures" in parsed and isinstance(parsed["figures"], list):
+        return parsed["figures"]
+    elif isinstance(parsed, dict):
+        return [parsed]
+    elif isinstance(parsed, list):
+        return parsed
+    raise ValueError("Réponse JSON inattendue: attendue liste ou objet")
+
+class FigureAnalysisCache:
+    """
+    Cache persistant des analyses de figures, indexé par (modèle, SHA-256 du contenu de l'image) :
+    une page déjà analysée (même rendu, même modèle) n'est jamais renvoyée au modèle,
+    quel que soit le document ou le dossier où se trouve l'image.
+    """
 
-    doc.close()
+    def __init__(self, path: str = FIGURE_CACHE_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(model_name: str, image_bytes: bytes) -> str:
+        return f"{model_name}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["figures"]
+
+    def put(self, key: str, figures: List[Dict]):
+        self.entries[key] = {"figures": figures, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> str:
+        return f"Cache des analyses de figures : {self.hits} hit(s), {self.misses} appel(s) au modèle"
 
-    print("-" * 20)
-    print("\nRésumé de la sauvegarde :")
-    print(f"{saved_pages_count} pages ont été sauvegardées dans le dossier '{out_dir}'.")
 
 def analyze_saved_pages_with_gemini(
     images_dir: str = OUTPUT_DIR,
     model_name: str = "gemini-2.5-flash-lite",
-    save_summary_path: Optional[str] = "./RAG/Dataset/rag_figures/_summary.json",
+    save_summary_path: Optional[str] = None,
+    cache: Optional[FigureAnalysisCache] = None,
 ) -> List[Dict]:
     """
-    Parcourt toutes les images PNG présentes dans `images_dir`, envoie chaque image au modèle
-    Gemini 2.0 Flash et gère le cas où le modèle renvoie plusieurs figures pour une même image.
+    Parcourt toutes les images (PNG, JPEG, WebP) présentes dans `images_dir`, envoie chaque image
+    jamais analysée au modèle Gemini et gère le cas où le modèle renvoie plusieurs figures pour une même image.
+
+    Les analyses sont mises en cache par (modèle, hash du contenu de l'image) dans `cache`
+    (FIGURE_CACHE_PATH par défaut) : ré-ingérer un document ne coûte aucun appel pour les pages déjà analysées.
+    Le résumé est écrit dans `save_summary_path`, par défaut `<images_dir>/_summary.json`
+    (un résumé par document, puisque chaque document a son dossier d'images).
 
     Normalisation: on transforme la sortie en une LISTE d'entrées (une par figure). Chaque entrée:
       {
@@ -110,93 +297,68 @@ def analyze_saved_pages_with_gemini(
         }
       }
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY manquant dans les variables d'environnement")
-
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(model_name)
-
     images_path = Path(images_dir)
     if not images_path.exists():
         raise FileNotFoundError(f"Dossier d'images introuvable: {images_dir}")
+    if save_summary_path is None:
+        save_summary_path = str(images_path / FIGURE_SUMMARY_FILENAME)
+    cache = cache or FigureAnalysisCache()
 
-    image_files = sorted(images_path.glob("*.png"))
+    image_files = sorted(p for p in images_path.iterdir() if p.suffix.lower() in IMAGE_MIME_TYPES)
     if not image_files:
-        print(f"Aucune image PNG trouvée dans {images_dir}")
-        return []
-
-    print(f"Analyse Gemini de {len(image_files)} image(s) depuis {images_dir} ...")
+        logger.info(f"Aucune image trouvée dans {images_dir}")
+
+    # Consultation du cache : seules les images jamais vues (pour ce modèle) partent au modèle
+    keys = {img: FigureAnalysisCache.key(model_name, img.read_bytes()) for img in image_files}
+    figures_by_image: Dict[Path, List[Dict]] = {}
+    to_analyze = []
+    for img in image_files:
+        cached = cache.get(keys[img])
+        if cached is None:
+            to_analyze.append(img)
+        else:
+            figures_by_image[img] = cached
+
+    if to_analyze:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY manquant dans les variables d'environnement")
+
+        client = get_gemini_client(model_name)
+        logger.info(f"Analyse Gemini de {len(to_analyze)} image(s) depuis {images_dir} ...")
+
+        # Les images sont lues au moment de l'envoi ; le client partagé règle le débit
+        # (quota requêtes/min et jetons/min, concurrence bornée, reprises sur 429/5xx)
+        def _request(img: Path):
+            return lambda: [FIGURE_PROMPT, {"mime_type": IMAGE_MIME_TYPES[img.suffix.lower()], "data": img.read_bytes()}]
+
+        with span("llm", images=len(to_analyze)):
+            responses = client.generate_many([_request(img) for img in to_analyze], return_exceptions=True)
+
+        for img, response in zip(to_analyze, responses):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                figures_by_image[img] = parse_figure_response(response)
+                cache.put(keys[img], figures_by_image[img])
+            except Exception as e:
+                logger.warning(f"  -> Échec: {img.name}: {e}")
+                continue
+        logger.info(client.stats_line())
+        cache.save()
+    count("figure_cache_hits", len(image_files) - len(to_analyze))
+    logger.info(cache.stats())
 
     results: List[Dict] = []
-    # Rate limiting: maximum 15 requests per minute -> minimum interval between calls
-    min_interval = 60.0 / 15.0  # 4.0 seconds
-    last_api_call = 0.0
-    for img in tqdm(image_files, desc="Analyse des images", unit="image"):
-        try:
-            page_num = _extract_page_num_from_filename(img.stem)
-
-            # Imposer un retour sous forme de tableau JSON de figures
-            prompt = (
-                "Tu es un analyste de données. Analyse en français la/les figure(s) présente(s) dans l'image.\n"
-                "RETOURNE STRICTEMENT un TABLEAU JSON de figures (même s'il n'y en a qu'une).\n"
-                "Chaque élément du tableau doit avoir exactement la structure suivante:\n"
-                "{\n"
-                "  \"titre\": string | null,\n"
-                "  \"type_graphique\": string | null,\n"
-                "  \"axes\": {\n"
-                "    \"x\": { \"label\": string | null, \"unite\": string | null },\n"
-                "    \"y\": { \"label\": string | null, \"unite\": string | null }\n"
-                "  },\n"
-                "  \"series\": [ { \"label\": string | null, \"tendance\": string | null } ],\n"
-                "  \"valeurs_cles\": [string],\n"
-                "  \"resume\": string\n"
-                "}\n"
-                "Si une information est absente, mets null. NE RENVOIE QUE LE TABLEAU JSON, sans texte additionnel."
-            )
-
-            with open(img, "rb") as f:
-                image_bytes = f.read()
-
-            # Enforce rate limit
-            now = time.monotonic()
-            elapsed = now - last_api_call
-            if elapsed < min_interval:
-                wait_for = min_interval - elapsed
-                #logging.info(f"Rate limit: waiting {wait_for:.2f}s before calling Gemini for {img.name}")
-                time.sleep(wait_for)
-
-            response = model.generate_content([
-                prompt,
-                {"mime_type": "image/png", "data": image_bytes},
-            ])
-            last_api_call = time.monotonic()
-
-            raw = (response.text or "").strip()
-            clean = raw.replace("```json", "").replace("```", "").strip()
-            parsed = json.loads(clean)
-            # Normalisation des différentes formes possibles
-            if isinstance(parsed, dict) and "figures" in parsed and isinstance(parsed["figures"], list):
-                figures = parsed["figures"]
-            elif isinstance(parsed, dict):
-                figures = [parsed]
-            elif isinstance(parsed, list):
-                figures = parsed
-            else:
-                raise ValueError("Réponse JSON inattendue: attendue liste ou objet")
-
-            for idx, fig in enumerate(figures):
-                results.append({
-                    "source_page": page_num,
-                    "image_path": str(img),
-                    "figure_index_in_image": idx,
-                    "analysis": fig,
-                })
-            #tqdm.write(f"  -> OK: {img.name} ({len(figures)} figure(s))")
-            #print(f"  -> OK: {img.name} ({len(figures)} figure(s))")
-        except Exception as e:
-            tqdm.write(f"  -> Échec: {img.name}: {e}")
-            continue
+    for img in image_files:
+        page_num = _extract_page_num_from_filename(img.stem)
+        for idx, fig in enumerate(figures_by_image.get(img, [])):
+            results.append({
+                "source_page": page_num,
+                "image_path": str(img),
+                "figure_index_in_image": idx,
+                "analysis": fig,
+            })
 
     if save_summary_path:
         try:
@@ -204,9 +366,9 @@ def analyze_saved_pages_with_gemini(
             out.parent.mkdir(parents=True, exist_ok=True)
             with open(out, "w", encoding="utf-8") as f:
                 json.dump(results, f, ensure_ascii=False, indent=2)
-            print(f"Résumé sauvegardé dans {out}")
+            logger.info(f"Résumé sauvegardé dans {out}")
         except Exception as e:
-            print(f"Impossible d'écrire le résumé: {e}")
+            logger.error(f"Impossible d'écrire le résumé: {e}")
 
     return results
 
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from typing import Optional, Tuple
+
+# -------------------------------
+# Configuration
+# -------------------------------
+GLOSSARY_PATH = "./RAG/cache/glossary.sqlite"
+
+_WORD = re.compile(r"[\wÀ-ÿ'’\-]+")
+_ELISION = re.compile(r"^(?:[ldLD]|qu|Qu)['’]")  # « l’Union européenne » -> « Union européenne »
+
+
+def phrase_hash(phrase: str) -> str:
+    """Empreinte de la phrase de définition (espaces normalisés)."""
+    return hashlib.sha256(" ".join(phrase.split()).encode("utf-8")).hexdigest()
+
+
+def _fold(text: str) -> str:
+    """Minuscules sans accents ni ponctuation superflue, pour comparer une définition à une phrase."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", text))
+
+
+# ----------- Extraction déterministe « Forme longue (ABBR) » -----------
+
+def _best_long_form(short: str, long: str) -> Optional[str]:
+    """
+    Algorithme de Schwartz & Hearst : on apparie les caractères de l'abréviation de droite à gauche
+    dans la forme longue candidate ; le premier caractère doit commencer un mot.
+    """
+    s_idx = len(short) - 1
+    l_idx = len(long) - 1
+    while s_idx >= 0:
+        c = short[s_idx].lower()
+        if not c.isalnum():
+            s_idx -= 1
+            continue
+        while (l_idx >= 0 and long[l_idx].lower() != c) or (s_idx == 0 and l_idx > 0 and long[l_idx - 1].isalnum()):
+            l_idx -= 1
+        if l_idx < 0:
+            return None
+        l_idx -= 1
+        s_idx -= 1
+    start = long.rfind(" ", 0, l_idx + 1) + 1
+    return long[start:]
+
+
+def extraire_definition_locale(abbr: str, phrase: str) -> Optional[str]:
+    """
+    Résout localement les cas simples « forme longue (ABBR) » sans appel au LLM.
+    Retourne None si la forme longue ne correspond pas aux lettres de l'abréviation
+    (ex: « dioxyde de carbone (CO2) ») : ces cas sont laissés au modèle.
+    """
+    m = re.search(rf"([^()]*?)\s*\(\s*{re.escape(abbr)}\s*\)", phrase)
+    if not m:
+        return None
+    words = _WORD.findall(m.group(1))
+    letters = sum(c.isalnum() for c in abbr)
+    if not words or letters < 2:
+        return None
+    # Fenêtre de Schwartz & Hearst : au plus min(|A| + 5, 2·|A|) mots avant la parenthèse
+    candidate = " ".join(words[-min(letters + 5, 2 * letters):])
+    long_form = _best_long_form(abbr, candidate)
+    if not long_form or len(long_form) <= len(abbr) or abbr in long_form.split():
+        return None
+    return _ELISION.sub("", long_form).strip(" -'’")
+
+
+# ----------- Glossaire persistant -----------
+
+class GlossaryStore:
+    """
+    Glossaire persistant (SQLite) partagé entre les documents.
+    Une entrée est indexée par (abréviation, hash de la phrase de définition) et garde
+    la source de la définition (« regex » ou « llm »).
+    """
+
+    def __init__(self, path: str = GLOSSARY_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS glossary ("
+            " abbr TEXT NOT NULL, phrase_hash TEXT NOT NULL, definition TEXT, source TEXT, created_at REAL,"
+            " PRIMARY KEY (abbr, phrase_hash))"
+        )
+        self.conn.commit()
+
+    def lookup(self, abbr: str, phrase: str) -> Tuple[bool, Optional[str]]:
+        """
+        Retourne (trouvé, définition) :
+          1. même abréviation et même phrase déjà résolues,
+          2. sinon une définition connue de cette abréviation (autre document) qui figure dans la phrase.
+        """
+        row = self.conn.execute(
+            "SELECT definition FROM glossary WHERE abbr = ? AND phrase_hash = ?", (abbr, phrase_hash(phrase))
+        ).fetchone()
+        if row is not None:
+            return True, row[0]
+        folded_phrase = _fold(phrase)
+        for (definition,) in self.conn.execute(
+            "SELECT definition FROM glossary WHERE abbr = ? AND definition IS NOT NULL "
+            "GROUP BY definition ORDER BY COUNT(*) DESC", (abbr,)
+        ):
+            if _fold(definition) and _fold(definition) in folded_phrase:
+                return True, definition
+        return False, None
+
+    def save(self, abbr: str, phrase: str, definition: Optional[str], source: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO glossary (abbr, phrase_hash, definition, source, created_at) VALUES (?, ?, ?, ?, ?)",
+            (abbr, phrase_hash(phrase), definition, source, time.time()),
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
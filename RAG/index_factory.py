@@ -0,0 +1,129 @@
+import math
+import uuid
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+
+# faiss et langchain_community ne sont chargés qu'à la première construction ou recherche
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# -------------------------------
+# Configuration
+# -------------------------------
+DEFAULT_INDEX_SPEC = "flat"
+TRAIN_SAMPLE_SIZE = 50_000  # nombre maximal de vecteurs utilisés pour l'entraînement (IVF / PQ / OPQ)
+MIN_POINTS_PER_CENTROID = 39  # en dessous, FAISS n'entraîne pas correctement ses centroïdes
+PQ_CENTROIDS = 256  # centroïdes par sous-quantificateur PQ (codes de 8 bits)
+
+# Alias lisibles -> chaîne `faiss.index_factory` ; {nlist} et {m} sont calculés à partir du corpus
+INDEX_SPEC_ALIASES = {
+    "flat": "Flat",
+    "ivf": "IVF{nlist},Flat",
+    "hnsw": "HNSW32",
+    "ivfpq": "IVF{nlist},PQ{m}",
+    "opq": "OPQ{m},IVF{nlist},PQ{m}",
+}
+
+
+def resolve_index_spec(spec: str, n_vectors: int, dim: int) -> str:
+    """
+    Traduit un alias (`flat`, `ivf`, `hnsw`, `ivfpq`, `opq`) en chaîne `faiss.index_factory`.
+    Une chaîne FAISS explicite (ex: "IVF256,PQ48") est renvoyée telle quelle.
+    - nlist ≈ 4·√n (au moins 1, au plus n/39 pour que chaque centroïde ait assez de points d'entraînement)
+    - m = plus grand diviseur de `dim` ≤ dim/16 (sous-vecteurs PQ de 16 dimensions ou plus)
+    - PQ / OPQ sur moins de 39 × 256 vecteurs (ex: shard d'un petit document) : index exact "Flat",
+      l'entraînement des codebooks échouerait et la compression ne gagnerait presque rien
+    """
+    template = INDEX_SPEC_ALIASES.get(spec.lower())
+    if template is None:
+        return spec
+    if "PQ" in template and n_vectors < MIN_POINTS_PER_CENTROID * PQ_CENTROIDS:
+        return INDEX_SPEC_ALIASES["flat"]
+    nlist = max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // MIN_POINTS_PER_CENTROID or 1))
+    m = max(d for d in range(1, max(dim // 16, 1) + 1) if dim % d == 0)
+    return template.format(nlist=nlist, m=m)
+
+
+def build_faiss_index(vectors: np.ndarray, spec: str = DEFAULT_INDEX_SPEC, train_size: int = TRAIN_SAMPLE_SIZE,
+                      seed: int = 0):
+    """Construit (et entraîne sur un échantillon si nécessaire) un index FAISS L2 contenant `vectors`."""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, resolve_index_spec(spec, n, dim))
+    if not index.is_trained:
+        if n > train_size:
+            sample = vectors[np.random.default_rng(seed).choice(n, train_size, replace=False)]
+        else:
+            sample = vectors
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def needs_training(spec: str, dim: int) -> bool:
+    """Vrai si ce type d'index doit être entraîné avant de recevoir des vecteurs (IVF, PQ, OPQ)."""
+    import faiss
+
+    return not faiss.index_factory(dim, resolve_index_spec(spec, TRAIN_SAMPLE_SIZE, dim)).is_trained
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Règle les paramètres de recherche d'un index approché (ignorés s'ils ne s'appliquent pas) :
+    - nprobe : nombre de listes IVF visitées (plus grand = meilleur rappel, plus lent),
+    - ef_search : taille de la file de recherche HNSW.
+    """
+    import faiss
+
+    params = faiss.ParameterSpace()
+    if nprobe is not None and _find(index, faiss.IndexIVF) is not None:
+        params.set_index_parameter(index, "nprobe", int(nprobe))
+    if ef_search is not None and _find(index, faiss.IndexHNSW) is not None:
+        params.set_index_parameter(index, "efSearch", int(ef_search))
+
+
+def _find(index, kind):
+    """Retourne le sous-index de type `kind` (éventuellement enveloppé dans un IndexPreTransform), ou None."""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index if isinstance(index, kind) else None
+
+
+def describe_index(index) -> str:
+    import faiss
+
+    index = faiss.downcast_index(index)
+    name = type(index).__name__
+    if isinstance(index, faiss.IndexPreTransform):
+        name += "+" + type(faiss.downcast_index(index.index)).__name__
+    return f"{name} ({index.ntotal} vecteurs, dim {index.d})"
+
+
+def vectorstore_from_vectors(docs, vectors, embeddings, ids: Optional[List[str]] = None,
+                             spec: str = DEFAULT_INDEX_SPEC, train_size: int = TRAIN_SAMPLE_SIZE) -> "FAISS":
+    """Construit un vector store FAISS à partir de vecteurs déjà calculés pour `docs`."""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    db = FAISS(embeddings, build_faiss_index(vectors, spec, train_size), InMemoryDocstore(), {})
+    # L'index est déjà rempli : on enregistre seulement les documents et la correspondance position -> id
+    ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in docs]
+    db.docstore.add(dict(zip(ids, docs)))
+    db.index_to_docstore_id = dict(enumerate(ids))
+    return db
+
+
+def build_vectorstore(docs, embeddings, ids: Optional[List[str]] = None, spec: str = DEFAULT_INDEX_SPEC) -> "FAISS":
+    """
+    Équivalent de `FAISS.from_documents` avec un type d'index au choix (`spec`) :
+    les embeddings sont calculés en un lot puis l'index est construit par `build_faiss_index`.
+    """
+    texts = [d.page_content for d in docs]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    return vectorstore_from_vectors(docs, vectors, embeddings, ids=ids, spec=spec)
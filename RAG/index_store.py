@@ -0,0 +1,279 @@
+"""
+Format de stockage de l'index (dossier `RAG/cache/faiss_index`) :
+  - `index.faiss`     : vecteurs FAISS, ouverts en mémoire mappée et en lecture seule par le moteur
+                        (chargement quasi instantané, pages partagées entre processus via le cache disque),
+  - `docstore.sqlite` : texte et métadonnées (JSON) des chunks, indexés par position dans l'index FAISS
+                        et par id ; seuls les k résultats d'une recherche sont lus.
+
+L'ancien format LangChain (`index.pkl`, docstore picklé, chargé en entier et non sûr à partager) reste
+lisible : il est converti à la prochaine sauvegarde (ingestion, suppression) ou par
+`python RAG/index_store.py`.
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from tracing import count
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# -------------------------------
+# Configuration
+# -------------------------------
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.sqlite"
+LEGACY_DOCSTORE_FILENAME = "index.pkl"
+SQLITE_MMAP_BYTES = 256 * 1024 * 1024  # lecture du docstore via mmap (pages partagées entre processus)
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE chunks (
+    position INTEGER PRIMARY KEY,  -- position du vecteur dans index.faiss
+    id       TEXT NOT NULL UNIQUE,
+    text     TEXT NOT NULL,
+    metadata TEXT NOT NULL
+)
+"""
+READ_ONLY_MESSAGE = ("Index ouvert en lecture seule (open_vectorstore, vecteurs en mémoire mappée) : "
+                     "passer par load_vectorstore pour le modifier.")
+
+
+class ReadOnlyIndexError(Exception):
+    """Écriture (ajout, suppression) demandée sur un index ouvert par `open_vectorstore`."""
+
+    def __init__(self, message: str = READ_ONLY_MESSAGE):
+        super().__init__(message)
+
+
+class SqliteDocstore:
+    """
+    Docstore en lecture seule sur `docstore.sqlite`, compatible avec le vector store FAISS de LangChain
+    (`search`). Les chunks sont lus à la demande ; la connexion est partagée entre threads sous verrou.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+        self._lock = threading.Lock()
+
+    def _query(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM chunks")[0][0]
+
+    def mget(self, ids: Sequence[str]) -> List[Optional[Document]]:
+        """Documents des `ids` (dans l'ordre, None si absent), en une seule requête."""
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self._query(f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", list(ids))
+        found = {doc_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+                 for doc_id, text, metadata in rows}
+        count("docstore_reads", len(found))
+        return [found.get(doc_id) for doc_id in ids]
+
+    def search(self, search: str):
+        """Comme InMemoryDocstore.search : le Document, ou un message si l'id est inconnu."""
+        doc = self.mget([search])[0]
+        return doc if doc is not None else f"ID {search} not found."
+
+    def id_at(self, position: int) -> Optional[str]:
+        rows = self._query("SELECT id FROM chunks WHERE position = ?", (int(position),))
+        return rows[0][0] if rows else None
+
+    def ids_at(self, positions: Sequence[int]) -> Dict[int, str]:
+        """Ids des chunks aux `positions` FAISS (positions absentes omises), en une seule requête."""
+        positions = sorted({int(p) for p in positions})
+        if not positions:
+            return {}
+        placeholders = ",".join("?" * len(positions))
+        return dict(self._query(f"SELECT position, id FROM chunks WHERE position IN ({placeholders})", positions))
+
+    def ids(self) -> Iterator[str]:
+        for (doc_id,) in self._query("SELECT id FROM chunks ORDER BY position"):
+            yield doc_id
+
+    def add(self, texts: Dict[str, Document]):
+        raise ReadOnlyIndexError()
+
+    def delete(self, ids: List):
+        raise ReadOnlyIndexError()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PositionIds(Mapping):
+    """Correspondance position FAISS -> id du chunk lue dans SQLite (remplace le dict `index_to_docstore_id`)."""
+
+    def __init__(self, docstore: SqliteDocstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self.docstore.id_at(position)
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def mget(self, positions: Sequence[int]) -> Dict[int, str]:
+        """Ids de plusieurs positions (ex: tous les résultats d'une recherche), en une seule requête."""
+        return self.docstore.ids_at(positions)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __len__(self) -> int:
+        return len(self.docstore)
+
+    def values(self):
+        return list(self.docstore.ids())
+
+
+def read_index_mmap(path: str):
+    """
+    Ouvre un index FAISS en mémoire mappée et en lecture seule : codes des index plats / HNSW
+    (IO_FLAG_MMAP_IFC) ou listes inversées IVF (IO_FLAG_MMAP). Lecture complète si aucun ne s'applique.
+    """
+    import faiss
+
+    for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, name, None)
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+def has_docstore(folder: str) -> bool:
+    return os.path.exists(os.path.join(folder, DOCSTORE_FILENAME))
+
+
+def _load_legacy(folder: str, embeddings) -> "FAISS":
+    from langchain_community.vectorstores import FAISS
+
+    logger.info("Index au format pickle (index.pkl) : chargement complet, converti à la prochaine sauvegarde.")
+    return FAISS.load_local(folder, embeddings, allow_dangerous_deserialization=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_only_faiss():
+    """Vector store FAISS de LangChain dont les écritures échouent avant de toucher l'index mappé."""
+    from langchain_community.vectorstores import FAISS
+
+    class ReadOnlyFAISS(FAISS):
+        def add_texts(self, *args, **kwargs):
+            raise ReadOnlyIndexError()
+
+        def add_embeddings(self, *args, **kwargs):
+            raise ReadOnlyIndexError()
+
+        def delete(self, *args, **kwargs):
+            raise ReadOnlyIndexError()  # FAISS interromprait le processus sur les vecteurs mappés
+
+        def merge_from(self, *args, **kwargs):
+            raise ReadOnlyIndexError()
+
+    return ReadOnlyFAISS
+
+
+def open_vectorstore(folder: str, embeddings) -> "FAISS":
+    """
+    Vector store en lecture seule pour les questions : vecteurs en mémoire mappée, chunks lus dans SQLite
+    seulement pour les résultats. Le coût d'ouverture ne dépend presque pas de la taille du corpus.
+    Toute écriture (`add_documents`, `delete`...) lève ReadOnlyIndexError : voir `load_vectorstore`.
+    """
+    if not has_docstore(folder):
+        return _load_legacy(folder, embeddings)
+    docstore = SqliteDocstore(os.path.join(folder, DOCSTORE_FILENAME))
+    index = read_index_mmap(os.path.join(folder, INDEX_FILENAME))
+    return _read_only_faiss()(embeddings, index, docstore, PositionIds(docstore))
+
+
+def load_vectorstore(folder: str, embeddings) -> "FAISS":
+    """Vector store modifiable (ingestion, suppression) : index et chunks chargés en mémoire."""
+    if not has_docstore(folder):
+        return _load_legacy(folder, embeddings)
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    conn = sqlite3.connect(f"file:{os.path.join(folder, DOCSTORE_FILENAME)}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT position, id, text, metadata FROM chunks ORDER BY position").fetchall()
+    finally:
+        conn.close()
+    docstore = InMemoryDocstore({doc_id: Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+                                 for _, doc_id, text, metadata in rows})
+    index = faiss.read_index(os.path.join(folder, INDEX_FILENAME))
+    return FAISS(embeddings, index, docstore, {position: doc_id for position, doc_id, _, _ in rows})
+
+
+def _write_docstore(path: str, db: "FAISS"):
+    """Écrit tous les chunks dans un nouveau fichier SQLite, puis le substitue atomiquement à l'ancien."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute(_SCHEMA)
+
+        def rows():
+            for position, doc_id in sorted(db.index_to_docstore_id.items()):
+                doc = db.docstore.search(doc_id)
+                yield position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)
+
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows())
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+
+def save_vectorstore(db: "FAISS", folder: str):
+    """Sauvegarde `index.faiss` et `docstore.sqlite` (fichiers temporaires puis remplacement) ; supprime l'ancien pickle."""
+    import faiss
+
+    os.makedirs(folder, exist_ok=True)
+    index_path = os.path.join(folder, INDEX_FILENAME)
+    faiss.write_index(db.index, index_path + ".tmp")
+    os.replace(index_path + ".tmp", index_path)
+    _write_docstore(os.path.join(folder, DOCSTORE_FILENAME), db)
+    legacy = os.path.join(folder, LEGACY_DOCSTORE_FILENAME)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convertit un index FAISS au format pickle (index.pkl) "
+                                                 "en index.faiss + docstore.sqlite")
+    parser.add_argument("folder", nargs="?", default="./RAG/cache/faiss_index")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if has_docstore(args.folder):
+        logger.info(f"{args.folder} est déjà au format SQLite.")
+        return
+    # Les vecteurs ne sont pas recalculés : le modèle d'embeddings n'est pas nécessaire à la conversion
+    db = _load_legacy(args.folder, embeddings=None)
+    save_vectorstore(db, args.folder)
+    logger.info(f"{args.folder} converti : {db.index.ntotal} vecteurs.")
+
+
+if __name__ == "__main__":
+    main()
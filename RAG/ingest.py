@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from index_factory import DEFAULT_INDEX_SPEC, TRAIN_SAMPLE_SIZE, needs_training, vectorstore_from_vectors
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# -------------------------------
+# Configuration
+# -------------------------------
+EMBED_BATCH_SIZE = 256  # chunks encodés et ajoutés à l'index par lot
+BULK_EMBED_BATCH_SIZE = 1024  # taille des lots en ingestion multi-documents (un seul modèle pour tous)
+CHECKPOINT_EVERY = 5_000  # vecteurs ajoutés entre deux sauvegardes intermédiaires de l'index
+MAX_BUFFER_MB = 256  # plafond mémoire des tampons de l'ingestion (lot en cours, échantillon d'entraînement)
+_ASSUMED_DIM = 1024  # dimension supposée tant que le premier lot n'est pas encodé
+
+
+class PageSpool:
+    """
+    Pages (ou chunks) d'un document gardés sur disque (JSON Lines) plutôt qu'en mémoire entre deux
+    étapes : s'utilise comme une liste (`append`, `len`, itération relisant le fichier).
+    `path` rouvre un fichier écrit par un autre processus (voir `detach`) ; il est supprimé à la fermeture.
+    """
+
+    def __init__(self, directory: Optional[str] = None, path: Optional[str] = None, count: int = 0):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="pages_", suffix=".jsonl", dir=directory)
+            self._file = os.fdopen(fd, "w", encoding="utf-8")
+        else:
+            self._file = open(path, "a", encoding="utf-8")
+        self.path = path
+        self._count = count
+
+    def append(self, doc: Document):
+        self._file.write(json.dumps({"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+        self._count += 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Document]:
+        self._file.flush()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                yield Document(page_content=item["text"], metadata=item["metadata"])
+
+    def detach(self) -> str:
+        """Ferme le fichier sans le supprimer (pour le transmettre à un autre processus) et retourne son chemin."""
+        self._file.close()
+        return self.path
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@dataclass
+class PreparedDocument:
+    """Un document prêt à être indexé : flux de chunks texte (enrichis) et documents de figures."""
+    doc_path: str
+    key: str
+    content_hash: str
+    chunks: Iterable[Document]
+    figures: List[Document] = field(default_factory=list)
+    pages: int = 0
+
+
+def format_rate(count: int, seconds: float, unit: str) -> str:
+    rate = count / seconds if seconds > 0 else float("inf")
+    return f"{count} {unit} en {seconds:.1f} s ({rate:.1f} {unit}/s)"
+
+
+def _doc_bytes(doc: Document, dim: int) -> int:
+    """Estimation de l'empreinte mémoire d'un chunk en attente (texte + vecteur float32)."""
+    return 2 * len(doc.page_content) + 4 * dim
+
+
+def iter_batches(docs: Iterable[Document], batch_size: int = EMBED_BATCH_SIZE,
+                 max_buffer_mb: float = MAX_BUFFER_MB, dim: int = _ASSUMED_DIM) -> Iterator[List[Document]]:
+    """Regroupe un flux de chunks en lots d'au plus `batch_size` éléments et `max_buffer_mb` Mo."""
+    limit = max_buffer_mb * 1e6
+    batch, size = [], 0
+    for doc in docs:
+        batch.append(doc)
+        size += _doc_bytes(doc, dim)
+        if len(batch) >= batch_size or size >= limit:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+class StreamingIndexWriter:
+    """
+    Ajoute des lots (documents, vecteurs, ids) à un vector store FAISS, existant ou créé à la volée.
+
+    Pour un nouvel index dont le type demande un entraînement (IVF, PQ, OPQ), les premiers lots sont
+    gardés en tampon jusqu'à `train_size` vecteurs ou `max_buffer_mb` Mo, l'index est entraîné sur
+    cet échantillon puis les lots suivants sont ajoutés directement.
+    """
+
+    def __init__(self, embeddings, db: Optional["FAISS"] = None, spec: str = DEFAULT_INDEX_SPEC,
+                 train_size: int = TRAIN_SAMPLE_SIZE, max_buffer_mb: float = MAX_BUFFER_MB):
+        self.embeddings = embeddings
+        self.db = db
+        self.spec = spec
+        self.train_size = train_size
+        self.max_buffer_bytes = max_buffer_mb * 1e6
+        self.added = 0
+        self._pending: List[Tuple[List[Document], np.ndarray, List[str]]] = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+
+    def add(self, docs: Sequence[Document], vectors, ids: Sequence[str]):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.db is not None:
+            self.db.add_embeddings(list(zip((d.page_content for d in docs), vectors.tolist())),
+                                   metadatas=[d.metadata for d in docs], ids=list(ids))
+            self.added += len(docs)
+            return
+        self._pending.append((list(docs), vectors, list(ids)))
+        self._pending_rows += len(docs)
+        self._pending_bytes += sum(_doc_bytes(d, vectors.shape[1]) for d in docs)
+        if (not needs_training(self.spec, vectors.shape[1]) or self._pending_rows >= self.train_size
+                or self._pending_bytes >= self.max_buffer_bytes):
+            self.flush()
+
+    def flush(self):
+        """Crée l'index à partir du tampon (entraînement compris) s'il n'existe pas encore."""
+        if self.db is not None or not self._pending:
+            return
+        docs = [d for batch, _, _ in self._pending for d in batch]
+        vectors = np.concatenate([v for _, v, _ in self._pending])
+        ids = [i for _, _, batch_ids in self._pending for i in batch_ids]
+        self.db = vectorstore_from_vectors(docs, vectors, self.embeddings, ids=ids, spec=self.spec,
+                                           train_size=self.train_size)
+        self.added += len(docs)
+        self._pending, self._pending_rows, self._pending_bytes = [], 0, 0
@@ -0,0 +1,402 @@
+import asyncio
+import concurrent.futures
+import heapq
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from tracing import count
+
+# -------------------------------
+# Configuration (quotas Gemini, surchargeables par variables d'environnement)
+# -------------------------------
+DEFAULT_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", 15))
+DEFAULT_TOKENS_PER_MINUTE = float(os.getenv("GEMINI_TPM", 250_000))
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 120.0  # secondes par requête
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+IMAGE_TOKENS = 258  # coût forfaitaire d'une image pour Gemini
+
+
+# -------------------------------
+# Horloges
+# -------------------------------
+class SystemClock:
+    """Horloge réelle (temps monotone + asyncio.sleep)."""
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, delay: float):
+        await asyncio.sleep(max(0.0, delay))
+
+
+class FakeClock:
+    """
+    Horloge virtuelle pour les tests : `sleep` n'attend pas réellement. Lorsque toutes les tâches
+    prêtes ont tourné, le temps avance jusqu'au prochain réveil. Un test de débit sous quota
+    sur plusieurs minutes s'exécute ainsi en quelques millisecondes.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self._sleepers = []
+        self._seq = 0
+        self._advancer = None
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float):
+        if delay <= 0:
+            await asyncio.sleep(0)
+            return
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        heapq.heappush(self._sleepers, (self.now + delay, self._seq, fut))
+        self._seq += 1
+        if self._advancer is None or self._advancer.done():
+            self._advancer = loop.create_task(self._advance())
+        await fut
+
+    async def _advance(self):
+        while self._sleepers:
+            # Laisser tourner les tâches prêtes avant d'avancer le temps
+            for _ in range(20):
+                await asyncio.sleep(0)
+            wake, _, fut = heapq.heappop(self._sleepers)
+            if fut.done():
+                continue  # attente annulée (ex: délai maximal d'un appel déjà terminé) : le temps n'avance pas
+            self.now = max(self.now, wake)
+            fut.set_result(None)
+
+
+# -------------------------------
+# Limiteur à seau de jetons
+# -------------------------------
+class TokenBucket:
+    """
+    Seau de jetons rechargé à `rate_per_minute` / 60 jetons par seconde, de capacité `capacity`.
+    `acquire` réserve les jetons immédiatement (le solde peut devenir négatif) puis attend
+    le temps nécessaire : les demandeurs sont servis dans l'ordre d'arrivée, sans attente active.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None, clock=None):
+        self.rate = rate_per_minute / 60.0
+        # Par défaut : 10 secondes de budget d'avance (au moins une requête)
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        self.clock = clock or SystemClock()
+        self.tokens = self.capacity
+        self.updated = self.clock.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Réserve `amount` jetons et retourne le délai d'attente (s) avant de pouvoir les utiliser."""
+        with self._lock:
+            now = self.clock.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            await self.clock.sleep(wait)
+        return wait
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+class LLMError(Exception):
+    """Erreur d'appel au LLM ; `status` vaut le code HTTP quand il est connu."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class LLMResponse:
+    """Réponse au format de `google.generativeai` (attribut `text`)."""
+    text: str
+
+
+class GeminiBackend:
+    """Backend Gemini (google.generativeai), appelé via l'API asynchrone du SDK."""
+
+    def __init__(self, model_name: str, api_key: Optional[str] = None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, contents) -> str:
+        response = await self.model.generate_content_async(contents)
+        return response.text
+
+    async def stream(self, contents) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.parts:  # morceaux sans texte (métadonnées de fin, filtrage)
+                yield chunk.text
+
+
+class FakeBackend:
+    """
+    Backend factice hors-ligne : `responder(contents) -> str` calcule la réponse,
+    `latency` (s, sur l'horloge fournie) simule le temps de génération et `failures`
+    est une liste de codes HTTP levés, dans l'ordre, avant les réponses normales.
+    En flux (`stream`), `latency` est le délai avant le premier morceau et `token_latency`
+    le délai entre deux morceaux (un mot par morceau).
+    """
+
+    def __init__(self, responder: Optional[Callable[[Any], str]] = None, latency: float = 0.0, clock=None,
+                 failures: Sequence[int] = (), token_latency: float = 0.0):
+        self.responder = responder or (lambda contents: "ok")
+        self.latency = latency
+        self.token_latency = token_latency
+        self.clock = clock or SystemClock()
+        self.failures = list(failures)
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.started_at: List[float] = []
+
+    async def generate(self, contents) -> str:
+        self.calls += 1
+        self.started_at.append(self.clock.monotonic())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.latency:
+                await self.clock.sleep(self.latency)
+            if self.failures:
+                status = self.failures.pop(0)
+                raise LLMError(f"erreur simulée {status}", status=status)
+            return self.responder(contents)
+        finally:
+            self.active -= 1
+
+    async def stream(self, contents) -> AsyncIterator[str]:
+        text = await self.generate(contents)
+        for i, piece in enumerate(re.split(r"(?<=\s)(?=\S)", text)):
+            if i and self.token_latency:
+                await self.clock.sleep(self.token_latency)
+            yield piece
+
+
+def estimate_tokens(contents) -> int:
+    """Estimation grossière du nombre de jetons d'entrée (≈ 4 caractères par jeton, forfait par image)."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    total = 0
+    for part in parts:
+        if isinstance(part, str):
+            total += len(part) // 4 + 1
+        else:
+            total += IMAGE_TOKENS
+    return total
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    for attr in ("status", "code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Vrai pour les dépassements de quota (429), erreurs serveur (5xx) et délais dépassés."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUS
+
+
+# -------------------------------
+# Client partagé
+# -------------------------------
+class LLMClient:
+    """
+    Client LLM commun à l'ingestion (abréviations, figures) et aux questions :
+      - limitation par seaux de jetons (requêtes/min et jetons/min),
+      - concurrence bornée (`max_concurrency` requêtes en vol),
+      - reprises avec backoff exponentiel (et gigue) sur 429 / 5xx / délai dépassé,
+      - délai maximal par requête.
+    Le backend et l'horloge sont injectables (FakeBackend / FakeClock) pour les tests hors-ligne.
+    """
+
+    def __init__(self, backend, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: Optional[float] = DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, max_retries: int = DEFAULT_MAX_RETRIES,
+                 timeout: float = DEFAULT_TIMEOUT, base_delay: float = 1.0, max_delay: float = 60.0,
+                 clock=None, seed: Optional[int] = None):
+        self.backend = backend
+        self.clock = clock or SystemClock()
+        self.request_bucket = TokenBucket(requests_per_minute, clock=self.clock) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, clock=self.clock) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+        self.stats: Dict[str, float] = {"calls": 0, "retries": 0, "failures": 0, "throttled_s": 0.0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Boucle asyncio propre au client, dans un thread dédié, créée au premier appel synchrone.
+        Elle dure autant que le processus : le SDK Gemini garde un client gRPC lié à la boucle
+        de son premier appel, une nouvelle boucle par appel le casserait (« Event loop is closed »).
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """
+        Exécute une coroutine du client sur sa boucle. Depuis une autre boucle (ex: server.py) :
+        `await asyncio.wrap_future(client.submit(client.agenerate(prompt)))`.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop())
+
+    async def _call_with_timeout(self, contents) -> str:
+        """Appel au backend, annulé si l'horloge du client dépasse `timeout`."""
+        return await self._with_timeout(self.backend.generate(contents))
+
+    async def _with_timeout(self, awaitable):
+        call = asyncio.ensure_future(awaitable)
+        timer = asyncio.ensure_future(self.clock.sleep(self.timeout))
+        try:
+            done, _ = await asyncio.wait({call, timer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            timer.cancel()
+        if call in done:
+            return call.result()
+        call.cancel()
+        raise asyncio.TimeoutError(f"pas de réponse du LLM après {self.timeout:.0f} s")
+
+    async def agenerate(self, contents) -> str:
+        """Un appel limité et repris en cas d'erreur transitoire ; retourne le texte généré."""
+        tokens = estimate_tokens(contents)
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                self.stats["throttled_s"] += await self.request_bucket.acquire(1)
+            if self.token_bucket:
+                self.stats["throttled_s"] += await self.token_bucket.acquire(tokens)
+            self.stats["calls"] += 1
+            count("llm_calls")
+            count("llm_input_tokens", tokens)
+            try:
+                text = await self._call_with_timeout(contents)
+                count("llm_output_tokens", estimate_tokens(text))
+                return text
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * self._random.uniform(0.5, 1.0)
+                await self.clock.sleep(delay)
+
+    async def astream(self, contents) -> AsyncIterator[str]:
+        """
+        Comme `agenerate`, mais produit le texte morceau par morceau dès qu'il arrive.
+        Le délai maximal s'applique à l'attente de chaque morceau ; une erreur transitoire n'est
+        reprise qu'avant le premier morceau (ensuite, le texte déjà produit ne peut être retiré).
+        """
+        tokens = estimate_tokens(contents)
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                self.stats["throttled_s"] += await self.request_bucket.acquire(1)
+            if self.token_bucket:
+                self.stats["throttled_s"] += await self.token_bucket.acquire(tokens)
+            self.stats["calls"] += 1
+            count("llm_calls")
+            count("llm_input_tokens", tokens)
+            stream = self.backend.stream(contents)
+            started = False
+            try:
+                while True:
+                    try:
+                        chunk = await self._with_timeout(stream.__anext__())
+                    except StopAsyncIteration:
+                        return
+                    started = True
+                    count("llm_output_tokens", estimate_tokens(chunk))
+                    yield chunk
+            except Exception as e:
+                if started or attempt >= self.max_retries or not is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * self._random.uniform(0.5, 1.0)
+                await self.clock.sleep(delay)
+            finally:
+                await stream.aclose()
+
+    async def agenerate_many(self, contents_list: Sequence[Any], max_concurrency: Optional[int] = None,
+                             return_exceptions: bool = False) -> List[Any]:
+        """
+        Lance tous les appels en parallèle (concurrence bornée) ; résultats dans l'ordre d'entrée.
+        Un élément peut être une fonction sans argument qui produit le contenu au moment de l'envoi
+        (ex: lecture d'une image), pour ne pas tout garder en mémoire.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+
+        async def _one(contents):
+            async with semaphore:
+                return await self.agenerate(contents() if callable(contents) else contents)
+
+        return await asyncio.gather(*(_one(c) for c in contents_list), return_exceptions=return_exceptions)
+
+    # ---------- API synchrone (pour le code existant) ----------
+    def generate_many(self, contents_list: Sequence[Any], max_concurrency: Optional[int] = None,
+                      return_exceptions: bool = False) -> List[Any]:
+        if not contents_list:
+            return []
+        return self.submit(self.agenerate_many(contents_list, max_concurrency, return_exceptions)).result()
+
+    def generate_content(self, contents) -> LLMResponse:
+        """Même interface que `genai.GenerativeModel.generate_content` (réponse avec `.text`)."""
+        return LLMResponse(text=self.submit(self.agenerate(contents)).result())
+
+    def stream_content(self, contents) -> Iterator[str]:
+        """Version synchrone de `astream` : générateur des morceaux de texte (sur la boucle du client)."""
+        stream = self.astream(contents)
+        try:
+            while True:
+                try:
+                    yield self.submit(stream.__anext__()).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.submit(stream.aclose()).result()
+
+    def stats_line(self) -> str:
+        return (f"LLM : {int(self.stats['calls'])} appel(s), {int(self.stats['retries'])} reprise(s), "
+                f"{int(self.stats['failures'])} échec(s), {self.stats['throttled_s']:.1f} s d'attente de quota")
+
+
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(model_name: str) -> LLMClient:
+    """Client partagé par modèle : toutes les étapes d'un processus se partagent le même quota."""
+    with _clients_lock:
+        if model_name not in _clients:
+            _clients[model_name] = LLMClient(GeminiBackend(model_name))
+        return _clients[model_name]
@@ -1,49 +1,205 @@
 from utils import (
+    EMBEDDING_BACKENDS,
+    MAX_LLM_CONCURRENCY,
+    RETRIEVAL_MODE,
+    pipeline_add_documents,
     pipeline_add_new_document,
-    pipeline_question,
+    pipeline_remove_document,
 )
+from engine import get_engine
+from shards import ShardFilter
+from index_factory import DEFAULT_INDEX_SPEC
+from figures import IMAGE_FORMATS, RenderOptions
+from pdf_pages import DEFAULT_SCAN_WORKERS
+from bm25 import RETRIEVAL_MODES
+from context import CONTEXT_TOKEN_BUDGET
+from answer_cache import ANSWER_SIMILARITY_THRESHOLD
+from tracing import TRACER, span
 import argparse
+import cProfile
+import glob
 import logging
 import os
+import pstats
 import time
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Dépendances lourdes que `import main` ne doit pas charger : chacune est importée à l'étape qui en a besoin
+# (vérifié par Test/test_startup.py et benchmarks/bench_import_time.py)
+HEAVY_MODULES = (
+    "torch", "transformers", "sentence_transformers", "langchain_huggingface", "langchain_community",
+    "langchain_text_splitters", "fitz", "pymupdf", "PyPDF2", "google.generativeai", "faiss",
+)
+
+
+def read_questions_file(path):
+    """Lit un fichier de questions (une par ligne, lignes vides et commentaires '#' ignorés)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def expand_doc_dir(pattern):
+    """Liste les PDF d'un dossier (récursivement) ou correspondant à un motif glob (ex: "rapports/*.pdf")."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "**", "*.pdf")
+    return sorted(p for p in glob.glob(pattern, recursive=True) if p.lower().endswith(".pdf"))
+
 
-def main(docs=None, questions=None, force_reindex=False, k: int = 20):
+def answer_question(engine, q, k: int = 20, search_params=None, stream: bool = True):
+    """Pose une question sur le moteur chaud et journalise la réponse et le temps de réponse.
+
+    `search_params` : paramètres de recherche transmis au moteur (ex: nprobe, ef_search).
+    `stream` : affiche la réponse au fil de la génération et mesure le temps jusqu'au premier morceau (TTFT).
+    """
+    logging.info(f"Question : {q}")
+    start_time = time.time()
+    if stream:
+        timing = {}
+        pieces = []
+        with span("question", stream=True) as record:
+            for chunk in engine.ask_stream(q, k=k, timing=timing, **(search_params or {})):
+                pieces.append(chunk)
+                print(chunk, end="", flush=True)
+            print()
+            record.attrs.update(ttft_s=timing["ttft_s"], total_s=timing["total_s"])
+        logging.info(f"Premier morceau (TTFT) : {timing['ttft_s'] or 0:.2f} s — "
+                     f"temps total : {timing['total_s']:.2f} s ({timing['chunks']} morceaux)")
+        return "".join(pieces)
+    try:
+        with span("question"):
+            answer = engine.ask(q, k=k, **(search_params or {}))
+        logging.info(f"Réponse : {answer}")
+        return answer
+    finally:
+        end_time = time.time()
+        logging.info(f"Temps de réponse : {end_time - start_time:.2f} s")
+
+
+def answer_questions_batch(engine, questions, k: int = 20, max_concurrency: int = MAX_LLM_CONCURRENCY,
+                           search_params=None):
+    """Pose plusieurs questions en lot (un encodage, une recherche FAISS, génération concurrente)."""
+    logging.info(f"{len(questions)} questions en lot (concurrence max : {max_concurrency})")
+    start_time = time.time()
+    try:
+        with span("questions", n=len(questions)):
+            answers = engine.ask_many(questions, k=k, max_concurrency=max_concurrency, **(search_params or {}))
+        for q, answer in zip(questions, answers):
+            logging.info(f"Question : {q}")
+            logging.info(f"Réponse : {answer}")
+        return answers
+    finally:
+        end_time = time.time()
+        logging.info(f"Temps de réponse total : {end_time - start_time:.2f} s "
+                     f"({(end_time - start_time) / len(questions):.2f} s / question)")
+
+
+def interactive_loop(engine, k: int = 20, search_params=None, stream: bool = True):
+    """Boucle interactive (REPL) : toutes les questions partagent le même moteur chargé."""
+    print("Mode interactif — tapez une question (ou 'exit' / Ctrl-D pour quitter).")
+    while True:
+        try:
+            q = input("> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not q:
+            continue
+        if q.lower() in ("exit", "quit", "q"):
+            break
+        try:
+            answer_question(engine, q, k=k, search_params=search_params, stream=stream)
+        except Exception as e:
+            logging.error(f"Erreur : {e}")
+
+
+def run_profiled(func, report_path, *args, **kwargs):
+    """
+    Exécute `func` sous cProfile et écrit `<report_path>.prof` (pour snakeviz / pstats)
+    et `<report_path>.txt` (40 fonctions les plus coûteuses en temps cumulé).
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        profiler.dump_stats(report_path + ".prof")
+        with open(report_path + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        logging.info(f"Profil écrit dans {report_path}.prof et {report_path}.txt")
+
+
+def main(docs=None, questions=None, force_reindex=False, k: int = 20, interactive=False,
+         max_concurrency: int = MAX_LLM_CONCURRENCY, remove_docs=None, index_spec=DEFAULT_INDEX_SPEC,
+         search_params=None, render_options=None, workers: int = DEFAULT_SCAN_WORKERS,
+         answer_cache_threshold=ANSWER_SIMILARITY_THRESHOLD, stream: bool = True):
     """Exécute les actions demandées.
 
-    - docs: liste de chemins PDF à indexer (ou None)
+    - docs: liste de chemins PDF à indexer (ou None) ; à partir de deux, ingestion groupée
     - questions: liste de questions à poser (ou None)
     - force_reindex: recrée l'index FAISS au lieu de l'étendre
     - k: nombre de documents renvoyés par le retriever
+    - interactive: ouvre une boucle de questions sur le moteur chargé une seule fois
+    - max_concurrency: nombre maximal d'appels Gemini simultanés pour les questions en lot
+    - remove_docs: liste de documents (chemin ou nom de fichier) à retirer de l'index
+    - index_spec: type d'index FAISS utilisé à la création (flat, ivf, hnsw, ivfpq, opq)
+    - search_params: paramètres de recherche et de contexte (mode dense/sparse/hybrid, nprobe, ef_search,
+      context_budget, filters : shards.ShardFilter sur les documents ou les années)
+    - render_options: rendu des pages de figures (figures.RenderOptions)
+    - workers: nombre de processus pour la lecture des PDF et le rendu des figures
+    - answer_cache_threshold: similarité cosinus minimale pour réutiliser une réponse en cache (None : cache désactivé)
+    - stream: affiche les réponses au fil de la génération (question unique et mode interactif)
     """
     any_action = False
 
-    # Indexation de documents
-    if docs:
-        for doc_path in docs:
+    # Suppression de documents
+    if remove_docs:
+        for doc_path in remove_docs:
             any_action = True
-            logging.info(f"Ajout d'un document : {doc_path}")
-            pipeline_add_new_document(doc_path, force_reindex)
-            logging.info("Index mis à jour")
+            logging.info(f"Suppression d'un document : {doc_path}")
+            with span("remove_document"):
+                pipeline_remove_document(doc_path)
 
-    # Questions
+    # Indexation de documents (plusieurs documents : ingestion groupée, un seul chargement/sauvegarde de l'index)
+    if docs and len(docs) == 1:
+        any_action = True
+        logging.info(f"Ajout d'un document : {docs[0]}")
+        pipeline_add_new_document(docs[0], force_reindex, index_spec=index_spec,
+                                  render_options=render_options, workers=workers)
+        logging.info("Index mis à jour")
+    elif docs:
+        any_action = True
+        logging.info(f"Ajout de {len(docs)} documents")
+        pipeline_add_documents(docs, force_reindex, index_spec=index_spec,
+                               render_options=render_options, workers=workers)
+        logging.info("Index mis à jour")
+
+    # Questions (un seul moteur : modèle, index et LLM chargés une fois pour toutes les questions)
+    if questions or interactive:
+        engine = get_engine(answer_cache_threshold)
     if questions:
-        for q in questions:
-            any_action = True
-            logging.info(f"Question : {q}")
-            start_time = time.time()
-            try:
-                answer = pipeline_question(q, k=k)
-                logging.info(f"Réponse : {answer}")
-            finally:
-                end_time = time.time()
-                logging.info(f"Temps de réponse : {end_time - start_time:.2f} s")
+        any_action = True
+        if len(questions) == 1:
+            answer_question(engine, questions[0], k=k, search_params=search_params, stream=stream)
+        else:
+            answer_questions_batch(engine, questions, k=k, max_concurrency=max_concurrency,
+                                   search_params=search_params)
+
+    if interactive:
+        any_action = True
+        interactive_loop(engine, k=k, search_params=search_params, stream=stream)
+
+    if (questions or interactive) and engine.answer_cache is not None:
+        logging.info(engine.answer_cache.stats())
+        engine.answer_cache.close()
+
+    if any_action and TRACER.spans:
+        logging.info("Temps par étape :")
+        TRACER.log_summary()
 
     if not any_action:
-        logging.warning("Aucune action demandée. Utilisez --doc et/ou --question. Voir --help.")
+        logging.warning("Aucune action demandée. Utilisez --doc, --remove-doc, --question, --questions-file ou --interactive. Voir --help.")
 
 
 if __name__ == "__main__":
@@ -52,10 +208,26 @@ if __name__ == "__main__":
         "-d", "--doc", action="append", default=None,
         help="Chemin vers un PDF à indexer (répéter l'option pour plusieurs documents)",
     )
+    parser.add_argument(
+        "--doc-dir", action="append", default=None,
+        help="Dossier (parcouru récursivement) ou motif glob de PDF à indexer en une seule passe (répétable)",
+    )
+    parser.add_argument(
+        "--remove-doc", action="append", default=None,
+        help="Retirer de l'index les vecteurs d'un document déjà ingéré (chemin ou nom de fichier, répétable)",
+    )
     parser.add_argument(
         "-q", "--question", action="append", default=None,
         help="Question à poser (répéter l'option pour plusieurs questions)",
     )
+    parser.add_argument(
+        "--questions-file", default=None,
+        help="Fichier texte de questions à poser (une par ligne) sur un moteur chargé une seule fois",
+    )
+    parser.add_argument(
+        "-i", "--interactive", action="store_true",
+        help="Mode interactif : poser des questions en boucle sans recharger modèle ni index",
+    )
     parser.add_argument(
         "--force-reindex", action="store_true",
         help="Forcer la recréation de l'index FAISS (écrase l'existant)",
@@ -64,12 +236,141 @@ if __name__ == "__main__":
         "-k", type=int, default=20,
         help="Nombre de documents retournés par le retriever (k)",
     )
+    parser.add_argument(
+        "--index-spec", default=DEFAULT_INDEX_SPEC,
+        help="Type d'index FAISS à la création : flat (exact), ivf, hnsw, ivfpq, opq ou chaîne faiss.index_factory",
+    )
+    parser.add_argument(
+        "--retrieval-mode", choices=list(RETRIEVAL_MODES), default=RETRIEVAL_MODE,
+        help="Recherche dense (FAISS), sparse (BM25) ou hybrid (fusion RRF des deux)",
+    )
+    parser.add_argument(
+        "--context-budget", type=int, default=CONTEXT_TOKEN_BUDGET,
+        help="Jetons de contexte envoyés à Gemini après fusion des chunks voisins et retrait des doublons (0 : contexte brut)",
+    )
+    parser.add_argument(
+        "--answer-cache-threshold", type=float, default=ANSWER_SIMILARITY_THRESHOLD,
+        help="Similarité cosinus minimale pour resservir la réponse d'une question déjà posée",
+    )
+    parser.add_argument(
+        "--no-answer-cache", action="store_true",
+        help="Désactiver le cache sémantique des réponses",
+    )
+    parser.add_argument(
+        "--nprobe", type=int, default=None,
+        help="Index IVF : nombre de listes visitées à la recherche (rappel vs latence)",
+    )
+    parser.add_argument(
+        "--ef-search", type=int, default=None,
+        help="Index HNSW : taille de la file de recherche (rappel vs latence)",
+    )
+    parser.add_argument(
+        "--filter-doc", action="append", default=None,
+        help="Ne chercher que dans ce document (nom de fichier ; option répétable)",
+    )
+    parser.add_argument(
+        "--filter-year", type=int, action="append", default=None,
+        help="Ne chercher que dans les rapports de cette année (option répétable)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_SCAN_WORKERS,
+        help="Nombre de processus pour la lecture du PDF et le rendu des pages de figures",
+    )
+    parser.add_argument(
+        "--figure-format", choices=list(IMAGE_FORMATS), default="png",
+        help="Format des images de figures (webp nécessite Pillow)",
+    )
+    parser.add_argument(
+        "--figure-dpi", type=float, default=RenderOptions.dpi,
+        help="Résolution de rendu des pages de figures",
+    )
+    parser.add_argument(
+        "--figure-max-pixels", type=int, default=None,
+        help="Plafond du nombre de pixels d'une image de figure (la résolution est réduite au besoin)",
+    )
+    parser.add_argument(
+        "--figure-clip", action="store_true",
+        help="Ne rendre que la zone des tracés vectoriels (avec une marge) au lieu de la page entière",
+    )
+    parser.add_argument(
+        "--embedding-backend", choices=list(EMBEDDING_BACKENDS), default=None,
+        help="Encodage des embeddings : torch (fp32, défaut), int8 (quantifié dynamiquement) ou onnx (ONNX Runtime)",
+    )
+    parser.add_argument(
+        "--embedding-batch-size", type=int, default=None,
+        help="Nombre de textes encodés par lot (32 par défaut)",
+    )
+    parser.add_argument(
+        "--embedding-threads", type=int, default=None,
+        help="Threads CPU de l'encodeur (par défaut : tous les cœurs)",
+    )
+    parser.add_argument(
+        "--no-e5-prefixes", action="store_true",
+        help="Ne pas ajouter les préfixes e5 « query: » / « passage: » (index construits sans préfixes)",
+    )
+    parser.add_argument(
+        "--no-stream", action="store_true",
+        help="Attendre la réponse complète au lieu de l'afficher au fil de la génération",
+    )
+    parser.add_argument(
+        "--metrics", default=None,
+        help="Fichier JSON Lines où écrire une ligne par étape (durée, compteurs, pic mémoire)",
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="Mesurer le pic d'allocations Python de chaque étape (tracemalloc, ralentit l'exécution)",
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="./RAG/log/profile", default=None,
+        help="Exécuter sous cProfile et écrire le rapport (<chemin>.prof et <chemin>.txt)",
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=MAX_LLM_CONCURRENCY,
+        help="Nombre maximal d'appels Gemini simultanés quand plusieurs questions sont posées",
+    )
 
     args = parser.parse_args()
 
+    docs = list(args.doc or [])
+    for pattern in args.doc_dir or []:
+        found = expand_doc_dir(pattern)
+        if not found:
+            logging.warning(f"Aucun PDF trouvé pour {pattern}")
+        docs.extend(found)
+
+    questions = list(args.question or [])
+    if args.questions_file:
+        questions.extend(read_questions_file(args.questions_file))
+
     # Petit rappel sur GEMINI_API_KEY si la personne va poser des questions
-    if args.question and not os.getenv("GEMINI_API_KEY"):
+    if (questions or args.interactive) and not os.getenv("GEMINI_API_KEY"):
         logging.warning("GEMINI_API_KEY n'est pas défini (les questions risquent d'échouer)")
 
-    main(docs=args.doc, questions=args.question, force_reindex=args.force_reindex, k=args.k)
+    TRACER.configure(output=args.metrics, trace_memory=args.trace_memory)
+    embedding_changes = {name: value for name, value in (("backend", args.embedding_backend),
+                                                         ("batch_size", args.embedding_batch_size),
+                                                         ("threads", args.embedding_threads)) if value}
+    if args.no_e5_prefixes:
+        embedding_changes["e5_prefixes"] = False
+    if embedding_changes:
+        from embedding_backends import configure_embeddings  # langchain_core.embeddings : seulement si besoin
+
+        configure_embeddings(**embedding_changes)
+    run_kwargs = dict(
+        docs=docs or None, questions=questions or None, force_reindex=args.force_reindex, k=args.k,
+        interactive=args.interactive, max_concurrency=args.max_concurrency,
+        remove_docs=args.remove_doc, index_spec=args.index_spec,
+        search_params={"nprobe": args.nprobe, "ef_search": args.ef_search, "mode": args.retrieval_mode,
+                       "context_budget": args.context_budget or None,
+                       "filters": ShardFilter.create(args.filter_doc or (), args.filter_year or ())},
+        render_options=RenderOptions(dpi=args.figure_dpi, max_pixels=args.figure_max_pixels,
+                                     clip_to_drawings=args.figure_clip, image_format=args.figure_format),
+        workers=args.workers,
+        answer_cache_threshold=None if args.no_answer_cache else args.answer_cache_threshold,
+        stream=not args.no_stream,
+    )
+    if args.profile:
+        run_profiled(main, args.profile, **run_kwargs)
+    else:
+        main(**run_kwargs)
 
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Empreinte SHA-256 du contenu d'un fichier (lu par blocs)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def document_key(doc_path: str) -> str:
+    """
+    Clé d'un document dans le manifeste : son nom de fichier (comme pour le dossier des figures).
+    Deux fichiers de même nom dans des dossiers différents ont donc la même clé (voir `duplicate_keys`).
+    """
+    return os.path.basename(doc_path)
+
+
+def duplicate_keys(doc_paths) -> Dict[str, List[str]]:
+    """Clés partagées par plusieurs fichiers distincts de `doc_paths` -> ces fichiers."""
+    paths_by_key: Dict[str, Dict[str, str]] = {}
+    for doc_path in doc_paths:
+        paths_by_key.setdefault(document_key(doc_path), {}).setdefault(os.path.realpath(doc_path), doc_path)
+    return {key: list(paths.values()) for key, paths in paths_by_key.items() if len(paths) > 1}
+
+
+def vector_id(content_hash: str, rank: int) -> str:
+    """Identifiant déterministe d'un vecteur d'un document : `<hash court>:<rang>`."""
+    return f"{content_hash[:16]}:{rank}"
+
+
+class IndexManifest:
+    """
+    Manifeste de l'index FAISS (`manifest.json` à côté de `index.faiss`) :
+    pour chaque document ingéré, son empreinte de contenu et les ids de ses vecteurs
+    (chunks texte et figures). Il permet de ne pas ré-ingérer un fichier inchangé,
+    de remplacer uniquement les vecteurs d'un fichier modifié et d'en supprimer un.
+    """
+
+    def __init__(self, index_path: str):
+        self.path = os.path.join(index_path, MANIFEST_FILENAME)
+        self.documents: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.documents = json.load(f).get("documents", {})
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.documents.get(key)
+
+    def is_unchanged(self, key: str, content_hash: str) -> bool:
+        """Vrai si le document a été entièrement ingéré avec ce contenu (une ingestion interrompue ne compte pas)."""
+        entry = self.documents.get(key)
+        return entry is not None and entry.get("sha256") == content_hash and entry.get("complete", True)
+
+    def record(self, key: str, doc_path: str, content_hash: str, ids: List[str], complete: bool = True):
+        """`complete=False` enregistre un point de reprise : les ids déjà présents dans l'index sauvegardé."""
+        self.documents[key] = {
+            "path": doc_path,
+            "sha256": content_hash,
+            "ids": list(ids),
+            "complete": complete,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def remove(self, key: str) -> List[str]:
+        """Retire un document du manifeste et retourne les ids de ses vecteurs."""
+        entry = self.documents.pop(key, None)
+        return list(entry["ids"]) if entry else []
+
+    def clear(self):
+        self.documents = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"documents": self.documents}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,130 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+# -------------------------------
+# Configuration
+# -------------------------------
+MIN_DRAWING_ELEMENTS = 15  # nombre minimal de tracés vectoriels pour qu'une page soit candidate "figure"
+FIGURE_KEYWORD = "figure"
+DEFAULT_SCAN_WORKERS = max(1, min(4, os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = 32  # en dessous, le coût de démarrage des processus n'est pas rentable
+
+
+@dataclass
+class PdfPage:
+    """Une page extraite en un seul passage : texte, nombre de tracés et indicateur de figure."""
+    number: int  # numéro de page (à partir de 1)
+    total_pages: int
+    text: str
+    drawing_count: Optional[int]  # None si les tracés n'ont pas été comptés (pas de mot-clé « figure »)
+    is_figure_candidate: bool
+    drawings_bbox: Optional[Tuple[float, float, float, float]] = None  # zone englobant les tracés
+    rendered: Optional[Any] = None  # résultat du rendu de la page (voir `on_figure_page`)
+    # Page PyMuPDF ouverte (pour le rendu en image) : valide uniquement pendant l'itération en série
+    handle: Optional[Any] = field(default=None, repr=False, compare=False)
+
+    def metadata(self, pdf_path: str) -> dict:
+        """Métadonnées compatibles avec celles de PyMuPDFLoader (page numérotée à partir de 0)."""
+        return {
+            "source": pdf_path,
+            "file_path": pdf_path,
+            "page": self.number - 1,
+            "total_pages": self.total_pages,
+        }
+
+
+def _scan_page(page, number: int, total: int, min_elements: int,
+               on_figure_page: Optional[Callable]) -> PdfPage:
+    text = page.get_text()
+    drawing_count = None
+    bbox = None
+    candidate = False
+    # Filtre le moins coûteux d'abord : le mot-clé, puis seulement le comptage des tracés vectoriels
+    if FIGURE_KEYWORD in text.lower():
+        drawings = page.get_drawings()
+        drawing_count = len(drawings)
+        if drawing_count >= min_elements:
+            candidate = True
+            import fitz  # PyMuPDF (déjà chargé : la page vient d'un document ouvert)
+
+            rect = fitz.Rect()
+            for d in drawings:
+                rect |= d["rect"]
+            bbox = tuple(rect)
+    record = PdfPage(
+        number=number,
+        total_pages=total,
+        text=text,
+        drawing_count=drawing_count,
+        is_figure_candidate=candidate,
+        drawings_bbox=bbox,
+        handle=page,
+    )
+    if candidate and on_figure_page is not None:
+        record.rendered = on_figure_page(page, record)
+    return record
+
+
+def iter_pdf_pages(pdf_path: str, min_elements: int = MIN_DRAWING_ELEMENTS, workers: int = 1,
+                   on_figure_page: Optional[Callable] = None) -> Iterator[PdfPage]:
+    """
+    Produit les pages du PDF une par une, dans l'ordre ; chaque page n'est lue qu'une fois :
+    le découpage, l'extraction des abréviations et la détection des figures consomment tous ce flux.
+
+    - `workers` > 1 répartit les plages de pages entre plusieurs processus (pour les documents
+      d'au moins PARALLEL_MIN_PAGES pages) ; chaque processus ouvre le fichier une fois.
+    - `on_figure_page(page_pymupdf, record)` est appelé pour chaque page candidate pendant que la page
+      est ouverte (ex: rendu en image) et son résultat est placé dans `record.rendered`.
+      En mode parallèle il doit être sérialisable (fonction ou objet de module).
+
+    Le fichier est ouvert dès l'appel (une erreur d'ouverture est levée immédiatement).
+    """
+    import fitz  # PyMuPDF, chargé seulement à l'ingestion
+
+    doc = fitz.open(pdf_path)
+    total = len(doc)
+    if workers <= 1 or total < PARALLEL_MIN_PAGES:
+        return _iter_pages(doc, min_elements, on_figure_page)
+    doc.close()
+    return _iter_pages_parallel(pdf_path, total, min_elements, workers, on_figure_page)
+
+
+def _iter_pages(doc, min_elements: int, on_figure_page: Optional[Callable]) -> Iterator[PdfPage]:
+    try:
+        total = len(doc)
+        for i, page in enumerate(doc):
+            yield _scan_page(page, i + 1, total, min_elements, on_figure_page)
+    finally:
+        doc.close()
+
+
+def _scan_range(pdf_path: str, start: int, stop: int, min_elements: int,
+                on_figure_page: Optional[Callable]) -> List[PdfPage]:
+    """Exécuté dans un processus : analyse les pages [start, stop) d'un PDF."""
+    import fitz
+
+    doc = fitz.open(pdf_path)
+    try:
+        total = len(doc)
+        pages = []
+        for i in range(start, stop):
+            record = _scan_page(doc[i], i + 1, total, min_elements, on_figure_page)
+            record.handle = None  # une page PyMuPDF ne traverse pas les processus
+            pages.append(record)
+        return pages
+    finally:
+        doc.close()
+
+
+def _iter_pages_parallel(pdf_path: str, total: int, min_elements: int, workers: int,
+                         on_figure_page: Optional[Callable]) -> Iterator[PdfPage]:
+    # Plusieurs plages par processus pour équilibrer la charge (les pages de figures coûtent plus cher)
+    size = max(1, math.ceil(total / (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_scan_range, pdf_path, start, min(start + size, total), min_elements, on_figure_page)
+                   for start in range(0, total, size)]
+        for future in futures:
+            yield from future.result()
@@ -0,0 +1,347 @@
+"""
+Service HTTP asynchrone (aiohttp) sur le moteur RAG résident : modèle d'embeddings, shards de l'index
+et client LLM chargés une seule fois pour toutes les requêtes.
+
+  - POST /ask     {"question": "...", "k": 20, "mode": "hybrid", "documents": [...], "years": [...]}
+  - GET  /metrics profondeur de la file, histogramme des tailles de lots, latences p50/p95/p99
+  - GET  /health
+
+Les questions arrivées à quelques millisecondes d'intervalle (`BATCH_WINDOW_MS`) sont regroupées :
+un seul passage du modèle d'embeddings et une seule recherche FAISS multi-requêtes par lot
+(RagEngine.retrieve_many), puis une génération par question (au plus `MAX_LLM_CONCURRENCY` appels
+simultanés). File bornée : au-delà de `MAX_QUEUE_SIZE` questions en attente de recherche, ou de
+`MAX_IN_FLIGHT` requêtes en cours, le service répond 503 (Retry-After) au lieu d'accumuler du retard.
+
+    python RAG/server.py --port 8080
+    python benchmarks/bench_service.py            # test de charge local, LLM factice
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from answer_cache import ANSWER_SIMILARITY_THRESHOLD, AnswerCache
+from bm25 import RETRIEVAL_MODES
+from context import CONTEXT_TOKEN_BUDGET
+from engine import RagEngine, Retrieval
+from shards import ShardFilter
+from utils import MAX_LLM_CONCURRENCY, RETRIEVAL_MODE, build_prompt, generate_answer
+
+# -------------------------------
+# Configuration
+# -------------------------------
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+BATCH_WINDOW_MS = 5.0  # attente maximale après la première question d'un lot
+MAX_BATCH_SIZE = 64  # questions encodées et cherchées ensemble
+MAX_QUEUE_SIZE = 256  # questions en attente de recherche avant de refuser (503)
+MAX_IN_FLIGHT = 512  # requêtes en cours (recherche + génération) avant de refuser (503)
+LATENCY_WINDOW = 10_000  # dernières latences gardées pour les percentiles
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """File pleine : la requête est refusée (HTTP 503) plutôt que mise en attente."""
+
+
+class ServiceMetrics:
+    """Compteurs, histogramme des tailles de lots et latences récentes exposés par /metrics."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.counters: Dict[str, int] = {"requests": 0, "answered": 0, "cached": 0, "rejected": 0, "errors": 0,
+                                         "batches": 0, "batched_questions": 0}
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.latencies: Dict[str, deque] = {name: deque(maxlen=window)
+                                            for name in ("queue", "retrieval", "generation", "total")}
+
+    def observe_batch(self, size: int):
+        self.counters["batches"] += 1
+        self.counters["batched_questions"] += size
+        self.batch_sizes[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+
+    def observe(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+
+    def snapshot(self) -> Dict:
+        histogram = {f"le_{bound}": n for bound, n in zip(BATCH_SIZE_BUCKETS, self.batch_sizes)}
+        histogram[f"gt_{BATCH_SIZE_BUCKETS[-1]}"] = self.batch_sizes[-1]
+        latencies = {}
+        for name, samples in self.latencies.items():
+            if samples:
+                ms = np.asarray(samples) * 1000
+                latencies[name] = {"count": len(ms), "p50_ms": float(np.percentile(ms, 50)),
+                                   "p95_ms": float(np.percentile(ms, 95)), "p99_ms": float(np.percentile(ms, 99))}
+        batches = self.counters["batches"]
+        return {"counters": dict(self.counters), "batch_size_histogram": histogram,
+                "mean_batch_size": self.counters["batched_questions"] / batches if batches else 0.0,
+                "latency": latencies}
+
+
+@dataclass
+class _Pending:
+    question: str
+    params: tuple
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """
+    Regroupe les questions concurrentes : le premier élément d'un lot attend au plus `window_ms` les
+    suivants (ou `max_batch_size` questions), puis le lot est encodé et cherché en une fois dans un thread.
+    Pendant qu'un lot est traité, les nouvelles questions s'accumulent : plus la charge est forte,
+    plus les lots sont grands.
+    """
+
+    def __init__(self, engine: RagEngine, metrics: ServiceMetrics, window_ms: float = BATCH_WINDOW_MS,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_queue_size: int = MAX_QUEUE_SIZE):
+        self.engine = engine
+        self.metrics = metrics
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        # Un seul lot à la fois : l'encodage et FAISS utilisent déjà tous les cœurs
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    def submit(self, question: str, params: tuple) -> asyncio.Future:
+        """Met la question en file ; lève Overloaded si la file est pleine."""
+        pending = _Pending(question, params, asyncio.get_running_loop().create_future())
+        try:
+            self.queue.put_nowait(pending)
+        except asyncio.QueueFull:
+            raise Overloaded(f"file de recherche pleine ({self.queue.maxsize} questions en attente)") from None
+        return pending.future
+
+    async def _collect(self) -> List[_Pending]:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.metrics.observe_batch(len(batch))
+            start = time.perf_counter()
+            for item in batch:
+                self.metrics.observe("queue", start - item.enqueued)
+            # Une recherche en lot par jeu de paramètres (en pratique, un seul)
+            groups: Dict[tuple, List[_Pending]] = {}
+            for item in batch:
+                groups.setdefault(item.params, []).append(item)
+            for params, items in groups.items():
+                try:
+                    retrieval = await loop.run_in_executor(self._executor, self._retrieve, items, params)
+                except Exception as e:
+                    for item in items:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                    continue
+                for i, item in enumerate(items):
+                    if not item.future.done():  # requête abandonnée par le client
+                        item.future.set_result((retrieval, i))
+            elapsed = time.perf_counter() - start
+            for _ in batch:
+                self.metrics.observe("retrieval", elapsed)
+
+    def _retrieve(self, items: List[_Pending], params: tuple) -> Retrieval:
+        k, mode, nprobe, ef_search, context_budget, filters = params
+        return self.engine.retrieve_many([item.question for item in items], k=k, mode=mode, nprobe=nprobe,
+                                         ef_search=ef_search, context_budget=context_budget, filters=filters)
+
+
+class RagService:
+    """Application aiohttp : micro-batching de la recherche, génération concurrente bornée, métriques."""
+
+    def __init__(self, engine: RagEngine, window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_queue_size: int = MAX_QUEUE_SIZE, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_concurrency: int = MAX_LLM_CONCURRENCY):
+        self.engine = engine
+        self.metrics = ServiceMetrics()
+        self.batcher_options = dict(window_ms=window_ms, max_batch_size=max_batch_size, max_queue_size=max_queue_size)
+        self.batcher: Optional[MicroBatcher] = None
+        self.max_in_flight = max_in_flight
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="llm")
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/ask", self.handle_ask)
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        self.batcher = MicroBatcher(self.engine, self.metrics, **self.batcher_options)
+        self._llm_slots = asyncio.Semaphore(max(1, self.max_concurrency))
+        self.batcher.start()
+        # Modèle d'embeddings et shards chargés avant la première requête
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.batcher._executor, self._warm_up)
+
+    def _warm_up(self):
+        try:
+            self.engine.get_index()
+            self.engine._embed_questions(["préchargement"])
+        except ValueError as e:
+            logger.warning(f"Index non chargé au démarrage : {e}")
+
+    async def _on_cleanup(self, app):
+        await self.batcher.stop()
+        self._executor.shutdown(wait=False)
+        self.engine.close()
+
+    @staticmethod
+    def parse_params(body: Dict) -> tuple:
+        """Paramètres de recherche d'une requête, dans l'ordre attendu par MicroBatcher._retrieve."""
+        mode = body.get("mode", RETRIEVAL_MODE)
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Mode de recherche inconnu : {mode} (attendu : {', '.join(RETRIEVAL_MODES)})")
+        budget = body.get("context_budget", CONTEXT_TOKEN_BUDGET)
+        filters = ShardFilter.create(body.get("documents") or (), body.get("years") or ())
+        return (int(body.get("k", 20)), mode, body.get("nprobe"), body.get("ef_search"),
+                int(budget) if budget else None, filters)
+
+    async def _generate(self, question: str, docs, context_budget: Optional[int]) -> str:
+        llm = self.engine.llm
+        async with self._llm_slots:
+            if hasattr(llm, "submit"):
+                # Client partagé (llm_client.LLMClient) : quota et reprises, sur la boucle du client
+                # (le SDK Gemini reste lié à une seule boucle), sans bloquer celle du service
+                prompt = build_prompt(docs, question, context_budget)
+                return await asyncio.wrap_future(llm.submit(llm.agenerate(prompt)))
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, generate_answer, llm, docs, question, context_budget)
+
+    async def answer(self, question: str, params: tuple) -> Dict:
+        """Recherche (en lot avec les questions concurrentes) puis génération d'une réponse."""
+        start = time.perf_counter()
+        retrieval, i = await self.batcher.submit(question, params)
+        cached = retrieval.answers[i] is not None
+        if cached:
+            answer = retrieval.answers[i]
+            self.metrics.counters["cached"] += 1
+        else:
+            generation_start = time.perf_counter()
+            answer = await self._generate(question, retrieval.docs[i], params[4])
+            self.metrics.observe("generation", time.perf_counter() - generation_start)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.engine.remember, retrieval, [i], [answer])
+        latency = time.perf_counter() - start
+        self.metrics.observe("total", latency)
+        sources = [{"document": d.metadata.get("document"), "page": d.metadata.get("page")}
+                   for d in retrieval.docs[i]]
+        return {"answer": answer, "cached": cached, "sources": sources, "latency_ms": latency * 1000}
+
+    async def handle_ask(self, request: web.Request) -> web.Response:
+        self.metrics.counters["requests"] += 1
+        if self.in_flight >= self.max_in_flight:
+            self.metrics.counters["rejected"] += 1
+            return _overloaded(f"{self.in_flight} requêtes en cours")
+        try:
+            body = await request.json()
+            question = str(body["question"]).strip()
+            if not question:
+                raise ValueError("question vide")
+            params = self.parse_params(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.metrics.counters["errors"] += 1
+            return web.json_response({"error": f"requête invalide : {e}"}, status=400)
+
+        self.in_flight += 1
+        try:
+            result = await self.answer(question, params)
+        except Overloaded as e:
+            self.metrics.counters["rejected"] += 1
+            return _overloaded(str(e))
+        except Exception as e:
+            self.metrics.counters["errors"] += 1
+            logger.exception("Erreur pendant la réponse")
+            return web.json_response({"error": str(e)}, status=500)
+        finally:
+            self.in_flight -= 1
+        self.metrics.counters["answered"] += 1
+        return web.json_response(result)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        snapshot = self.metrics.snapshot()
+        snapshot["queue_depth"] = self.batcher.queue.qsize() if self.batcher else 0
+        snapshot["in_flight"] = self.in_flight
+        return web.json_response(snapshot)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+
+def _overloaded(reason: str) -> web.Response:
+    return web.json_response({"error": f"service surchargé : {reason}"}, status=503, headers={"Retry-After": "1"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP de questions-réponses sur le moteur RAG résident")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="Attente maximale pour regrouper les questions concurrentes")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE_SIZE,
+                        help="Questions en attente de recherche au-delà desquelles le service répond 503")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    parser.add_argument("--max-concurrency", type=int, default=MAX_LLM_CONCURRENCY,
+                        help="Appels LLM simultanés")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Désactiver le cache sémantique des réponses")
+    parser.add_argument("--no-e5-prefixes", action="store_true",
+                        help="Ne pas ajouter les préfixes e5 « query: » (index construits sans préfixes)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.no_e5_prefixes:
+        from embedding_backends import configure_embeddings
+
+        configure_embeddings(e5_prefixes=False)
+
+    cache = None if args.no_answer_cache else AnswerCache(threshold=ANSWER_SIMILARITY_THRESHOLD)
+    service = RagService(RagEngine(answer_cache=cache), window_ms=args.batch_window_ms,
+                         max_batch_size=args.max_batch_size, max_queue_size=args.max_queue,
+                         max_in_flight=args.max_in_flight, max_concurrency=args.max_concurrency)
+    web.run_app(service.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Index découpé en shards (dossier `RAG/cache/faiss_index`) :
+  - `shards.json`    : registre des shards (dossier, documents avec empreinte et année, nombre de vecteurs,
+                       identifiant des embeddings utilisés, ex: "intfloat/multilingual-e5-base@torch+e5"),
+  - `shards/<nom>/`  : un shard par document, au format complet d'un index (index.faiss, docstore.sqlite,
+                       bm25.json, manifest.json).
+
+Ajouter, modifier ou retirer un rapport ne réécrit que son shard. Une question est cherchée en parallèle
+dans les shards retenus par les filtres (FAISS relâche le GIL pendant la recherche), puis les top-k de
+chaque shard sont fusionnés par tas : la latence dépend du nombre de cœurs plus que de la taille du corpus.
+
+Un index créé avant le découpage (fichiers à la racine du dossier) est lu comme un shard unique, `main` ;
+ses documents en sortent un par un lorsqu'ils sont ré-ingérés ou supprimés.
+"""
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from bm25 import BM25_FILENAME, BM25Index
+from index_factory import set_search_params
+from index_store import DOCSTORE_FILENAME, INDEX_FILENAME, LEGACY_DOCSTORE_FILENAME, open_vectorstore
+from manifest import MANIFEST_FILENAME, IndexManifest, document_key
+from tracing import count, span
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# -------------------------------
+# Configuration
+# -------------------------------
+REGISTRY_FILENAME = "shards.json"
+SHARDS_DIRNAME = "shards"
+LEGACY_SHARD = "main"  # index non découpé, à la racine du dossier
+SEARCH_THREADS = os.cpu_count() or 1  # shards cherchés simultanément
+FILTER_OVERSAMPLE = 4  # candidats cherchés en plus dans un shard dont seule une partie des documents est retenue
+
+INDEX_FILES = (INDEX_FILENAME, DOCSTORE_FILENAME, LEGACY_DOCSTORE_FILENAME, BM25_FILENAME, MANIFEST_FILENAME)
+_YEAR = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+
+logger = logging.getLogger(__name__)
+
+
+def document_year(doc_path: str) -> Optional[int]:
+    """Année d'un rapport : dans son nom de fichier (« rapport-JOP-2024.pdf »), sinon date de création du PDF."""
+    match = _YEAR.search(os.path.basename(doc_path))
+    if match:
+        return int(match.group(1))
+    if not os.path.exists(doc_path):
+        return None
+    try:
+        import fitz
+
+        with fitz.open(doc_path) as pdf:
+            created = re.match(r"D:(\d{4})", (pdf.metadata or {}).get("creationDate") or "")
+    except Exception:
+        return None  # PDF illisible : pas d'année
+    return int(created.group(1)) if created else None
+
+
+def legacy_index_exists(folder: str) -> bool:
+    return any(os.path.exists(os.path.join(folder, name)) for name in (INDEX_FILENAME, LEGACY_DOCSTORE_FILENAME))
+
+
+def files_signature(folder: str, names: Optional[Sequence[str]] = None) -> Optional[Tuple]:
+    """Empreinte (nom, taille, mtime) des fichiers d'un dossier (ou des seuls `names`), None s'il n'existe pas."""
+    if not os.path.isdir(folder):
+        return None
+    signature = []
+    for name in sorted(os.listdir(folder) if names is None else names):
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            signature.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+@dataclass(frozen=True)
+class ShardFilter:
+    """Limite une question à certains documents (nom de fichier) et/ou années ; vide : tout l'index."""
+    documents: Tuple[str, ...] = ()
+    years: Tuple[int, ...] = ()
+
+    @classmethod
+    def create(cls, documents: Iterable[str] = (), years: Iterable[int] = ()) -> Optional["ShardFilter"]:
+        shard_filter = cls(tuple(sorted({document_key(d) for d in documents})), tuple(sorted({int(y) for y in years})))
+        return shard_filter if shard_filter else None
+
+    def __bool__(self) -> bool:
+        return bool(self.documents or self.years)
+
+    def matches(self, key: str, year: Optional[int]) -> bool:
+        return (not self.documents or key in self.documents) and (not self.years or year in self.years)
+
+    def cache_key(self) -> str:
+        return f"docs={','.join(self.documents)};years={','.join(map(str, self.years))}"
+
+
+class ShardRegistry:
+    """Registre des shards (`shards.json`) ; sans registre, un index non découpé est le shard `main`."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, REGISTRY_FILENAME)
+        self.shards: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.shards = json.load(f).get("shards", {})
+        elif legacy_index_exists(root):
+            self.shards[LEGACY_SHARD] = {"path": ".", **self._describe(IndexManifest(root))}
+
+    @staticmethod
+    def _describe(manifest: IndexManifest) -> Dict:
+        documents = {key: {"sha256": entry.get("sha256"), "year": document_year(entry.get("path") or key),
+                           "complete": entry.get("complete", True)}
+                     for key, entry in manifest.documents.items()}
+        return {"documents": documents, "vectors": sum(len(e["ids"]) for e in manifest.documents.values()),
+                "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+    def shard_path(self, name: str) -> str:
+        entry = self.shards.get(name)
+        if entry is None:
+            return os.path.join(self.root, SHARDS_DIRNAME, name)
+        return os.path.normpath(os.path.join(self.root, entry["path"]))
+
+    def shard_of(self, key: str) -> Optional[str]:
+        return next((name for name, entry in self.shards.items() if key in entry["documents"]), None)
+
+    def is_unchanged(self, key: str, content_hash: str) -> bool:
+        """Vrai si le document a été entièrement ingéré avec ce contenu (comme IndexManifest.is_unchanged)."""
+        name = self.shard_of(key)
+        entry = self.shards[name]["documents"][key] if name else None
+        return entry is not None and entry.get("sha256") == content_hash and entry.get("complete", True)
+
+    def is_shared(self, name: str) -> bool:
+        """Vrai pour le shard de l'index d'avant le découpage, qui peut contenir plusieurs documents."""
+        return self.shards[name]["path"] == "."
+
+    @staticmethod
+    def new_shard_name(key: str) -> str:
+        """Nom de dossier stable pour le shard d'un document : nom lisible + empreinte courte de la clé."""
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "-", os.path.splitext(key)[0]).strip("-")[:40] or "document"
+        return f"{slug}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+
+    def record(self, name: str, manifest: IndexManifest, embeddings_key: Optional[str] = None):
+        """Met à jour l'entrée d'un shard depuis son manifeste et l'identifiant des embeddings qui l'ont construit."""
+        path = os.path.relpath(os.path.dirname(manifest.path), self.root)
+        embeddings_key = embeddings_key or self.shards.get(name, {}).get("embeddings")
+        self.shards[name] = {"path": path.replace(os.sep, "/"), **self._describe(manifest)}
+        if embeddings_key:
+            self.shards[name]["embeddings"] = embeddings_key
+
+    def check_embeddings(self, embeddings_key: Optional[str], names: Optional[Iterable[str]] = None):
+        """
+        Vérifie que les shards ont été construits avec les mêmes embeddings que `embeddings_key`
+        (`cache_key` du modèle). Préfixes e5 différents : ValueError, les questions ne seraient pas
+        encodées dans l'espace des passages. Autre modèle ou backend : avertissement.
+        """
+        if not embeddings_key:
+            return  # embedder sans identifiant (doublures de test)
+        for name in self.shards if names is None else names:
+            stored = self.shards[name].get("embeddings")
+            if stored is None:
+                if _has_e5_prefixes(embeddings_key):
+                    logger.warning(f"Shard '{name}' : embeddings d'origine inconnus (index antérieur). S'il a été "
+                                   f"construit sans préfixes e5, relancer avec --no-e5-prefixes ou --force-reindex.")
+                continue
+            if _has_e5_prefixes(stored) != _has_e5_prefixes(embeddings_key):
+                raise ValueError(f"Shard '{name}' construit avec '{stored}', questions encodées avec "
+                                 f"'{embeddings_key}' : préfixes e5 différents. Relancer "
+                                 f"{'sans' if _has_e5_prefixes(stored) else 'avec'} --no-e5-prefixes, "
+                                 f"ou --force-reindex.")
+            if stored != embeddings_key:
+                logger.warning(f"Shard '{name}' construit avec '{stored}', questions encodées avec "
+                               f"'{embeddings_key}' : résultats approchés.")
+
+    def drop(self, name: str):
+        """Retire un shard du registre et supprime ses fichiers."""
+        entry = self.shards.pop(name, None)
+        if entry is None:
+            return
+        path = os.path.normpath(os.path.join(self.root, entry["path"]))
+        if os.path.normpath(path) == os.path.normpath(self.root):
+            for file_name in INDEX_FILES:
+                if os.path.exists(os.path.join(path, file_name)):
+                    os.remove(os.path.join(path, file_name))
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        for name in list(self.shards):
+            self.drop(name)
+
+    def select(self, shard_filter: Optional[ShardFilter] = None) -> List[Tuple[str, Optional[set]]]:
+        """
+        Shards à interroger pour un filtre : [(nom, documents retenus)], documents retenus à None
+        quand tout le shard correspond (les shards sans document retenu ne sont pas cherchés).
+        """
+        if not shard_filter:
+            return [(name, None) for name in self.shards]
+        selected = []
+        for name, entry in self.shards.items():
+            kept = {key for key, doc in entry["documents"].items() if shard_filter.matches(key, doc.get("year"))}
+            if kept:
+                selected.append((name, None if len(kept) == len(entry["documents"]) else kept))
+        return selected
+
+    def vectors(self) -> int:
+        return sum(entry.get("vectors", 0) for entry in self.shards.values())
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"shards": self.shards}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+@dataclass
+class OpenShard:
+    name: str
+    path: str
+    db: "FAISS"
+    signature: Tuple
+    bm25: Optional[BM25Index] = None
+    users: int = 0  # vues (recherches en cours) qui utilisent ce shard
+    retired: bool = False  # remplacé ou fermé : fermé dès que plus aucune vue ne l'utilise
+
+
+@dataclass
+class ShardView:
+    """
+    Shards d'un même état de l'index (voir `ShardSet.view`) : les ids d'une recherche et leurs documents
+    sont lus dans les mêmes shards, qui restent ouverts même si une ingestion les remplace entre-temps.
+    """
+    index: "ShardSet"  # recherche dans les shards sélectionnés (pool de threads, BM25)
+    registry: ShardRegistry
+    shards: Dict[str, OpenShard]
+
+    def select(self, shard_filter: Optional[ShardFilter] = None) -> List[Tuple[OpenShard, Optional[set]]]:
+        return [(self.shards[name], kept) for name, kept in self.registry.select(shard_filter) if name in self.shards]
+
+    def documents(self, rankings: List[List[str]]) -> List[List[Document]]:
+        """Documents des ids qualifiés de chaque classement : une lecture groupée par shard."""
+        wanted: Dict[str, set] = {}
+        for ids in rankings:
+            for qualified in ids:
+                name, _, doc_id = qualified.partition("/")
+                wanted.setdefault(name, set()).add(doc_id)
+        found = {}
+        for name, doc_ids in wanted.items():
+            shard = self.shards.get(name)
+            if shard is None:
+                continue
+            doc_ids = sorted(doc_ids)
+            for doc_id, doc in zip(doc_ids, _mget(shard.db, doc_ids)):
+                if isinstance(doc, Document):
+                    found[f"{name}/{doc_id}"] = doc
+        return [[found[i] for i in ids if i in found] for ids in rankings]
+
+
+class ShardSet:
+    """
+    Shards ouverts en lecture seule (vecteurs en mémoire mappée, chunks dans SQLite) pour les questions.
+    Seuls les shards dont les fichiers ont changé sont rouverts après une ingestion.
+    Les ids retournés sont qualifiés par leur shard : `<shard>/<id du chunk>`.
+    Une recherche passe par `view()` : un shard remplacé par `refresh` n'est fermé qu'après la dernière
+    recherche qui l'utilise.
+    """
+
+    def __init__(self, root: str, embeddings, threads: int = SEARCH_THREADS):
+        self.root = root
+        self.embeddings = embeddings
+        self.threads = max(1, threads)
+        self.registry: Optional[ShardRegistry] = None
+        self.shards: Dict[str, OpenShard] = {}
+        self._signature: Optional[Tuple] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """Relit le registre si le dossier de l'index a changé ; retourne True si des shards ont été (ré)ouverts."""
+        signature = files_signature(self.root)
+        if signature is None:
+            raise ValueError("Le cache FAISS n'existe pas. Veuillez d'abord ajouter un document.")
+        if signature == self._signature:
+            return False
+        with span("load_index"):
+            registry = ShardRegistry(self.root)
+            if not registry.shards:
+                raise ValueError("Le cache FAISS n'existe pas. Veuillez d'abord ajouter un document.")
+            registry.check_embeddings(getattr(self.embeddings, "cache_key", None))
+            shards = {}
+            for name in registry.shards:
+                path = registry.shard_path(name)
+                shard_signature = files_signature(path, INDEX_FILES)
+                old = self.shards.get(name)
+                if old is not None and (old.path, old.signature) == (path, shard_signature):
+                    shards[name] = old
+                    continue
+                if not shard_signature:
+                    logger.warning(f"Shard '{name}' introuvable ({path}) : ignoré.")
+                    continue
+                # Vecteurs en mémoire mappée, chunks lus dans SQLite seulement pour les résultats
+                db = open_vectorstore(path, self.embeddings)
+                count("vectors", db.index.ntotal)
+                shards[name] = OpenShard(name, path, db, shard_signature)
+        reopened = [name for name in shards if shards[name] is not self.shards.get(name)]
+        with self._lock:
+            self._retire([old for name, old in self.shards.items() if shards.get(name) is not old])
+            self.registry, self.shards, self._signature = registry, shards, signature
+        logger.info(f"Index chargé : {len(shards)} shard(s), {len(reopened)} (ré)ouvert(s).")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._retire(list(self.shards.values()))
+            self.shards, self.registry, self._signature = {}, None, None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    @property
+    def single(self) -> Optional["FAISS"]:
+        """L'index FAISS quand il n'y a qu'un shard (retriever LangChain), sinon None."""
+        return next(iter(self.shards.values())).db if len(self.shards) == 1 else None
+
+    @contextmanager
+    def view(self) -> Iterator[ShardView]:
+        """Shards actuels, gardés ouverts jusqu'à la sortie du bloc (une recherche et ses documents)."""
+        with self._lock:
+            view = ShardView(self, self.registry, self.shards)
+            for shard in view.shards.values():
+                shard.users += 1
+        try:
+            yield view
+        finally:
+            with self._lock:
+                for shard in view.shards.values():
+                    shard.users -= 1
+                self._retire([shard for shard in view.shards.values() if shard.retired])
+
+    @staticmethod
+    def _retire(shards: List[OpenShard]):
+        """Ferme les shards remplacés dès qu'aucune vue ne les utilise (appelé sous `_lock`)."""
+        for shard in shards:
+            shard.retired = True
+            if not shard.users and shard.db is not None:
+                _close(shard.db)
+                shard.db = None
+
+    def _map(self, fn, items: list) -> list:
+        """Applique `fn` à chaque shard : dans le pool de threads dès qu'il y a plusieurs shards."""
+        if len(items) <= 1 or self.threads == 1:
+            return [fn(item) for item in items]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="shard")
+        return list(self._pool.map(fn, items))
+
+    @staticmethod
+    def _merge(per_shard: Iterable[List[Tuple[float, str]]], k: int) -> List[str]:
+        """Fusion par tas des listes (clé croissante, id qualifié) de chaque shard : les k meilleurs."""
+        return [doc_id for _, doc_id in itertools.islice(heapq.merge(*per_shard), k)]
+
+    @staticmethod
+    def _keep(shard: OpenShard, hits: List[Tuple[float, str]], kept: Optional[set], k: int):
+        """Écarte les résultats des documents non retenus par le filtre (shard de plusieurs documents)."""
+        if kept is not None and hits:
+            docs = _mget(shard.db, [doc_id for _, doc_id in hits])
+            hits = [hit for hit, doc in zip(hits, docs)
+                    if isinstance(doc, Document) and doc.metadata.get("document") in kept]
+        return [(key, f"{shard.name}/{doc_id}") for key, doc_id in hits[:k]]
+
+    def _search_dense(self, item, vectors: np.ndarray, k: int, nprobe: Optional[int], ef_search: Optional[int]):
+        shard, kept = item
+        db = shard.db
+        depth = min(k if kept is None else k * FILTER_OVERSAMPLE, db.index.ntotal)
+        if depth <= 0:
+            return [[] for _ in vectors]
+        import faiss
+
+        set_search_params(db.index, nprobe=nprobe, ef_search=ef_search)
+        queries = vectors
+        if db._normalize_L2:
+            queries = vectors.copy()
+            faiss.normalize_L2(queries)
+        distances, positions = db.index.search(queries, depth)
+        # Clé de fusion croissante : distance L2, ou opposé du produit scalaire
+        sign = -1.0 if db.index.metric_type == faiss.METRIC_INNER_PRODUCT else 1.0
+        ids = _ids_at(db, positions[positions != -1].tolist())
+        return [self._keep(shard, [(sign * float(d), ids[int(p)]) for d, p in zip(row_d, row_p) if int(p) in ids],
+                           kept, k)
+                for row_d, row_p in zip(distances, positions)]
+
+    def search_dense(self, vectors: np.ndarray, k: int, selected: List[Tuple[OpenShard, Optional[set]]],
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[List[str]]:
+        """Ids qualifiés des k plus proches voisins de chaque vecteur, tous shards `selected` confondus."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        per_shard = self._map(lambda item: self._search_dense(item, vectors, k, nprobe, ef_search), selected)
+        return [self._merge((results[q] for results in per_shard), k) for q in range(len(vectors))]
+
+    def _bm25(self, shard: OpenShard) -> BM25Index:
+        with self._lock:
+            if shard.bm25 is None:
+                with span("load_bm25", shard=shard.name):
+                    shard.bm25 = (BM25Index.load(shard.path) if BM25Index.exists(shard.path)
+                                  else BM25Index.from_vectorstore(shard.db))
+            return shard.bm25
+
+    def search_sparse(self, questions: List[str], k: int,
+                      selected: List[Tuple[OpenShard, Optional[set]]]) -> List[List[str]]:
+        """
+        BM25 dans chaque shard, fusionné par score. Les statistiques (idf, longueur moyenne) sont propres
+        à chaque shard : les scores de shards différents ne sont comparables qu'approximativement.
+        """
+        def search(item):
+            shard, kept = item
+            bm25 = self._bm25(shard)
+            depth = k if kept is None else k * FILTER_OVERSAMPLE
+            return [self._keep(shard, [(-score, doc_id) for doc_id, score in bm25.search(q, depth)], kept, k)
+                    for q in questions]
+
+        per_shard = self._map(search, selected)
+        return [self._merge((results[q] for results in per_shard), k) for q in range(len(questions))]
+
+
+def _mget(db: "FAISS", ids: List[str]) -> list:
+    mget = getattr(db.docstore, "mget", None)  # docstore SQLite : les chunks en une requête
+    return mget(ids) if mget is not None else [db.docstore.search(doc_id) for doc_id in ids]
+
+
+def _has_e5_prefixes(embeddings_key: str) -> bool:
+    return embeddings_key.endswith("+e5")
+
+
+def _ids_at(db: "FAISS", positions: List[int]) -> Dict[int, str]:
+    mget = getattr(db.index_to_docstore_id, "mget", None)  # docstore SQLite : toutes les positions en une requête
+    if mget is not None:
+        return mget(positions)
+    return {p: db.index_to_docstore_id[p] for p in positions if p in db.index_to_docstore_id}
+
+
+def _close(db: "FAISS"):
+    close = getattr(db.docstore, "close", None)
+    if close is not None:
+        close()
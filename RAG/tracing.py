@@ -0,0 +1,171 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+# -------------------------------
+# Configuration
+# -------------------------------
+MAX_KEPT_SPANS = 10_000  # spans gardés en mémoire pour le résumé (les plus anciens sont oubliés)
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo), None si indisponible."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3  # octets sous macOS, Ko sous Linux
+
+
+@dataclass
+class Span:
+    """
+    Une étape chronométrée : durée, compteurs (chunks, vecteurs, appels LLM, jetons...) et mémoire.
+    `ru_maxrss` ne donne que le pic du processus depuis son démarrage : `process_peak_rss_mb` est ce pic
+    à la fin de l'étape, `rss_peak_growth_mb` de combien l'étape l'a relevé (0 si elle est restée sous
+    un pic antérieur ; `peak_traced_mb` mesure alors ses propres allocations).
+    """
+    name: str
+    parent: Optional[str] = None
+    attrs: Dict = field(default_factory=dict)
+    counts: Dict[str, float] = field(default_factory=dict)
+    start: float = 0.0
+    duration_s: float = 0.0
+    process_peak_rss_mb: Optional[float] = None
+    rss_peak_growth_mb: Optional[float] = None
+    peak_traced_mb: Optional[float] = None  # pic des allocations Python de l'étape (si tracemalloc est actif)
+    _peak_traced: int = 0
+
+    def count(self, name: str, amount: float = 1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def to_dict(self) -> Dict:
+        record = {"name": self.name, "parent": self.parent, "start": round(self.start, 6),
+                  "duration_s": round(self.duration_s, 6), "counts": self.counts, "attrs": self.attrs,
+                  "process_peak_rss_mb": self.process_peak_rss_mb, "rss_peak_growth_mb": self.rss_peak_growth_mb}
+        if self.peak_traced_mb is not None:
+            record["peak_traced_mb"] = self.peak_traced_mb
+        return record
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("rag_span", default=None)
+
+
+class Tracer:
+    """
+    Collecte les spans terminés et les compteurs globaux du processus.
+    `output` : fichier JSON Lines où chaque span terminé est ajouté (une ligne par span).
+    """
+
+    def __init__(self, output: Optional[str] = None):
+        self.output = output
+        self.spans: deque = deque(maxlen=MAX_KEPT_SPANS)
+        self.totals: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, output: Optional[str] = None, trace_memory: bool = False):
+        """Active l'export JSON Lines et, en option, la mesure des allocations par étape (tracemalloc, plus lent)."""
+        self.output = output
+        if output:
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        parent = _current.get()
+        record = Span(name, parent.name if parent else None, attrs, start=time.time())
+        tracing_memory = tracemalloc.is_tracing()
+        if tracing_memory:
+            if parent is not None:  # le pic du parent jusqu'ici, avant la remise à zéro
+                parent._peak_traced = max(parent._peak_traced, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        start_peak_rss = _peak_rss_mb()
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.duration_s = time.perf_counter() - start
+            _current.reset(token)
+            record.process_peak_rss_mb = _peak_rss_mb()
+            if record.process_peak_rss_mb is not None:
+                record.rss_peak_growth_mb = round(record.process_peak_rss_mb - start_peak_rss, 3)
+            if tracing_memory and tracemalloc.is_tracing():
+                record._peak_traced = max(record._peak_traced, tracemalloc.get_traced_memory()[1])
+                record.peak_traced_mb = round(record._peak_traced / 1e6, 3)
+                if parent is not None:
+                    parent._peak_traced = max(parent._peak_traced, record._peak_traced)
+            self._finish(record)
+
+    def count(self, name: str, amount: float = 1):
+        """Incrémente un compteur de l'étape en cours (et le total du processus)."""
+        current = _current.get()
+        if current is not None:
+            current.count(name, amount)
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+
+    def _finish(self, record: Span):
+        with self._lock:
+            self.spans.append(record)
+            if self.output:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+
+    def summary(self) -> List[str]:
+        """Lignes de résumé par étape : nombre, durée totale, compteurs cumulés."""
+        stages: Dict[str, Dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            stage = stages.setdefault(s.name, {"n": 0, "seconds": 0.0, "counts": {}})
+            stage["n"] += 1
+            stage["seconds"] += s.duration_s
+            for key, value in s.counts.items():
+                stage["counts"][key] = stage["counts"].get(key, 0) + value
+        lines = []
+        for name, stage in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+            counts = ", ".join(f"{k}={v:g}" for k, v in sorted(stage["counts"].items()))
+            lines.append(f"{name:<20} {stage['n']:>4} x {stage['seconds']:8.3f} s" + (f"  ({counts})" if counts else ""))
+        return lines
+
+    def log_summary(self):
+        for line in self.summary():
+            logger.info(line)
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.totals.clear()
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attrs):
+    """Chronomètre une étape du tracer du processus : `with span("search", k=k): ...`."""
+    return TRACER.span(name, **attrs)
+
+
+def count(name: str, amount: float = 1):
+    TRACER.count(name, amount)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
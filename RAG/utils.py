@@ -1,37 +1,114 @@
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings  
-from langchain_community.vectorstores import FAISS
+import itertools
+import logging
 import os
-import google.generativeai as genai
-from abbreviation import pipeline_abreviations
-from figures import save_identified_pages, analyze_saved_pages_with_gemini, load_figure_analyses
-from langchain.schema import Document
+import time
+from concurrent.futures import ProcessPoolExecutor
+from llm_client import get_gemini_client
+from abbreviation import pipeline_abreviations, AbbreviationCollector, AbbreviationExpander
+from figures import (FIGURE_SUMMARY_FILENAME, PageRenderer, save_identified_pages, analyze_saved_pages_with_gemini,
+                     load_figure_analyses)
+from manifest import IndexManifest, document_key, duplicate_keys, file_sha256, vector_id
+from index_factory import DEFAULT_INDEX_SPEC, describe_index
+from index_store import load_vectorstore, save_vectorstore
+from shards import ShardRegistry
+from bm25 import BM25Index
+from context import CONTEXT_TOKEN_BUDGET, pack_context
+from pdf_pages import DEFAULT_SCAN_WORKERS, MIN_DRAWING_ELEMENTS, iter_pdf_pages
+from ingest import (BULK_EMBED_BATCH_SIZE, CHECKPOINT_EVERY, EMBED_BATCH_SIZE, MAX_BUFFER_MB, PageSpool,
+                    PreparedDocument, StreamingIndexWriter, format_rate, iter_batches)
+from langchain_core.documents import Document
+from llm_client import estimate_tokens
+from tracing import count, span
+
+# -------------------------------
+# Configuration
+# -------------------------------
+FAISS_CACHE_PATH = "./RAG/cache/faiss_index"
+EMBEDDING_CACHE_DIR = "./RAG/cache/embeddings"  # voir embedding_cache.py
+EMBEDDING_MODEL_NAME = "embaas/sentence-transformers-multilingual-e5-base"
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")  # voir embedding_backends.py
+LLM_MODEL_NAME = "gemini-2.5-flash-lite"
+MAX_LLM_CONCURRENCY = 4  # Appels Gemini simultanés lors des questions en lot
+RETRIEVAL_MODE = "hybrid"  # dense (FAISS), sparse (BM25) ou hybrid (fusion RRF des deux)
+
+logger = logging.getLogger(__name__)
+
 
-    
 # Fonction pour charger un PDF
 def load_pdf(path):
+    from langchain_community.document_loaders import PyMuPDFLoader
+
     loader = PyMuPDFLoader(path)
     return loader.load()
 
+# Fonction d'extraction en un seul passage sur le PDF
+def extract_pdf(doc_path, figures_path, min_elements=MIN_DRAWING_ELEMENTS, render_options=None,
+                workers=DEFAULT_SCAN_WORKERS, documents=None):
+    """
+    Ouvre le PDF une seule fois et consomme le flux de pages (pdf_pages.iter_pdf_pages) pour :
+      - construire les Documents page par page (entrée du découpage),
+      - collecter les abréviations « Forme longue (ABBR) »,
+      - détecter et sauvegarder en image les pages de figures (figures.RenderOptions).
+    La lecture des pages et le rendu des figures sont répartis sur `workers` processus.
+    `documents` reçoit les pages (liste par défaut, ou ingest.PageSpool pour les garder sur disque).
+    Retourne (documents, abrev_phrases).
+    """
+    collector = AbbreviationCollector()
+    documents = [] if documents is None else documents
+    renderer = PageRenderer(figures_path, render_options)
+
+    def pages():
+        for page in iter_pdf_pages(doc_path, min_elements, workers=workers, on_figure_page=renderer):
+            documents.append(Document(page_content=page.text, metadata=page.metadata(doc_path)))
+            collector.feed(page.text)
+            yield page
+
+    with span("extract_pdf", document=os.path.basename(doc_path)):
+        save_identified_pages(doc_path, figures_path, min_elements, pages=pages(), render_options=render_options)
+        count("pages", len(documents))
+    return documents, collector.results()
+
 # Fonction pour splitter les documents
+def make_splitter(chunk_size=450, chunk_overlap=100):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,separators=[". ", "? ","\n\n", "\n", ] )
+
 def split_docs(documents, chunk_size=450, chunk_overlap=100):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,separators=[". ", "? ","\n\n", "\n", ] )
-    return splitter.split_documents(documents)
+    return make_splitter(chunk_size, chunk_overlap).split_documents(documents)
+
+# Flux page -> chunks -> chunks enrichis, une page à la fois (le découpage ne franchit pas les pages,
+# le résultat est donc identique à split_docs puis enrich_chunks_with_abbreviations)
+def iter_chunks(pages, abbr_dict=None, chunk_size=450, chunk_overlap=100):
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    chunks = (chunk for page in pages for chunk in splitter.split_documents([page]))
+    return enrich_chunk_stream(chunks, abbr_dict)
 
 # Fonction pour créer les embeddings
-def create_embeddings(model_name="embaas/sentence-transformers-multilingual-e5-base"):
-    return HuggingFaceEmbeddings(model_name=model_name)
+# Le backend (torch fp32, int8, onnx), la taille des lots et le nombre de threads viennent de `options`
+# (par défaut : embedding_backends.configure_embeddings) ; le modèle n'est chargé qu'au premier encodage.
+# Avec `cache_dir`, les embeddings de documents passent par le cache persistant adressé par contenu :
+# seuls les chunks jamais vus (pour ce modèle et ce backend) sont encodés.
+def create_embeddings(model_name=EMBEDDING_MODEL_NAME, cache_dir=None, options=None):
+    from embedding_backends import create_backend
+
+    embeddings = create_backend(model_name, options)
+    if cache_dir:
+        from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+        return CachedEmbeddings(embeddings, EmbeddingCache(embeddings.cache_key, cache_dir))
+    return embeddings
 
 # Fonction pour créer le vector store
 def create_vectorstore(docs, embeddings):
+    from langchain_community.vectorstores import FAISS
+
     db = FAISS.from_documents(docs, embeddings)
     return db.as_retriever()
 
-# Fonction pour créer le LLM
+# Fonction pour créer le LLM (client partagé : quota, concurrence bornée et reprises, voir llm_client.py)
 def get_llm():
-    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-    return genai.GenerativeModel("gemini-2.5-flash-lite")
+    return get_gemini_client(LLM_MODEL_NAME)
 
 # Fonction pour construire la chaîne RAG
 def build_rag_chain(llm, retriever):
@@ -47,25 +124,17 @@ def enrich_chunks_with_abbreviations(chunks, abbr_dict):
     chunks : list[Document] - les chunks déjà découpés
     abbr_dict : dict - dictionnaire {abréviation: définition}
     
+    Le dictionnaire est compilé une fois en une seule expression régulière (voir AbbreviationExpander) :
+    chaque chunk est réécrit en un seul parcours, chaque abréviation n'est développée qu'une fois
+    par chunk et uniquement lorsqu'elle forme un mot entier.
+
     Retourne une liste de chunks enrichis (Document)
     """
+    expander = AbbreviationExpander(abbr_dict)
     enriched_chunks = []
 
     for chunk in chunks:
-        text = chunk.page_content
-        added_definitions = []
-
-        for abbr, definition in abbr_dict.items():
-            # Ignorer si la définition est None ou vide
-            if not definition:
-                continue
-            # Si l'abréviation apparaît dans le chunk, ajouter la définition entre parenthèses
-            if abbr in text:
-                # Vérifier si la définition n'est pas déjà présente
-                if definition not in text:
-                    text = text.replace(abbr, f"{abbr} ({definition})")
-                    added_definitions.append(f"{abbr}: {definition}")
-
+        text, _ = expander.expand(chunk.page_content)
         enriched_chunks.append(Document(
             page_content=text,
             metadata=chunk.metadata
@@ -73,86 +142,480 @@ def enrich_chunks_with_abbreviations(chunks, abbr_dict):
 
     return enriched_chunks
 
+# Version flux de enrich_chunks_with_abbreviations
+def enrich_chunk_stream(chunks, abbr_dict):
+    expander = AbbreviationExpander(abbr_dict) if abbr_dict else None
+    for chunk in chunks:
+        if expander:
+            text, _ = expander.expand(chunk.page_content)
+            chunk = Document(page_content=text, metadata=chunk.metadata)
+        yield chunk
+
+
+# Fonction pour construire le prompt à partir des documents récupérés
+# Le contexte est d'abord assemblé (context.pack_context) : chunks consécutifs recollés, quasi-doublons
+# écartés, budget de `token_budget` jetons (None : contexte brut).
+def build_prompt(docs, question, token_budget=CONTEXT_TOKEN_BUDGET):
+    with span("build_prompt"):
+        if token_budget is not None:
+            docs = pack_context(docs, token_budget)
+        context = "\n".join([doc.page_content for doc in docs])
+        count("context_tokens", estimate_tokens(context))
+    return f"Contexte:\n{context}\n\nQuestion: {question}\n Si le texte contient des abréviations, explique-les à partir du contexte ou de tes connaissances générales. Réponds en français et de manière claire. N'ajoute pas les définitions des abréviations dans ta réponse."
+
+# Fonction pour générer une réponse à partir de documents déjà récupérés
+def generate_answer(llm, docs, question, token_budget=CONTEXT_TOKEN_BUDGET):
+    prompt = build_prompt(docs, question, token_budget)
+    with span("llm"):
+        response = llm.generate_content(prompt)
+    return response.text
+
+# Variante en flux : les morceaux de texte sont produits dès que Gemini les envoie
+# (un seul morceau si le client ne sait pas streamer)
+def generate_answer_stream(llm, docs, question, token_budget=CONTEXT_TOKEN_BUDGET):
+    prompt = build_prompt(docs, question, token_budget)
+    if hasattr(llm, "stream_content"):
+        yield from llm.stream_content(prompt)
+    else:
+        yield llm.generate_content(prompt).text
+
+
+def timed_chunks(chunks, timing=None, start=None):
+    """
+    Relaie un flux de morceaux de texte en mesurant, dans `timing` (dict), le temps jusqu'au premier
+    morceau (`ttft_s`), le temps total (`total_s`, une fois le flux épuisé) et le nombre de morceaux.
+    `start` : instant de départ (time.perf_counter()), par défaut le premier appel au flux.
+    """
+    start = time.perf_counter() if start is None else start
+    timing = {} if timing is None else timing
+    timing.update(ttft_s=None, total_s=None, chunks=0)
+    for chunk in chunks:
+        if timing["ttft_s"] is None:
+            timing["ttft_s"] = time.perf_counter() - start
+        timing["chunks"] += 1
+        yield chunk
+    timing["total_s"] = time.perf_counter() - start
+
+
 # Fonction pour poser une question
 def ask_question(chain, question):
     llm, retriever = chain
     # Recherche contextuelle avec le retriever
     docs = retriever.invoke(question)
-    context = "\n".join([doc.page_content for doc in docs])            
-    prompt = f"Contexte:\n{context}\n\nQuestion: {question}\n Si le texte contient des abréviations, explique-les à partir du contexte ou de tes connaissances générales. Réponds en français et de manière claire. N'ajoute pas les définitions des abréviations dans ta réponse."
-    response = llm.generate_content(prompt)
-    return response.text
+    return generate_answer(llm, docs, question)
 
 
-def pipeline_add_new_document(doc_path,force_reindex=False):
-    file_name = os.path.basename(doc_path)
-    figures_path="./RAG/Dataset/rag_figures/"+file_name
-    cache_path = "./RAG/cache/faiss_index"
-    
-    # Charger le document
-    documents = load_pdf(doc_path)
-    print(f"Document chargé avec {len(documents)} pages.")
-
-    # Découper le document
-    docs = split_docs(documents)
-    print(f"Document découpé en {len(docs)} chunks.")
-
-    # Gestion des abréviations
-    doc_abreviations = pipeline_abreviations(doc_path)
-    if isinstance(doc_abreviations, dict):
-        # Enrichir les chunks avec les abréviations
-        docs = enrich_chunks_with_abbreviations(docs, doc_abreviations)
-        print("Chunks enrichis avec les abréviations.")
-
-    # Gestion des figures si existantes
-    save_identified_pages(doc_path, figures_path, 15)
-    analyze_saved_pages_with_gemini(figures_path)
-    doc_figures=load_figure_analyses("./RAG/Dataset/rag_figures/_summary.json")
-
-        
-    # Fusionner les documents texte - figures
-    all_docs = docs + doc_figures 
-    print(f"Total de {len(all_docs)} documents (texte + figures + abréviations) à indexer.")
-
-    # Créer les embeddings
-    embeddings = create_embeddings()
-    print("Embeddings créés.")
-    
-    # Créer ou mettre à jour le vector store
-    if os.path.exists(cache_path) and not force_reindex:
-        db = FAISS.load_local(cache_path, embeddings, allow_dangerous_deserialization=True)
-        print("Index FAISS existant chargé.")
-        db.add_documents(all_docs)
-        print(f"{len(all_docs)} nouveaux chunks ajoutés à l'index FAISS.")
+def ask_question_stream(chain, question, timing=None):
+    """Comme `ask_question`, mais générateur des morceaux de la réponse (TTFT et temps total dans `timing`)."""
+    start = time.perf_counter()
+    llm, retriever = chain
+    docs = retriever.invoke(question)
+    yield from timed_chunks(generate_answer_stream(llm, docs, question), timing, start)
+
+
+# Fonction pour supprimer des vecteurs de l'index (les ids déjà absents sont ignorés)
+def delete_vectors(db, ids):
+    present = set(db.index_to_docstore_id.values())
+    ids = [i for i in ids if i in present]
+    if ids:
+        try:
+            db.delete(ids)
+        except RuntimeError as e:
+            # Les index HNSW ne permettent pas de retirer des vecteurs
+            raise ValueError(f"L'index {describe_index(db.index)} ne supporte pas la suppression de vecteurs : "
+                             f"utilisez --force-reindex. Détails : {e}") from e
+    return len(ids)
+
+
+def figures_dir(doc_path):
+    """Dossier des images et du résumé des figures d'un document."""
+    return "./RAG/Dataset/rag_figures/"+os.path.basename(doc_path)
+
+
+def resolve_document_extras(doc_path, abrev_phrases):
+    """Définitions des abréviations (glossaire puis Gemini) et analyses de figures d'un document extrait."""
+    with span("abbreviations", document=os.path.basename(doc_path)):
+        doc_abreviations = pipeline_abreviations(doc_path, abrev_phrases)
+    abbr_dict = doc_abreviations if isinstance(doc_abreviations, dict) else {}
+    # Gestion des figures si existantes (analyses en cache par hash d'image, résumé propre au document)
+    figures_path = figures_dir(doc_path)
+    with span("figure_analysis", document=os.path.basename(doc_path)):
+        analyze_saved_pages_with_gemini(figures_path)
+    doc_figures = load_figure_analyses(os.path.join(figures_path, FIGURE_SUMMARY_FILENAME))
+    return abbr_dict, doc_figures
+
+
+def index_documents(prepared, manifest, index_exists, index_spec=DEFAULT_INDEX_SPEC, batch_size=EMBED_BATCH_SIZE,
+                    max_buffer_mb=MAX_BUFFER_MB, checkpoint_every=CHECKPOINT_EVERY, embeddings=None, cache_path=None):
+    """
+    Indexe en flux une suite de documents préparés (ingest.PreparedDocument) avec un seul modèle
+    d'embeddings, un seul chargement et une seule sauvegarde finale de l'index :
+    chunks -> embeddings par lots de `batch_size` (au plus `max_buffer_mb` Mo en attente) -> ajout
+    incrémental. Les anciens vecteurs des documents modifiés sont retirés avant l'ajout.
+    Tous les `checkpoint_every` vecteurs (None : jamais), l'index, le manifeste (documents en cours
+    marqués incomplets) et le cache d'embeddings sont sauvegardés.
+    `cache_path` : dossier de l'index écrit (par défaut FAISS_CACHE_PATH ; un shard, voir `index_into_shards`).
+    `embeddings` : modèle à utiliser, avec ou sans cache d'embeddings (embedding_cache.CachedEmbeddings).
+    Retourne (nombre de vecteurs ajoutés, secondes passées à encoder).
+    """
+    cache_path = cache_path or FAISS_CACHE_PATH
+    prepared = list(prepared)
+
+    # Créer les embeddings (via le cache : seuls les chunks nouveaux ou modifiés sont encodés)
+    embeddings = embeddings or create_embeddings(cache_dir=EMBEDDING_CACHE_DIR)
+    embedding_cache = getattr(embeddings, "cache", None)  # None : embeddings passés sans cache
+    logger.info("Embeddings créés.")
+
+    # Ouvrir ou préparer le vector store
+    db = None
+    bm25 = BM25Index()
+    if index_exists:
+        with span("load_index"):
+            db = load_vectorstore(cache_path, embeddings)
+            bm25 = load_bm25(db, cache_path)
+        logger.info("Index FAISS existant chargé.")
+        for doc in prepared:
+            old_ids = manifest.remove(doc.key)
+            removed = delete_vectors(db, old_ids)
+            bm25.remove(old_ids)
+            if removed:
+                logger.info(f"{removed} anciens vecteurs de '{doc.key}' supprimés (document modifié).")
     else:
-        print("Création d'un nouvel index FAISS...")
-        db = FAISS.from_documents(all_docs, embeddings)
-        print("Nouveau index FAISS créé.")
-    db.save_local(cache_path)
-    print("Index FAISS sauvegardé localement.")
-    
-def pipeline_question(question, k: int = 20):
-    cache_path = "./RAG/cache/faiss_index"
-    if not os.path.exists(cache_path):
-        raise ValueError("Le cache FAISS n'existe pas. Veuillez d'abord ajouter un document.")
-    
-    embeddings = create_embeddings()
-    db = FAISS.load_local(cache_path, embeddings, allow_dangerous_deserialization=True)
-    print("Index FAISS existant chargé.")
-    # Configure how many documents the retriever should return (k)
-    retriever = db.as_retriever(search_kwargs={"k": k})
-    print(f"Retriever configured to return k={k} documents")
-    
-    print("Initialisation du LLM Gemini...")
-    llm = get_llm()
-    print("LLM prêt.")
+        logger.info(f"Création d'un nouvel index FAISS ({index_spec})...")
+        manifest.clear()
+    writer = StreamingIndexWriter(embeddings, db, spec=index_spec, max_buffer_mb=max_buffer_mb)
+
+    ids = {doc.key: [] for doc in prepared}
+    position = {doc.key: i for i, doc in enumerate(prepared)}
 
-    print("Construction du pipeline RAG...")
-    chain = build_rag_chain(llm, retriever)
-    print("Pipeline RAG prêt.")
+    def stream():
+        # Chunks texte enrichis puis figures, document après document
+        for doc in prepared:
+            for chunk in itertools.chain(doc.chunks, doc.figures):
+                chunk.metadata["document"] = doc.key
+                yield chunk
 
-    print(f"Question posée : {question}")
-    response = ask_question(chain, question)
-    return response
+    def checkpoint(current):
+        with span("save_index", vectors=writer.added):
+            save_vectorstore(writer.db, cache_path)
+            bm25.save(cache_path)
+            for doc in prepared:
+                manifest.record(doc.key, doc.doc_path, doc.content_hash, ids[doc.key],
+                                complete=current is None or position[doc.key] < current)
+            manifest.save()
+            if embedding_cache is not None:
+                embedding_cache.save()
 
+    last_checkpoint = 0
+    embed_seconds = 0.0
+    for batch in iter_batches(stream(), batch_size, max_buffer_mb):
+        batch_ids = []
+        for chunk in batch:
+            doc_ids = ids[chunk.metadata["document"]]
+            batch_ids.append(vector_id(prepared[position[chunk.metadata["document"]]].content_hash, len(doc_ids)))
+            doc_ids.append(batch_ids[-1])
+        start = time.perf_counter()
+        with span("embed"):
+            vectors = embeddings.embed_documents([d.page_content for d in batch])
+            count("chunks", len(batch))
+        embed_seconds += time.perf_counter() - start
+        with span("index_add"):
+            writer.add(batch, vectors, batch_ids)
+            bm25.add(batch_ids, (d.page_content for d in batch))
+            count("vectors", len(batch))
+        if checkpoint_every and writer.db is not None and writer.added - last_checkpoint >= checkpoint_every:
+            checkpoint(current=position[batch[-1].metadata["document"]])
+            last_checkpoint = writer.added
+            logger.info(f"  Point de reprise : {writer.added} vecteurs sauvegardés.")
+    with span("index_add"):
+        writer.flush()
+
+    if writer.db is None:
+        logger.info("Aucun contenu à indexer.")
+        return 0, embed_seconds
+    checkpoint(current=None)
+    logger.info(f"Index FAISS sauvegardé localement : {describe_index(writer.db.index)}.")
+    if embedding_cache is not None:
+        logger.info(embedding_cache.stats())
+    return writer.added, embed_seconds
+
+
+def remove_from_shard(registry, name, doc_key):
+    """
+    Retire un document d'un shard : le shard entier pour un shard de document, ses seuls vecteurs
+    dans l'index d'avant le découpage. Le registre est mis à jour mais pas sauvegardé.
+    Retourne le nombre de vecteurs supprimés.
+    """
+    path = registry.shard_path(name)
+    manifest = IndexManifest(path)
+    ids = manifest.remove(doc_key)
+    if not registry.is_shared(name):
+        registry.drop(name)
+        return len(ids)
+
+    with span("load_index", shard=name):
+        db = load_vectorstore(path, create_embeddings())
+    removed = delete_vectors(db, ids)
+    bm25 = load_bm25(db, path)
+    bm25.remove(ids)
+    save_vectorstore(db, path)
+    bm25.save(path)
+    manifest.save()
+    registry.record(name, manifest)
+    return removed
+
+
+def index_into_shards(prepared, registry, index_spec=DEFAULT_INDEX_SPEC, batch_size=EMBED_BATCH_SIZE,
+                      max_buffer_mb=MAX_BUFFER_MB, checkpoint_every=CHECKPOINT_EVERY, embeddings=None):
+    """
+    Indexe chaque document préparé dans son propre shard (voir shards.py), avec un seul modèle d'embeddings :
+    un document nouveau ou modifié ne réécrit que son shard, reconstruit en entier (aucune suppression
+    de vecteurs, donc valable pour tous les types d'index). Un document de l'index d'avant le découpage
+    en est d'abord retiré. Le registre est sauvegardé après chaque shard.
+    Retourne (nombre de vecteurs ajoutés, secondes passées à encoder).
+    """
+    embeddings = embeddings or create_embeddings(cache_dir=EMBEDDING_CACHE_DIR)
+    embeddings_key = getattr(embeddings, "cache_key", None)
+    # Les shards conservés doivent avoir été construits dans le même espace (préfixes e5)
+    registry.check_embeddings(embeddings_key, [name for name in registry.shards
+                                               if not set(registry.shards[name]["documents"])
+                                               <= {doc.key for doc in prepared}])
+    added, embed_seconds = 0, 0.0
+    for doc in prepared:
+        name = registry.shard_of(doc.key)
+        if name is not None and registry.is_shared(name):
+            removed = remove_from_shard(registry, name, doc.key)
+            logger.info(f"{removed} anciens vecteurs de '{doc.key}' retirés du shard '{name}'.")
+            name = None
+        name = name or registry.new_shard_name(doc.key)
+        path = registry.shard_path(name)
+        with span("shard", shard=name):
+            manifest = IndexManifest(path)
+            doc_added, doc_seconds = index_documents([doc], manifest, index_exists=False, index_spec=index_spec,
+                                                     batch_size=batch_size, max_buffer_mb=max_buffer_mb,
+                                                     checkpoint_every=checkpoint_every, embeddings=embeddings,
+                                                     cache_path=path)
+        if doc_added:
+            registry.record(name, manifest, embeddings_key)
+        else:
+            registry.drop(name)  # document sans contenu : pas de shard
+        registry.save()
+        added += doc_added
+        embed_seconds += doc_seconds
+    return added, embed_seconds
+
+
+# Index BM25 associé à un index FAISS (construit depuis le docstore si l'index date d'avant BM25)
+def load_bm25(db, cache_path=None):
+    cache_path = cache_path or FAISS_CACHE_PATH
+    if BM25Index.exists(cache_path):
+        return BM25Index.load(cache_path)
+    return BM25Index.from_vectorstore(db)
+
+
+def pipeline_add_new_document(doc_path,force_reindex=False, index_spec=DEFAULT_INDEX_SPEC, render_options=None,
+                              workers=DEFAULT_SCAN_WORKERS, batch_size=EMBED_BATCH_SIZE, max_buffer_mb=MAX_BUFFER_MB,
+                              checkpoint_every=CHECKPOINT_EVERY):
+    """
+    Ingère un PDF dans l'index FAISS, dans son propre shard (voir shards.py) :
+      - fichier déjà ingéré et inchangé (même empreinte) : rien à faire,
+      - fichier modifié : seul son shard est reconstruit,
+      - nouveau fichier : un shard est ajouté, les autres ne sont pas touchés.
+    `force_reindex` recrée l'index à partir de ce seul document.
+    `index_spec` choisit le type d'index à la création (flat, ivf, hnsw, ivfpq, opq ou chaîne faiss.index_factory).
+    `render_options` (figures.RenderOptions) règle le rendu des pages de figures, `workers` le nombre
+    de processus de lecture du PDF.
+
+    L'ingestion est en flux, à mémoire bornée : les pages extraites sont gardées sur disque, puis
+    page -> chunks -> enrichissement -> embeddings par lots de `batch_size` (au plus `max_buffer_mb` Mo
+    en attente) -> ajout incrémental à l'index. Tous les `checkpoint_every` vecteurs, l'index, le manifeste
+    (ingestion marquée incomplète) et le cache d'embeddings sont sauvegardés : après une interruption,
+    la reprise ne ré-encode pas les chunks déjà traités.
+    """
+    file_name = os.path.basename(doc_path)
+    doc_key = document_key(doc_path)
+
+    # Vérifier le registre des shards avant tout traitement coûteux
+    registry = ShardRegistry(FAISS_CACHE_PATH)
+    content_hash = file_sha256(doc_path)
+    if force_reindex:
+        registry.clear()
+    elif registry.is_unchanged(doc_key, content_hash):
+        logger.info(f"Document '{file_name}' déjà indexé et inchangé : rien à faire.")
+        return
+
+    with span("ingest_document", document=file_name), PageSpool() as spool:
+        # Charger le document : un seul passage pour le texte, les abréviations et les pages de figures
+        pages, abrev_phrases = extract_pdf(doc_path, figures_dir(doc_path), render_options=render_options,
+                                           workers=workers, documents=spool)
+        logger.info(f"Document chargé avec {len(pages)} pages.")
+
+        # Il faut connaître toutes les abréviations avant d'enrichir le premier chunk
+        abbr_dict, doc_figures = resolve_document_extras(doc_path, abrev_phrases)
+
+        prepared = PreparedDocument(doc_path, doc_key, content_hash, iter_chunks(pages, abbr_dict), doc_figures,
+                                    pages=len(pages))
+        added, _ = index_into_shards([prepared], registry, index_spec=index_spec, batch_size=batch_size,
+                                     max_buffer_mb=max_buffer_mb, checkpoint_every=checkpoint_every)
+    if added:
+        logger.info(f"{added} documents ({added - len(doc_figures)} chunks texte enrichis + {len(doc_figures)} figures) "
+                    f"indexés pour '{file_name}'.")
+
+
+def _prepare_for_bulk(doc_path, render_options=None, spool_dir=None):
+    """
+    Exécuté dans un processus de l'ingestion multi-documents : extraction du PDF (texte, abréviations,
+    rendu des figures) puis découpage. Les chunks sont écrits dans un fichier transmis au processus principal.
+    """
+    pages, abrev_phrases = extract_pdf(doc_path, figures_dir(doc_path), render_options=render_options, workers=1)
+    chunks = PageSpool(spool_dir)
+    splitter = make_splitter()
+    for page in pages:
+        for chunk in splitter.split_documents([page]):
+            chunks.append(chunk)
+    return {"doc_path": doc_path, "pages": len(pages), "chunks": len(chunks), "spool": chunks.detach(),
+            "abrev_phrases": abrev_phrases}
+
+
+def pipeline_add_documents(doc_paths, force_reindex=False, index_spec=DEFAULT_INDEX_SPEC, render_options=None,
+                           workers=DEFAULT_SCAN_WORKERS, batch_size=BULK_EMBED_BATCH_SIZE, max_buffer_mb=MAX_BUFFER_MB,
+                           checkpoint_every=None):
+    """
+    Ingestion multi-documents :
+      1. extraction et découpage des PDF nouveaux ou modifiés dans `workers` processus,
+      2. abréviations et figures (appels Gemini via le client partagé, glossaire et cache des figures),
+      3. embeddings de tous les documents avec un seul modèle, par grands lots,
+      4. un shard par document (voir shards.py), sauvegardé une fois
+         (`checkpoint_every` ajoute des sauvegardes intermédiaires).
+    `force_reindex` recrée l'index à partir de ces seuls documents.
+    Affiche le débit de chaque étape (pages/s, chunks/s, vecteurs/s) et retourne le nombre de vecteurs ajoutés.
+    Deux fichiers de même nom (dossiers différents) partageraient shard et figures : ValueError avant tout traitement.
+    """
+    duplicates = duplicate_keys(doc_paths)
+    if duplicates:
+        details = "; ".join(f"{key} : {', '.join(paths)}" for key, paths in sorted(duplicates.items()))
+        raise ValueError(f"Plusieurs documents portent le même nom de fichier ({details}). "
+                         f"Renommez-les : un document est identifié par son nom dans l'index et les figures.")
+    unique_paths = {}
+    for doc_path in doc_paths:  # un même fichier donné deux fois n'est traité qu'une fois
+        unique_paths.setdefault(os.path.realpath(doc_path), doc_path)
+    doc_paths = list(unique_paths.values())
+    registry = ShardRegistry(FAISS_CACHE_PATH)
+    if force_reindex:
+        registry.clear()
+
+    # Vérifier le registre des shards avant tout traitement coûteux
+    todo = {}
+    for doc_path in doc_paths:
+        content_hash = file_sha256(doc_path)
+        if registry.is_unchanged(document_key(doc_path), content_hash):
+            logger.info(f"Document '{os.path.basename(doc_path)}' déjà indexé et inchangé : ignoré.")
+        else:
+            todo[doc_path] = content_hash
+    if not todo:
+        logger.info("Aucun document nouveau ou modifié.")
+        return 0
+
+    # 1. Extraction + découpage en parallèle
+    start = time.perf_counter()
+    with span("bulk_extract", documents=len(todo)):
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            extracted = list(pool.map(_prepare_for_bulk, todo, [render_options] * len(todo)))
+        n_pages = sum(r["pages"] for r in extracted)
+        n_chunks = sum(r["chunks"] for r in extracted)
+        count("pages", n_pages)
+        count("chunks", n_chunks)
+    parse_seconds = time.perf_counter() - start
+
+    spools = [PageSpool(path=r["spool"], count=r["chunks"]) for r in extracted]
+    try:
+        # 2. Abréviations et figures
+        start = time.perf_counter()
+        prepared = []
+        for r, spool in zip(extracted, spools):
+            abbr_dict, doc_figures = resolve_document_extras(r["doc_path"], r["abrev_phrases"])
+            prepared.append(PreparedDocument(r["doc_path"], document_key(r["doc_path"]), todo[r["doc_path"]],
+                                             enrich_chunk_stream(spool, abbr_dict), doc_figures, pages=r["pages"]))
+        extras_seconds = time.perf_counter() - start
+
+        # 3-4. Embeddings et fusion dans l'index
+        start = time.perf_counter()
+        added, embed_seconds = index_into_shards(prepared, registry, index_spec=index_spec,
+                                                 batch_size=batch_size, max_buffer_mb=max_buffer_mb,
+                                                 checkpoint_every=checkpoint_every)
+        index_seconds = time.perf_counter() - start
+    finally:
+        for spool in spools:
+            spool.close()
+
+    logger.info(f"Ingestion de {len(todo)} document(s) :")
+    logger.info(f"  Extraction + découpage : {format_rate(n_pages, parse_seconds, 'pages')}, "
+                f"{format_rate(n_chunks, parse_seconds, 'chunks')}")
+    logger.info(f"  Abréviations + figures : {extras_seconds:.1f} s")
+    logger.info(f"  Embeddings : {format_rate(added, embed_seconds, 'vecteurs')}")
+    logger.info(f"  Indexation totale (encodage, ajout, sauvegarde) : {format_rate(added, index_seconds, 'vecteurs')}")
+    return added
+
+
+def pipeline_remove_document(doc_path):
+    """
+    Supprime de l'index FAISS tous les vecteurs (chunks et figures) d'un document,
+    identifié par son chemin ou son nom de fichier : son shard est supprimé, les autres ne sont pas touchés.
+    Retourne le nombre de vecteurs supprimés.
+    """
+    doc_key = document_key(doc_path)
+    registry = ShardRegistry(FAISS_CACHE_PATH)
+    name = registry.shard_of(doc_key)
+    if name is None:
+        logger.info(f"Document '{doc_key}' absent du registre de l'index : rien à supprimer.")
+        return 0
+
+    removed = remove_from_shard(registry, name, doc_key)
+    registry.save()
+    logger.info(f"{removed} vecteurs de '{doc_key}' supprimés de l'index FAISS (shard '{name}').")
+    return removed
+
+def pipeline_question(question, k: int = 20, nprobe=None, ef_search=None, mode=RETRIEVAL_MODE,
+                      context_budget=CONTEXT_TOKEN_BUDGET, filters=None):
+    """
+    Répond à une question avec le moteur RAG résident du processus.
+
+    Le modèle d'embeddings, l'index FAISS et le LLM ne sont chargés qu'au premier appel ;
+    l'index est rechargé uniquement si sa copie sur disque a changé.
+    `nprobe` (IVF) et `ef_search` (HNSW) règlent le compromis rappel / latence des index approchés.
+    `mode` : recherche dense (FAISS), sparse (BM25) ou hybrid (fusion par rangs réciproques des deux).
+    `context_budget` : jetons de contexte envoyés à Gemini après assemblage (None : contexte brut).
+    `filters` (shards.ShardFilter) : limite la recherche à certains documents ou années.
+    """
+    from engine import get_engine
+
+    logger.info(f"Question posée : {question}")
+    return get_engine().ask(question, k=k, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                            context_budget=context_budget, filters=filters)
+
+
+def pipeline_question_stream(question, k: int = 20, nprobe=None, ef_search=None, mode=RETRIEVAL_MODE,
+                             context_budget=CONTEXT_TOKEN_BUDGET, timing=None, filters=None):
+    """
+    Comme `pipeline_question`, mais générateur des morceaux de la réponse au fil de la génération.
+    `timing` (dict) reçoit le temps jusqu'au premier morceau (`ttft_s`) et le temps total (`total_s`).
+    """
+    from engine import get_engine
+
+    logger.info(f"Question posée : {question}")
+    yield from get_engine().ask_stream(question, k=k, nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                       context_budget=context_budget, timing=timing, filters=filters)
+
+
+def pipeline_questions(questions, k: int = 20, max_concurrency: int = MAX_LLM_CONCURRENCY, nprobe=None, ef_search=None,
+                       mode=RETRIEVAL_MODE, context_budget=CONTEXT_TOKEN_BUDGET, filters=None):
+    """
+    Répond à plusieurs questions en lot : un seul passage d'encodage pour toutes les questions,
+    une seule recherche FAISS multi-requêtes, puis les appels Gemini en parallèle
+    (au plus `max_concurrency` simultanés). Les réponses sont renvoyées dans l'ordre des questions.
+    """
+    from engine import get_engine
 
+    logger.info(f"{len(questions)} questions posées en lot.")
+    return get_engine().ask_many(questions, k=k, max_concurrency=max_concurrency, nprobe=nprobe, ef_search=ef_search,
+                                 mode=mode, context_budget=context_budget, filters=filters)
@@ -0,0 +1,84 @@
+"""
+Débit de l'enrichissement des chunks par les abréviations : ancienne boucle
+(abréviations × chunks avec `in` / `str.replace`) contre AbbreviationExpander (une regex compilée, un parcours).
+
+Hors-ligne : les abréviations sont extraites du PDF sans appel LLM et reçoivent des définitions factices.
+
+    python benchmarks/bench_abbreviations.py
+    python benchmarks/bench_abbreviations.py --pdf RAG/Dataset/20240929-rapport-JOP-2024_0.pdf --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from abbreviation import extraire_premiere_phrase_abreviations  # noqa: E402
+from utils import enrich_chunks_with_abbreviations, load_pdf, split_docs  # noqa: E402
+from langchain.schema import Document  # noqa: E402
+
+DEFAULT_PDF = os.path.join("RAG", "Dataset", "20240929-rapport-JOP-2024_0.pdf")
+
+
+def legacy_enrich(chunks, abbr_dict):
+    """Implémentation d'origine, conservée ici comme référence."""
+    enriched_chunks = []
+    for chunk in chunks:
+        text = chunk.page_content
+        for abbr, definition in abbr_dict.items():
+            if not definition:
+                continue
+            if abbr in text:
+                if definition not in text:
+                    text = text.replace(abbr, f"{abbr} ({definition})")
+        enriched_chunks.append(Document(page_content=text, metadata=chunk.metadata))
+    return enriched_chunks
+
+
+def count_partial_word_matches(chunks, abbr_dict):
+    """Occurrences où l'ancienne version voyait une abréviation à l'intérieur d'un autre mot."""
+    count = 0
+    for chunk in chunks:
+        text = chunk.page_content
+        for abbr in abbr_dict:
+            if abbr in text and not re.search(rf"(?<!\w){re.escape(abbr)}(?!\w)", text):
+                count += 1
+    return count
+
+
+def timed(fn, chunks, abbr_dict, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(chunks, abbr_dict)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de l'enrichissement par abréviations")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunks = split_docs(load_pdf(args.pdf))
+    abbr_dict = {abbr: f"définition de {abbr}" for abbr, _ in extraire_premiere_phrase_abreviations(args.pdf)}
+    chars = sum(len(c.page_content) for c in chunks)
+    print(f"{len(chunks)} chunks ({chars / 1e6:.2f} M caractères), {len(abbr_dict)} abréviations")
+
+    legacy_s, legacy_out = timed(legacy_enrich, chunks, abbr_dict, args.repeat)
+    new_s, new_out = timed(enrich_chunks_with_abbreviations, chunks, abbr_dict, args.repeat)
+
+    legacy_added = sum(len(o.page_content) for o in legacy_out) - chars
+    new_added = sum(len(o.page_content) for o in new_out) - chars
+    print(f"{'version':<12}{'temps (s)':>12}{'chunks/s':>12}{'car. ajoutés':>15}")
+    print(f"{'ancienne':<12}{legacy_s:>12.4f}{len(chunks) / legacy_s:>12.0f}{legacy_added:>15}")
+    print(f"{'regex':<12}{new_s:>12.4f}{len(chunks) / new_s:>12.0f}{new_added:>15}")
+    print(f"Accélération : x{legacy_s / new_s:.1f} ; "
+          f"correspondances à l'intérieur d'un mot évitées : {count_partial_word_matches(chunks, abbr_dict)}")
+
+
+if __name__ == "__main__":
+    main()
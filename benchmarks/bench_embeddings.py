@@ -0,0 +1,77 @@
+"""
+Backends d'embeddings sur CPU : débit (chunks/s) de chaque backend et parité avec la référence
+PyTorch fp32 (écart 1 - cosinus par chunk et par question), sur les chunks du rapport JOP.
+
+Le modèle doit être disponible (cache HuggingFace). Un backend dont les dépendances manquent
+(ex. onnx sans optimum[onnxruntime]) est signalé puis ignoré.
+
+    python benchmarks/bench_embeddings.py
+    python benchmarks/bench_embeddings.py --backends torch int8 --batch-sizes 16 64 --threads 4 --limit 500
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from embedding_backends import (BACKENDS, EmbeddingOptions, create_backend, cosine_deviation,  # noqa: E402
+                                embed_queries, throughput)
+from evaluate import load_eval_set  # noqa: E402
+from utils import EMBEDDING_MODEL_NAME, load_pdf, split_docs  # noqa: E402
+
+DEFAULT_PDF = os.path.join("RAG", "Dataset", "20240929-rapport-JOP-2024_0.pdf")
+MAX_DEVIATION = 0.01  # écart 1 - cosinus moyen au-delà duquel un backend est signalé
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[32])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=1000, help="Nombre maximal de chunks encodés")
+    parser.add_argument("--output", default=None, help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    chunks = [c.page_content for c in split_docs(load_pdf(args.pdf))][:args.limit]
+    questions = [item.question for item in load_eval_set()]
+    print(f"{len(chunks)} chunks, {len(questions)} questions, modèle {args.model}")
+
+    reference = create_backend(args.model, EmbeddingOptions(backend="torch", threads=args.threads))
+    ref_docs = np.asarray(reference.embed_documents(chunks), dtype=np.float32)
+    ref_queries = np.asarray(embed_queries(reference, questions), dtype=np.float32)
+
+    results = []
+    print(f"\n{'backend':<8} {'lot':>5} {'chunks/s':>10} {'écart moyen':>12} {'écart max':>11} {'écart questions':>16}")
+    for name in args.backends:
+        for batch_size in args.batch_sizes:
+            options = EmbeddingOptions(backend=name, batch_size=batch_size, threads=args.threads)
+            try:
+                backend = create_backend(args.model, options)
+                speed = throughput(backend, chunks)
+            except ImportError as e:
+                print(f"{name:<8} {batch_size:>5}   indisponible ({e})")
+                break
+            docs = cosine_deviation(ref_docs, backend.embed_documents(chunks))
+            queries = cosine_deviation(ref_queries, embed_queries(backend, questions))
+            flag = "  ÉCART" if docs["mean_deviation"] > MAX_DEVIATION else ""
+            print(f"{name:<8} {batch_size:>5} {speed['chunks_per_s']:10.1f} {docs['mean_deviation']:12.2e} "
+                  f"{docs['max_deviation']:11.2e} {queries['mean_deviation']:16.2e}{flag}")
+            results.append({"backend": name, "batch_size": batch_size, "threads": args.threads, **speed,
+                            "documents": docs, "queries": queries})
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nRésultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Détection et rendu des pages de figures : ancienne boucle (tracés comptés sur chaque page avant le
+mot-clé, page entière en PNG zoom 3) contre `figures.save_identified_pages` avec différents réglages.
+
+    python benchmarks/bench_figure_pages.py
+    python benchmarks/bench_figure_pages.py --pdf RAG/Dataset/20240929-rapport-JOP-2024_0.pdf --workers 4
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG")
+sys.path.insert(0, RAG_DIR)
+
+import fitz  # noqa: E402
+
+from figures import RenderOptions, save_identified_pages  # noqa: E402
+from pdf_pages import DEFAULT_SCAN_WORKERS  # noqa: E402
+
+DEFAULT_PDF = os.path.join("RAG", "Dataset", "20240929-rapport-JOP-2024_0.pdf")
+
+
+def legacy(pdf_path, out_dir):
+    doc = fitz.open(pdf_path)
+    saved, written = 0, 0
+    for i, page in enumerate(doc):
+        if len(page.get_drawings()) < 15:
+            continue
+        if "figure" not in page.get_text("text", sort=True).lower():
+            continue
+        path = os.path.join(out_dir, f"page_{i + 1}.png")
+        page.get_pixmap(matrix=fitz.Matrix(3, 3)).save(path)
+        saved += 1
+        written += os.path.getsize(path)
+    pages = len(doc)
+    doc.close()
+    return pages, saved, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de détection / rendu des pages de figures")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCAN_WORKERS)
+    args = parser.parse_args()
+
+    variants = {
+        "ancienne boucle": None,
+        "série, PNG page": (1, RenderOptions()),
+        "parallèle, PNG page": (args.workers, RenderOptions()),
+        "parallèle, JPEG découpé": (args.workers, RenderOptions(clip_to_drawings=True, max_pixels=4_000_000,
+                                                                 image_format="jpeg")),
+    }
+    print(f"{'variante':<26}{'temps (s)':>11}{'pages/s':>9}{'figures':>9}{'Mo écrits':>11}")
+    for name, config in variants.items():
+        with tempfile.TemporaryDirectory() as out_dir:
+            start = time.perf_counter()
+            if config is None:
+                pages, saved, written = legacy(args.pdf, out_dir)
+            else:
+                workers, options = config
+                with contextlib.redirect_stdout(io.StringIO()):
+                    report = save_identified_pages(args.pdf, out_dir, render_options=options, workers=workers)
+                pages, saved, written = report.pages, len(report.saved_pages), report.bytes_written
+            elapsed = time.perf_counter() - start
+        print(f"{name:<26}{elapsed:>11.2f}{pages / elapsed:>9.1f}{saved:>9}{written / 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Temps de démarrage de la CLI : `python -X importtime -c "import main"` dans un sous-processus,
+puis comparaison au budget. Les dépendances lourdes (modèle d'embeddings, fitz, faiss, Gemini...)
+doivent n'être importées qu'à l'étape qui en a besoin : si l'une d'elles apparaît au démarrage,
+ou si le temps cumulé dépasse `--budget`, la commande échoue (code de sortie 1).
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --budget 0.8 --top 20 --runs 5
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+RAG_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+sys.path.insert(0, RAG_DIR)
+
+from main import HEAVY_MODULES as FORBIDDEN_AT_STARTUP  # noqa: E402  (modules interdits au démarrage de la CLI)
+
+IMPORT_BUDGET_S = 1.0  # temps d'import cumulé toléré pour `import main`
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module: str = "main"):
+    """
+    Lance `python -X importtime` et retourne ([(module, self_s, cumulé_s, profondeur)], modules chargés).
+    Les modules chargés viennent de `sys.modules` : importtime liste aussi les imports optionnels qui ont échoué.
+    """
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=RAG_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"`import {module}` a échoué :\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2))
+    return rows, set(result.stdout.split())
+
+
+def check_startup(rows, loaded, budget: float = IMPORT_BUDGET_S, forbidden=FORBIDDEN_AT_STARTUP):
+    """Retourne (temps total, modules interdits chargés, dépassement du budget)."""
+    total = sum(self_s for _, self_s, _, _ in rows)
+    offenders = sorted(m for m in forbidden if m in loaded)
+    return total, offenders, total > budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module importé (depuis RAG/)")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_S, help="Budget en secondes")
+    parser.add_argument("--runs", type=int, default=3, help="Mesures (la plus rapide est retenue)")
+    parser.add_argument("--top", type=int, default=15, help="Modules les plus coûteux à afficher")
+    args = parser.parse_args()
+
+    # Plusieurs mesures : la première paie le cache disque et la compilation des .pyc
+    runs = [measure_imports(args.module) for _ in range(max(args.runs, 1))]
+    rows, loaded = min(runs, key=lambda run: sum(self_s for _, self_s, _, _ in run[0]))
+    total, offenders, over_budget = check_startup(rows, loaded, args.budget)
+
+    print(f"`import {args.module}` : {total:.3f} s (budget {args.budget:.3f} s), {len(rows)} modules")
+    print(f"{'module':<50} {'propre':>9} {'cumulé':>9}")
+    for name, self_s, cumulative_s, _ in sorted(rows, key=lambda r: -r[1])[:args.top]:
+        print(f"{name:<50} {self_s * 1000:7.1f} ms {cumulative_s * 1000:7.1f} ms")
+    top_level = sorted((r for r in rows if r[3] == 0), key=lambda r: -r[2])[:args.top]
+    print("\nImports de premier niveau (cumulé) :")
+    for name, _, cumulative_s, _ in top_level:
+        print(f"  {name:<48} {cumulative_s * 1000:7.1f} ms")
+
+    status = 0
+    if offenders:
+        print(f"\nDépendances lourdes chargées au démarrage : {', '.join(offenders)}")
+        status = 1
+    if over_budget:
+        print(f"\nBudget de démarrage dépassé : {total:.3f} s > {args.budget:.3f} s")
+        status = 1
+    if status == 0:
+        print("\nDémarrage dans le budget.")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
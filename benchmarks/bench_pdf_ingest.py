@@ -0,0 +1,110 @@
+"""
+Comparaison du temps d'extraction et du pic mémoire : trois lectures du PDF (ancienne version :
+PyMuPDFLoader + PyPDF2 pour les abréviations + fitz pour les figures) contre le passage unique
+`utils.extract_pdf`. Chaque variante tourne dans un sous-processus pour mesurer son propre pic RSS.
+
+    python benchmarks/bench_pdf_ingest.py
+    python benchmarks/bench_pdf_ingest.py --pdf RAG/Dataset/20240929-rapport-JOP-2024_0.pdf
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG")
+sys.path.insert(0, RAG_DIR)
+
+DEFAULT_PDF = os.path.join("RAG", "Dataset", "20240929-rapport-JOP-2024_0.pdf")
+
+
+def legacy_extraction(pdf_path, out_dir):
+    """Les trois passages d'origine sur le PDF."""
+    import fitz
+    import PyPDF2
+    from utils import load_pdf
+
+    documents = load_pdf(pdf_path)
+
+    texte = ""
+    with open(pdf_path, "rb") as f:
+        lecteur = PyPDF2.PdfReader(f)
+        for page in lecteur.pages:
+            texte += page.extract_text() + " "
+    texte = re.sub(r"\s+", " ", texte)
+    phrases = re.split(r'(?<=[.!?])\s+', texte)
+    pattern = r"([A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}(?:\s+[A-ZÉÈÊÀÂÎÔÛa-zéèêàâîôûç'’\-]{2,}){0,9})\s*\(([A-Z][A-Z0-9\.]{1,10})\)"
+    abbrs = {}
+    for phrase in phrases:
+        for _, abbr in re.findall(pattern, phrase):
+            abbrs.setdefault(abbr.strip(), phrase.strip())
+
+    doc = fitz.open(pdf_path)
+    saved = 0
+    for i, page in enumerate(doc):
+        if len(page.get_drawings()) < 15:
+            continue
+        if "figure" not in page.get_text("text", sort=True).lower():
+            continue
+        page.get_pixmap(matrix=fitz.Matrix(3, 3)).save(os.path.join(out_dir, f"page_{i + 1}.png"))
+        saved += 1
+    doc.close()
+    return len(documents), len(abbrs), saved
+
+
+def unified_extraction(pdf_path, out_dir):
+    from utils import extract_pdf
+
+    documents, abrev_phrases = extract_pdf(pdf_path, out_dir)
+    saved = len([f for f in os.listdir(out_dir) if f.endswith(".png")])
+    return len(documents), len(abrev_phrases), saved
+
+
+VARIANTS = {"trois passages": legacy_extraction, "passage unique": unified_extraction}
+
+
+def run_variant(name, pdf_path):
+    """Exécuté dans le sous-processus : mesure une variante et écrit le résultat en JSON sur stdout."""
+    import contextlib
+    import io
+
+    with tempfile.TemporaryDirectory() as out_dir, contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        start = time.perf_counter()
+        pages, abbrs, figures = VARIANTS[name](pdf_path, out_dir)
+        elapsed = time.perf_counter() - start
+        _, py_peak = tracemalloc.get_traced_memory()
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"variant": name, "seconds": elapsed, "pages": pages, "abbreviations": abbrs,
+                      "figures": figures, "python_peak_mb": py_peak / 1e6, "max_rss_mb": rss_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps et mémoire de l'extraction PDF")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--variant", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.pdf)
+        return
+
+    print(f"{'variante':<16}{'temps (s)':>11}{'pages':>7}{'abrév.':>8}{'figures':>9}{'pic Python (Mo)':>17}{'RSS max (Mo)':>14}")
+    results = []
+    for name in VARIANTS:
+        out = subprocess.run([sys.executable, __file__, "--pdf", args.pdf, "--variant", name],
+                             capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(r)
+        print(f"{name:<16}{r['seconds']:>11.2f}{r['pages']:>7}{r['abbreviations']:>8}{r['figures']:>9}"
+              f"{r['python_peak_mb']:>17.1f}{r['max_rss_mb']:>14.1f}")
+    print(f"Accélération : x{results[0]['seconds'] / results[1]['seconds']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
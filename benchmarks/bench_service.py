@@ -0,0 +1,126 @@
+"""
+Test de charge du service HTTP (RAG/server.py), hors-ligne : index synthétique, embedder déterministe
+(benchmarks/stubs.py, coût fixe par passage du modèle réglable) et LLM factice à latence réglable.
+`--concurrency` clients envoient `--requests` questions ; pour chaque fenêtre de regroupement
+(`--batch-window-ms`, 0 : pas d'attente), affiche le débit, les latences côté client, les refus (503)
+et la taille moyenne des lots lue sur /metrics.
+
+    python benchmarks/bench_service.py
+    python benchmarks/bench_service.py --requests 2000 --concurrency 128 --batch-window-ms 0 2 5 10
+    python benchmarks/bench_service.py --max-batch-size 1                # référence sans regroupement
+    python benchmarks/bench_service.py --url http://127.0.0.1:8080   # service déjà lancé
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from stubs import StubEmbeddings, fake_llm, synthetic_questions  # noqa: E402
+from bench_suite import build_synthetic_index  # noqa: E402
+from engine import RagEngine  # noqa: E402
+from server import MAX_BATCH_SIZE, MAX_QUEUE_SIZE, RagService  # noqa: E402
+
+
+class SlowStubEmbeddings(StubEmbeddings):
+    """Embedder déterministe avec un coût fixe par passage du modèle, comme un vrai encodeur sur CPU."""
+
+    def __init__(self, call_ms: float = 0.0, item_ms: float = 0.0):
+        super().__init__()
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+
+    def embed_documents(self, texts):
+        time.sleep((self.call_ms + self.item_ms * len(texts)) / 1000)
+        return super().embed_documents(texts)
+
+
+async def load_test(url, questions, concurrency, k, mode):
+    """Envoie les questions avec au plus `concurrency` requêtes simultanées ; retourne latences et statuts."""
+    latencies, statuses = [], Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with ClientSession() as session:
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                async with session.post(f"{url}/ask", json={"question": question, "k": k, "mode": mode}) as r:
+                    await r.read()
+                    statuses[r.status] += 1
+                    if r.status == 200:
+                        latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in questions))
+        elapsed = time.perf_counter() - start
+        async with session.get(f"{url}/metrics") as r:
+            metrics = await r.json()
+    return latencies, statuses, elapsed, metrics
+
+
+async def run_local(args, index_path, window_ms, questions):
+    embeddings = SlowStubEmbeddings(args.embed_call_ms, args.embed_item_ms)
+    engine = RagEngine(cache_path=index_path, embeddings=embeddings, llm=fake_llm(latency=args.llm_latency_ms / 1000))
+    service = RagService(engine, window_ms=window_ms, max_batch_size=args.max_batch_size,
+                         max_concurrency=args.max_concurrency, max_queue_size=args.max_queue)
+    runner = web.AppRunner(service.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        return await load_test(f"http://127.0.0.1:{port}", questions, args.concurrency, args.k, args.mode)
+    finally:
+        await runner.cleanup()
+
+
+def report(label, latencies, statuses, elapsed, metrics):
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    ok = statuses.get(200, 0)
+    print(f"{label:<14} {ok / elapsed:9.1f} req/s  p50 {np.percentile(ms, 50):7.1f} ms  "
+          f"p95 {np.percentile(ms, 95):7.1f} ms  p99 {np.percentile(ms, 99):7.1f} ms  "
+          f"503 : {statuses.get(503, 0):<5} lots moyens : {metrics.get('mean_batch_size', 0):5.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Service déjà lancé (sinon, service local avec LLM factice)")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-window-ms", type=float, nargs="+", default=[0.0, 5.0])
+    parser.add_argument("--corpus", type=int, default=20_000, help="Taille de l'index synthétique")
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--mode", default="dense")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--embed-call-ms", type=float, default=15.0, help="Coût fixe d'un passage du modèle")
+    parser.add_argument("--embed-item-ms", type=float, default=1.0, help="Coût par question encodée")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="Appels LLM simultanés du service")
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE_SIZE)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="1 : une recherche par question (référence sans regroupement)")
+    args = parser.parse_args()
+
+    questions = synthetic_questions(args.requests)
+    if args.url:
+        report(args.url, *asyncio.run(load_test(args.url, questions, args.concurrency, args.k, args.mode)))
+        return
+
+    print(f"{args.requests} requêtes, {args.concurrency} clients, index de {args.corpus} chunks, "
+          f"LLM factice {args.llm_latency_ms:.0f} ms")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "faiss_index")
+        build_synthetic_index(index_path, args.corpus, StubEmbeddings())
+        for window_ms in args.batch_window_ms:
+            result = asyncio.run(run_local(args, index_path, window_ms, questions))
+            report(f"fenêtre {window_ms:g} ms", *result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Latence de la recherche dense répartie sur les shards (shards.ShardSet) : un même corpus synthétique
+découpé en 1, 2, 4... shards, cherché avec 1 thread puis avec tous les cœurs. Avec la recherche exacte,
+le coût d'un shard est proportionnel à sa taille : la recherche parallèle doit diviser la latence
+par le nombre de cœurs.
+
+    python benchmarks/bench_shards.py
+    python benchmarks/bench_shards.py --vectors 400000 --shards 1 4 8 16 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from stubs import StubEmbeddings  # noqa: E402
+from index_factory import vectorstore_from_vectors  # noqa: E402
+from index_store import save_vectorstore  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from manifest import IndexManifest  # noqa: E402
+from shards import SEARCH_THREADS, ShardRegistry, ShardSet  # noqa: E402
+
+
+def build_sharded_index(root, vectors, n_shards, embeddings, spec="flat"):
+    """Répartit `vectors` en `n_shards` shards d'un document chacun et écrit le registre."""
+    registry = ShardRegistry(root)
+    for s, part in enumerate(np.array_split(vectors, n_shards)):
+        key = f"rapport-{s}.pdf"
+        name = registry.new_shard_name(key)
+        path = registry.shard_path(name)
+        ids = [f"{s}:{i}" for i in range(len(part))]
+        docs = [Document(page_content=f"chunk {i}", metadata={"document": key}) for i in range(len(part))]
+        save_vectorstore(vectorstore_from_vectors(docs, part, embeddings, ids=ids, spec=spec), path)
+        manifest = IndexManifest(path)
+        manifest.record(key, key, f"synthetique-{s}", ids)
+        manifest.save()
+        registry.record(name, manifest)
+    registry.save()
+
+
+def latency_ms(index, queries, k):
+    with index.view() as view:
+        selected = view.select()
+        index.search_dense(queries[:1], k, selected)  # échauffement (pages mappées, pool de threads)
+        samples = []
+        for q in queries:
+            start = time.perf_counter()
+            index.search_dense(q[None, :], k, selected)
+            samples.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(samples, 50)), float(np.percentile(samples, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200_000, help="Taille totale du corpus")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--spec", default="flat", help="Type d'index de chaque shard (voir index_factory)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.vectors, args.dim)).astype(np.float32)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    embeddings = StubEmbeddings(dim=args.dim)
+
+    print(f"{args.vectors} vecteurs de dimension {args.dim}, k={args.k}, {SEARCH_THREADS} cœurs")
+    print(f"{'shards':>6} {'1 thread p50':>14} {'parallèle p50':>14} {'p95':>9} {'accélération':>13}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_shards in args.shards:
+            root = os.path.join(tmp_dir, f"index_{n_shards}")
+            build_sharded_index(root, vectors, n_shards, embeddings, args.spec)
+            serial = ShardSet(root, embeddings, threads=1)
+            parallel = ShardSet(root, embeddings)
+            serial.refresh()
+            parallel.refresh()
+            serial_p50, _ = latency_ms(serial, queries, args.k)
+            parallel_p50, parallel_p95 = latency_ms(parallel, queries, args.k)
+            print(f"{n_shards:>6} {serial_p50:11.2f} ms {parallel_p50:11.2f} ms {parallel_p95:6.2f} ms "
+                  f"{serial_p50 / parallel_p50:12.1f}x")
+            serial.close()
+            parallel.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Suite de benchmarks hors-ligne : débit d'ingestion, enrichissement, construction d'index et
+latence des questions (à froid / à chaud) selon k et la taille de l'index.
+
+Tout tourne sans réseau : embedder déterministe (benchmarks/stubs.py, `--embedder local` pour le
+vrai modèle s'il est en cache) et LLM factice. Les résultats sont écrits en JSON puis comparés à une
+référence (`benchmarks/baseline.json`) : une métrique dégradée de plus de `--tolerance` fait échouer
+la commande (code de sortie 1).
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 1000 10000 50000 --ks 5 20 --queries 100
+    python benchmarks/bench_suite.py --update-baseline   # après une amélioration voulue
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from stubs import StubEmbeddings, fake_llm, synthetic_corpus, synthetic_questions  # noqa: E402
+from bm25 import BM25Index  # noqa: E402
+from engine import RagEngine  # noqa: E402
+from index_factory import vectorstore_from_vectors  # noqa: E402
+from index_store import save_vectorstore  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from utils import enrich_chunk_stream, extract_pdf, split_docs  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF = os.path.join("RAG", "Dataset", "20240929-rapport-JOP-2024_0.pdf")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_TOLERANCE = 0.25  # dégradation relative tolérée avant de signaler une régression
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - start
+
+
+# -------------------------------
+# Ingestion
+# -------------------------------
+def bench_ingestion(pdf_path, embeddings, index_specs, workers, tmp_dir):
+    """Extraction (pages/s), découpage et enrichissement (chunks/s), encodage et construction des index."""
+    metrics = {}
+    (pages, abrev_phrases), seconds = timed(extract_pdf, pdf_path, os.path.join(tmp_dir, "figures"), workers=workers)
+    metrics["ingest.extract_pages_per_s"] = len(pages) / seconds
+
+    chunks, seconds = timed(split_docs, pages)
+    metrics["ingest.split_chunks_per_s"] = len(chunks) / seconds
+
+    # Définitions factices : seul le coût de l'enrichissement est mesuré, pas celui du LLM
+    abbr_dict = {abbr: f"définition de {abbr}" for abbr, _ in abrev_phrases}
+    enriched, seconds = timed(lambda: list(enrich_chunk_stream(chunks, abbr_dict)))
+    metrics["enrich.chunks_per_s"] = len(enriched) / seconds
+
+    vectors, seconds = timed(embeddings.embed_documents, [c.page_content for c in enriched])
+    metrics["embed.chunks_per_s"] = len(enriched) / seconds
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    for spec in index_specs:
+        _, seconds = timed(vectorstore_from_vectors, enriched, vectors, embeddings, spec=spec)
+        metrics[f"index.{spec}.build_s"] = seconds
+    logging.info(f"Ingestion : {len(pages)} pages, {len(enriched)} chunks, {len(abbr_dict)} abréviations")
+    return metrics
+
+
+# -------------------------------
+# Questions
+# -------------------------------
+def _percentiles(prefix, samples):
+    samples_ms = np.asarray(samples) * 1000
+    return {f"{prefix}_p50_ms": float(np.percentile(samples_ms, 50)),
+            f"{prefix}_p95_ms": float(np.percentile(samples_ms, 95)),
+            f"{prefix}_p99_ms": float(np.percentile(samples_ms, 99))}
+
+
+def build_synthetic_index(path, n, embeddings, spec="flat"):
+    texts = synthetic_corpus(n)
+    docs = [Document(page_content=t, metadata={"document": "synthetique.pdf", "page": i // 5})
+            for i, t in enumerate(texts)]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    db = vectorstore_from_vectors(docs, vectors, embeddings, spec=spec)
+    save_vectorstore(db, path)
+    BM25Index.from_vectorstore(db).save(path)
+
+
+def bench_queries(sizes, ks, embeddings, llm, mode, n_queries, cold_runs, tmp_dir, spec="flat"):
+    """
+    Latence de bout en bout de `RagEngine.ask` (LLM factice) :
+      - à froid : nouveau moteur à chaque question (chargement de l'index FAISS et BM25 compris),
+      - à chaud : questions successives sur le même moteur.
+    """
+    metrics = {}
+    questions = synthetic_questions(max(n_queries, cold_runs))
+    for n in sizes:
+        path = os.path.join(tmp_dir, f"index_{n}")
+        _, seconds = timed(build_synthetic_index, path, n, embeddings, spec)
+        metrics[f"query.n{n}.index_build_s"] = seconds
+        for k in ks:
+            cold = []
+            for q in questions[:cold_runs]:
+                engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+                cold.append(timed(engine.ask, q, k=k, mode=mode)[1])
+            engine = RagEngine(cache_path=path, embeddings=embeddings, llm=llm)
+            engine.get_index()
+            warm = [timed(engine.ask, q, k=k, mode=mode)[1] for q in questions[:n_queries]]
+            metrics.update(_percentiles(f"query.n{n}.k{k}.cold", cold))
+            metrics.update(_percentiles(f"query.n{n}.k{k}.warm", warm))
+            logging.info(f"n={n} k={k} : à froid p50 {np.median(cold) * 1000:.1f} ms, "
+                         f"à chaud p50 {np.median(warm) * 1000:.1f} ms")
+    return metrics
+
+
+# -------------------------------
+# Comparaison à la référence
+# -------------------------------
+def higher_is_better(name: str) -> bool:
+    return name.endswith("_per_s")
+
+
+def compare(metrics, baseline_metrics, tolerance=DEFAULT_TOLERANCE):
+    """Retourne (lignes du tableau de comparaison, noms des métriques en régression)."""
+    lines, regressions = [], []
+    for name in sorted(metrics):
+        value = metrics[name]
+        base = baseline_metrics.get(name)
+        if not base:
+            lines.append(f"{name:<40} {value:12.3f}   (nouvelle métrique)")
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better(name) else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  RÉGRESSION"
+            regressions.append(name)
+        lines.append(f"{name:<40} {value:12.3f}   réf {base:12.3f}   {change:+7.1%}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--embedder", choices=["stub", "local"], default="stub",
+                        help="stub : embedder déterministe ; local : modèle HuggingFace (doit être en cache)")
+    parser.add_argument("--index-specs", nargs="+", default=["flat", "hnsw"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000],
+                        help="Tailles du corpus synthétique pour la latence des questions")
+    parser.add_argument("--ks", nargs="+", type=int, default=[5, 20])
+    parser.add_argument("--mode", default="hybrid", choices=["dense", "sparse", "hybrid"])
+    parser.add_argument("--queries", type=int, default=50, help="Questions à chaud par configuration")
+    parser.add_argument("--cold-runs", type=int, default=5, help="Questions à froid par configuration")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--skip-ingestion", action="store_true")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="Remplacer la référence par ces résultats")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in ("context", "engine", "figures", "utils", "abbreviation"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    if args.embedder == "local":
+        from utils import create_embeddings
+        embeddings = create_embeddings()
+    else:
+        embeddings = StubEmbeddings()
+    llm = fake_llm()
+
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if not args.skip_ingestion:
+            metrics.update(bench_ingestion(args.pdf, embeddings, args.index_specs, args.workers, tmp_dir))
+        metrics.update(bench_queries(args.sizes, args.ks, embeddings, llm, args.mode, args.queries,
+                                     args.cold_runs, tmp_dir))
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "embedder": args.embedder, "mode": args.mode},
+        "metrics": {name: round(value, 4) for name, value in metrics.items()},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Référence mise à jour : {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("Pas de référence : relancer avec --update-baseline pour l'enregistrer.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment", {}).get("embedder") != args.embedder:
+        print("Attention : la référence a été mesurée avec un autre embedder.")
+    lines, regressions = compare(results["metrics"], baseline.get("metrics", {}), args.tolerance)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de {args.tolerance:.0%} : {', '.join(regressions)}")
+        return 1
+    print(f"\nAucune régression au-delà de {args.tolerance:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Rapport rappel / latence des types d'index FAISS sur le corpus courant.
+
+Pour chaque configuration (type d'index × nprobe / efSearch), mesure :
+  - le rappel@k par rapport à l'index exact (Flat),
+  - la latence p50 / p99 d'une requête isolée,
+  - le temps de construction (entraînement compris) et la taille sérialisée de l'index.
+
+Exemples (depuis la racine du projet) :
+    python benchmarks/index_report.py                       # vecteurs de RAG/cache/faiss_index
+    python benchmarks/index_report.py --synthetic 50000     # corpus synthétique (sans index local)
+    python benchmarks/index_report.py --questions-csv RAG/Test/test_rag.csv --output index_report.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from index_factory import build_faiss_index, describe_index, resolve_index_spec, set_search_params  # noqa: E402
+from shards import ShardRegistry  # noqa: E402
+from utils import FAISS_CACHE_PATH  # noqa: E402
+
+
+def load_corpus_vectors(index_path):
+    """Relit tous les vecteurs d'un index FAISS sauvegardé (index exact ou IVF), tous shards confondus."""
+    registry = ShardRegistry(index_path)
+    parts = []
+    for name in registry.shards:
+        index = faiss.read_index(os.path.join(registry.shard_path(name), "index.faiss"))
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.make_direct_map()
+        parts.append(index.reconstruct_n(0, index.ntotal))
+    return np.concatenate(parts)
+
+
+def synthetic_vectors(n, dim=768, n_clusters=64, seed=0):
+    """Corpus synthétique groupé en clusters (plus réaliste qu'un bruit uniforme pour IVF/PQ)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    return centers[labels] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def sample_queries(vectors, n_queries, seed=1):
+    """Requêtes proches du corpus : vecteurs tirés au hasard + léger bruit."""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    scale = 0.05 * float(np.std(vectors))
+    return (picked + scale * rng.normal(size=picked.shape)).astype(np.float32)
+
+
+def embed_questions(csv_path):
+    import pandas as pd
+    from embedding_backends import embed_queries
+    from utils import create_embeddings
+
+    questions = pd.read_csv(csv_path, sep=";", encoding="latin-1")["question"].dropna().tolist()
+    return np.asarray(embed_queries(create_embeddings(), questions), dtype=np.float32)
+
+
+def latency_percentiles(index, queries, k):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q[None, :], k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(timings, 50)), float(np.percentile(timings, 99))
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(vectors, queries, specs, k, nprobes, ef_searches):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for spec in specs:
+        start = time.perf_counter()
+        index = build_faiss_index(vectors, spec)
+        build_s = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+        factory = resolve_index_spec(spec, *vectors.shape)
+        if "IVF" in factory:
+            settings = [{"nprobe": p} for p in nprobes]
+        elif "HNSW" in factory:
+            settings = [{"ef_search": e} for e in ef_searches]
+        else:
+            settings = [{}]
+        for params in settings:
+            set_search_params(index, **params)
+            _, found = index.search(queries, k)
+            p50, p99 = latency_percentiles(index, queries, k)
+            rows.append({
+                "spec": spec,
+                "factory": factory,
+                "params": params,
+                "recall_at_k": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(p50, 3),
+                "p99_ms": round(p99, 3),
+                "build_s": round(build_s, 3),
+                "size_mb": round(size_mb, 2),
+            })
+        print(f"  {describe_index(index)} construit en {build_s:.2f} s")
+    return rows
+
+
+def print_table(rows, k):
+    header = f"{'index':<28}{'params':<18}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'Mo':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        params = ",".join(f"{key}={v}" for key, v in r["params"].items()) or "-"
+        print(f"{r['factory']:<28}{params:<18}{r['recall_at_k']:>10.3f}{r['p50_ms']:>10.3f}"
+              f"{r['p99_ms']:>10.3f}{r['build_s']:>10.2f}{r['size_mb']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rappel@k et latence des types d'index FAISS")
+    parser.add_argument("--index-path", default=FAISS_CACHE_PATH, help="Index FAISS dont on relit les vecteurs")
+    parser.add_argument("--synthetic", type=int, default=None, help="Utiliser N vecteurs synthétiques à la place")
+    parser.add_argument("--questions-csv", default=None,
+                        help="Encoder les questions de ce CSV (modèle réel) au lieu de requêtes échantillonnées")
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de requêtes échantillonnées")
+    parser.add_argument("--specs", nargs="+", default=["flat", "ivf", "hnsw", "ivfpq", "opq"])
+    parser.add_argument("-k", type=int, default=20)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--output", default=None, help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic)
+    else:
+        vectors = load_corpus_vectors(args.index_path)
+    queries = embed_questions(args.questions_csv) if args.questions_csv else sample_queries(vectors, args.queries)
+    print(f"Corpus : {len(vectors)} vecteurs de dimension {vectors.shape[1]}, {len(queries)} requêtes, k={args.k}")
+
+    rows = run(vectors, queries, args.specs, args.k, args.nprobe, args.ef_search)
+    print_table(rows, args.k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"n_vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "results": rows}, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
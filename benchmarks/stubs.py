@@ -0,0 +1,71 @@
+"""
+Doublures hors-ligne partagées par les benchmarks : embedder déterministe, LLM factice
+et corpus synthétique. Aucune dépendance au réseau, au modèle HuggingFace ni à Gemini.
+"""
+import os
+import random
+import re
+import sys
+import zlib
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RAG"))
+
+from llm_client import FakeBackend, LLMClient  # noqa: E402
+
+STUB_DIM = 384  # dimension des vecteurs du stub (celle d'un petit modèle e5)
+_WORD = re.compile(r"\w+")
+_VOCABULARY = (
+    "émissions carbone climat énergie transport bâtiment agriculture industrie budget neutralité "
+    "objectif stratégie adaptation biodiversité forêt sols eau chaleur électricité hydrogène "
+    "gaz pétrole charbon renouvelable éolien solaire nucléaire rénovation mobilité vélo train "
+    "voiture camion avion port jeux olympiques paralympiques site village athlètes spectateurs "
+    "sécurité financement héritage accessibilité tourisme région ville métropole conseil haut "
+    "rapport annuel mesure politique loi plan national européen tonnes pourcentage baisse hausse"
+).split()
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Embedder déterministe : sac de mots haché (signe et position dérivés du CRC32 de chaque mot),
+    normalisé L2. Deux textes qui partagent des mots sont proches, comme avec un vrai modèle,
+    pour un coût négligeable et sans téléchargement.
+    """
+
+    def __init__(self, dim: int = STUB_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def fake_llm(latency: float = 0.0, token_latency: float = 0.0) -> LLMClient:
+    """Client LLM sans quota sur un backend factice qui renvoie un résumé fixe de la longueur du prompt."""
+    backend = FakeBackend(lambda prompt: f"Réponse factice ({len(str(prompt))} caractères de prompt).",
+                          latency=latency, token_latency=token_latency)
+    return LLMClient(backend, requests_per_minute=None, tokens_per_minute=None)
+
+
+def synthetic_corpus(n: int, words_per_text: int = 60, seed: int = 0) -> List[str]:
+    """`n` textes pseudo-aléatoires tirés d'un vocabulaire du domaine (reproductibles pour une graine)."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(_VOCABULARY, k=words_per_text)) + f" réf {i}." for i in range(n)]
+
+
+def synthetic_questions(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(_VOCABULARY, k=8)) + " ?" for _ in range(n)]